@@ -33,6 +33,65 @@ CATEGORY_STREAMING = "streaming"
 CATEGORY_TRANSIT = "transit"
 CATEGORY_GENERAL = "general"
 
+# Merchant Category Codes (ISO 18245) -> categories, as sent by card networks
+MCC_CATEGORIES = {
+    # Grocery
+    "5411": ["grocery"],
+    "5422": ["grocery"],
+    "5451": ["grocery"],
+    "5499": ["grocery", "convenience"],
+    "5300": ["grocery", "wholesale"],
+    # Dining
+    "5462": ["dining", "bakery"],
+    "5812": ["dining", "restaurant"],
+    "5813": ["dining", "bar"],
+    "5814": ["dining", "fast-food"],
+    # Gas
+    "5541": ["gas"],
+    "5542": ["gas"],
+    "5983": ["gas"],
+    # Drugstores
+    "5912": ["drugstore", "pharmacy"],
+    # Transit
+    "4111": ["transit"],
+    "4112": ["transit", "travel"],
+    "4121": ["transit", "rideshare"],
+    "4131": ["transit"],
+    "4784": ["transit", "tolls"],
+    "7523": ["transit", "parking"],
+    # Travel
+    "4411": ["travel", "cruise"],
+    "4511": ["travel", "airline", "airfare"],
+    "4722": ["travel"],
+    "7011": ["travel", "hotel"],
+    "7512": ["travel", "car_rental"],
+    # Streaming and entertainment
+    "4899": ["streaming", "entertainment"],
+    "5815": ["streaming", "entertainment"],
+    "7832": ["entertainment"],
+    "7922": ["entertainment"],
+    "7941": ["entertainment"],
+    "7996": ["entertainment"],
+    # Shopping
+    "5310": ["retail", "shopping"],
+    "5311": ["retail", "shopping"],
+    "5399": ["retail", "shopping"],
+    "5732": ["retail", "shopping"],
+    "5942": ["retail", "shopping"],
+    "5964": ["shopping", "online"],
+    "5969": ["shopping", "online"],
+    # Business
+    "4215": ["shipping"],
+    "7311": ["advertising"],
+}
+
+# Ranges of brand-specific codes: (first, last, categories)
+MCC_CATEGORY_RANGES = [
+    (3000, 3350, ["travel", "airline", "airfare"]),
+    (3351, 3500, ["travel", "car_rental"]),
+    (3501, 3999, ["travel", "hotel"]),
+]
+
 # HTTP Status Codes
 HTTP_200_OK = 200
 HTTP_201_CREATED = 201
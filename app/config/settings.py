@@ -14,6 +14,20 @@ class Settings(BaseSettings):
     
     # Database
     DATABASE_URL: str = "sqlite:///./credit_cards.db"
+    ASYNC_DATABASE_URL: str = ""  # Derived from DATABASE_URL when empty
+    ASYNC_POOL_SIZE: int = 20
+    ASYNC_MAX_OVERFLOW: int = 40
+    DATABASE_REPLICA_URL: str = ""  # Read replica for read-only routes; empty uses the primary
+    ASYNC_DATABASE_REPLICA_URL: str = ""  # Derived from DATABASE_REPLICA_URL when empty
+    
+    # SQLite tuning profile (connect-time pragmas, ignored for PostgreSQL)
+    SQLITE_TUNING_ENABLED: bool = True
+    SQLITE_JOURNAL_MODE: str = "WAL"
+    SQLITE_SYNCHRONOUS: str = "NORMAL"
+    SQLITE_MMAP_SIZE: int = 268435456  # 256 MiB of the file memory-mapped
+    SQLITE_CACHE_SIZE: int = -65536  # Negative = KiB, so 64 MiB page cache per connection
+    SQLITE_TEMP_STORE: str = "MEMORY"
+    SQLITE_BUSY_TIMEOUT_MS: int = 5000
     
     # CORS
     CORS_ORIGINS: List[str] = ["*"]
@@ -28,6 +42,20 @@ class Settings(BaseSettings):
     DEFAULT_TOP_N: int = 3
     DEFAULT_REFERENCE_AMOUNT: float = 100.0
     
+    # Wallet Cache (compiled customer wallets, per worker process)
+    WALLET_CACHE_MAX_ENTRIES: int = 10000
+    WALLET_CACHE_TTL_SECONDS: float = 300.0
+    TEMPLATE_CACHE_MAX_ENTRIES: int = 2000
+    TEMPLATE_CACHE_TTL_SECONDS: float = 300.0
+    REPLICA_CACHE_TTL_SECONDS: float = 5.0  # Cap for entries loaded from the read replica (acceptable lag)
+    
+    # Merchant Matching
+    DESCRIPTOR_CACHE_MAX_ENTRIES: int = 50000
+    MATCH_CACHE_MAX_ENTRIES: int = 20000
+    MERCHANT_INDEX_SNAPSHOT_PATH: str = ""  # Empty disables the on-disk index snapshot
+    MERCHANT_IMPORT_BATCH_SIZE: int = 1000  # Rows per multi-row upsert statement
+    MERCHANT_CATALOG_CHECK_SECONDS: float = 2.0  # How often workers check the stored catalog version
+    
     # Foursquare Places API
     FOURSQUARE_API_KEY: str = ""
     FOURSQUARE_DEFAULT_RADIUS: int = 5000  # meters
@@ -2,11 +2,13 @@
 
 from app.core.exceptions import *
 from app.core.logging import setup_logging
+from app.core.cache import LRUCache
 
 __all__ = [
     'CardNotFoundException',
     'CustomerNotFoundException',
     'ValidationError',
     'setup_logging',
+    'LRUCache',
 ]
 
@@ -1,6 +1,10 @@
 """Database configuration and session management."""
 
-from sqlalchemy import create_engine
+from typing import Dict, List
+from fastapi import Request
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from app.config.settings import settings
@@ -8,6 +12,46 @@ from app.config.settings import settings
 # Use settings from config (supports both SQLite and PostgreSQL)
 SQLALCHEMY_DATABASE_URL = settings.DATABASE_URL
 
+
+def sqlite_pragmas(read_only: bool = False) -> List[str]:
+    """
+    PRAGMA statements of the SQLite tuning profile (see SQLITE_* settings).
+    
+    WAL lets readers run alongside a writer, synchronous=NORMAL is durable
+    across application crashes in WAL mode, and mmap_size / cache_size /
+    temp_store keep hot pages and temp b-trees in memory. busy_timeout makes
+    a second writer wait for the lock instead of failing at once. Read-only
+    connections add query_only, so a stray write fails instead of taking
+    the write lock.
+    """
+    pragmas = [f"PRAGMA busy_timeout = {settings.SQLITE_BUSY_TIMEOUT_MS}"]
+    if settings.SQLITE_TUNING_ENABLED:
+        pragmas += [
+            f"PRAGMA journal_mode = {settings.SQLITE_JOURNAL_MODE}",
+            f"PRAGMA synchronous = {settings.SQLITE_SYNCHRONOUS}",
+            f"PRAGMA mmap_size = {settings.SQLITE_MMAP_SIZE}",
+            f"PRAGMA cache_size = {settings.SQLITE_CACHE_SIZE}",
+            f"PRAGMA temp_store = {settings.SQLITE_TEMP_STORE}",
+        ]
+    if read_only:
+        pragmas.append("PRAGMA query_only = ON")
+    return pragmas
+
+
+def configure_sqlite_engine(sqlite_engine: Engine, read_only: bool = False):
+    """Apply the SQLite tuning profile to every new connection of sqlite_engine."""
+    pragmas = sqlite_pragmas(read_only)
+    
+    @event.listens_for(sqlite_engine, "connect")
+    def _apply_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for pragma in pragmas:
+                cursor.execute(pragma)
+        finally:
+            cursor.close()
+
+
 # Configure engine based on database type
 if SQLALCHEMY_DATABASE_URL.startswith("sqlite"):
     # SQLite-specific configuration
@@ -15,6 +59,7 @@ if SQLALCHEMY_DATABASE_URL.startswith("sqlite"):
         SQLALCHEMY_DATABASE_URL, 
         connect_args={"check_same_thread": False}  # SQLite specific
     )
+    configure_sqlite_engine(engine)
     print("🗄️  Using SQLite database")
 else:
     # PostgreSQL/MySQL configuration with connection pooling
@@ -30,6 +75,109 @@ else:
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Read-only routes use the replica when DATABASE_REPLICA_URL is set. Without
+# one, a SQLite primary still gets a query_only engine of its own (a second
+# pool costs nothing there), while other databases share the primary pool
+READ_DATABASE_URL = settings.DATABASE_REPLICA_URL or SQLALCHEMY_DATABASE_URL
+if not settings.DATABASE_REPLICA_URL and not READ_DATABASE_URL.startswith("sqlite"):
+    read_engine = engine
+elif READ_DATABASE_URL.startswith("sqlite"):
+    read_engine = create_engine(
+        READ_DATABASE_URL,
+        connect_args={"check_same_thread": False}
+    )
+    configure_sqlite_engine(read_engine, read_only=True)
+else:
+    read_engine = create_engine(
+        READ_DATABASE_URL,
+        pool_pre_ping=True,
+        pool_size=10,
+        max_overflow=20,
+        pool_recycle=3600,
+        connect_args=(
+            {"options": "-c default_transaction_read_only=on"}
+            if READ_DATABASE_URL.startswith("postgres") else {}
+        )
+    )
+    print("🗄️  Routing read-only endpoints to the read replica")
+
+ReadSessionLocal = (
+    sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+    if read_engine is not engine else SessionLocal
+)
+
+# Clients send this header (e.g. right after changing a wallet) to have a
+# read-only route served by the primary instead of a lagging replica
+READ_YOUR_WRITES_HEADER = "X-Read-Your-Writes"
+# Session.info flag set on primary sessions handed to read-only routes
+READ_YOUR_WRITES = "read_your_writes"
+# Session.info flag set on sessions connected to the read replica
+READ_FROM_REPLICA = "read_from_replica"
+
+
+def to_async_url(url: str) -> str:
+    """Map a sync database URL to its async driver (aiosqlite / asyncpg)."""
+    if url.startswith("sqlite:"):
+        return "sqlite+aiosqlite:" + url[len("sqlite:"):]
+    for prefix in ("postgresql+psycopg2://", "postgresql://", "postgres://"):
+        if url.startswith(prefix):
+            return "postgresql+asyncpg://" + url[len(prefix):]
+    return url
+
+
+# Async engines for the async routes. Created on first use, so scripts and the
+# sync routes never need the async drivers. Read-only routes get their own
+# engine whose connections refuse writes when a replica is configured or the
+# database is SQLite; otherwise they share the primary async engine.
+ASYNC_DATABASE_URL = settings.ASYNC_DATABASE_URL or to_async_url(SQLALCHEMY_DATABASE_URL)
+ASYNC_READ_DATABASE_URL = (
+    settings.ASYNC_DATABASE_REPLICA_URL
+    or (to_async_url(settings.DATABASE_REPLICA_URL) if settings.DATABASE_REPLICA_URL else ASYNC_DATABASE_URL)
+)
+_async_engines: Dict[bool, AsyncEngine] = {}
+_async_session_factories: Dict[bool, async_sessionmaker] = {}
+
+
+def _uses_replica(read_only: bool) -> bool:
+    """Whether read_only sessions connect to a replica."""
+    return read_only and ASYNC_READ_DATABASE_URL != ASYNC_DATABASE_URL
+
+
+def _uses_read_engine(read_only: bool) -> bool:
+    """Whether read_only sessions need an engine of their own (a replica, or SQLite's query_only mode)."""
+    return read_only and (_uses_replica(read_only) or ASYNC_READ_DATABASE_URL.startswith("sqlite"))
+
+
+def get_async_engine(read_only: bool = False) -> AsyncEngine:
+    """Return the shared async engine (or read-only engine), creating it on first use."""
+    read_only = _uses_read_engine(read_only)
+    if read_only not in _async_engines:
+        url = ASYNC_READ_DATABASE_URL if read_only else ASYNC_DATABASE_URL
+        if url.startswith("sqlite"):
+            async_engine = create_async_engine(url)
+            configure_sqlite_engine(async_engine.sync_engine, read_only=read_only)
+        else:
+            server_settings = {"default_transaction_read_only": "on"} if read_only else {}
+            async_engine = create_async_engine(
+                url,
+                pool_pre_ping=True,
+                pool_size=settings.ASYNC_POOL_SIZE,
+                max_overflow=settings.ASYNC_MAX_OVERFLOW,
+                pool_recycle=3600,
+                connect_args={"server_settings": server_settings}
+            )
+        _async_session_factories[read_only] = async_sessionmaker(
+            async_engine, autoflush=False, expire_on_commit=False
+        )
+        _async_engines[read_only] = async_engine
+    return _async_engines[read_only]
+
+
+def AsyncSessionLocal(read_only: bool = False) -> AsyncSession:
+    """Open a new async session (async counterpart of SessionLocal())."""
+    get_async_engine(read_only)
+    return _async_session_factories[_uses_read_engine(read_only)]()
+
 Base = declarative_base()
 
 
@@ -42,10 +190,54 @@ def get_db():
         db.close()
 
 
+async def get_async_db():
+    """Dependency for async FastAPI routes to get an async database session."""
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+def reads_own_writes(request: Request) -> bool:
+    """Check whether the request asked to read from the primary."""
+    return request.headers.get(READ_YOUR_WRITES_HEADER, "").lower() in ("1", "true", "yes")
+
+
+def get_read_db(request: Request):
+    """
+    Dependency for read-only routes to get a replica session (primary if none is configured).
+    
+    Requests carrying the X-Read-Your-Writes header get a primary session
+    instead, flagged in session.info so caches are bypassed as well.
+    """
+    if reads_own_writes(request):
+        db = SessionLocal()
+        db.info[READ_YOUR_WRITES] = True
+    else:
+        db = ReadSessionLocal()
+        if settings.DATABASE_REPLICA_URL:
+            db.info[READ_FROM_REPLICA] = True
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+async def get_async_read_db(request: Request):
+    """Async counterpart of get_read_db for async read-only routes."""
+    read_only = not reads_own_writes(request)
+    async with AsyncSessionLocal(read_only=read_only) as db:
+        if not read_only:
+            db.info[READ_YOUR_WRITES] = True
+        elif _uses_replica(read_only):
+            db.info[READ_FROM_REPLICA] = True
+        yield db
+
+
 def init_db():
-    """Initialize database tables."""
-    from app.models import Customer, CreditCard, CategoryBonus, Offer, MerchantCategory
+    """Initialize database tables and apply pending schema migrations."""
+    from app.models import Customer, CreditCard, CategoryBonus, Offer, MerchantCategory, CatalogVersion
+    from app.migrations import apply_migrations
     Base.metadata.create_all(bind=engine)
+    apply_migrations(engine)
     print("✅ Database tables initialized")
 
 
@@ -35,6 +35,7 @@ def startup_event():
     """Initialize database on startup and auto-seed if empty."""
     from app.database import SessionLocal, get_db
     from app.models import CreditCard
+    from app.services.merchant_index import get_merchant_index
     from scripts.seed.seed_data_comprehensive import seed_comprehensive_data
     
     # Initialize database tables
@@ -52,7 +53,16 @@ def startup_event():
         else:
             print(f"✅ Database already has {template_count} template cards")
     except Exception as e:
+        db.rollback()
         print(f"⚠️  Auto-seed failed: {e}")
+    
+    # Warm the merchant index (from the snapshot if one matches) before serving,
+    # so the first request does not pay for it
+    try:
+        index = get_merchant_index(db)
+        print(f"✅ Merchant index ready with {len(index)} lookup keys")
+    except Exception as e:
+        print(f"⚠️  Merchant index warm-up failed: {e}")
     finally:
         db.close()
 
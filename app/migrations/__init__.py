@@ -0,0 +1,17 @@
+"""Versioned schema migrations."""
+
+from app.migrations.operations import Migration, create_index
+from app.migrations.runner import (
+    apply_migrations, applied_versions, check_indexes, pending_migrations
+)
+from app.migrations.versions import MIGRATIONS
+
+__all__ = [
+    'Migration',
+    'MIGRATIONS',
+    'create_index',
+    'apply_migrations',
+    'applied_versions',
+    'check_indexes',
+    'pending_migrations',
+]
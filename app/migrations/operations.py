@@ -0,0 +1,60 @@
+"""Migration definitions and the operations they are built from."""
+
+from dataclasses import dataclass, field
+from typing import Callable, List
+
+from sqlalchemy import inspect
+from sqlalchemy.engine import Connection
+
+# An operation receives a connection and the dialect name
+Operation = Callable[[Connection, str], None]
+
+
+@dataclass(frozen=True)
+class Migration:
+    """One numbered schema change."""
+    version: int
+    name: str
+    description: str
+    operations: List[Operation] = field(default_factory=list)
+    # Run the operations in one transaction. Index builds still run in
+    # autocommit after it commits, since Postgres CREATE INDEX CONCURRENTLY
+    # cannot run inside a transaction.
+    transactional: bool = False
+
+
+def create_index(name: str, table: str, columns: List[str]) -> Operation:
+    """
+    Create an index if it does not exist yet.
+
+    On Postgres the index is built CONCURRENTLY, so reads and writes to
+    the table continue while it builds. SQLite has no equivalent; its
+    CREATE INDEX takes a write lock for the duration of the build.
+    """
+    column_list = ", ".join(columns)
+
+    def operation(connection: Connection, dialect: str):
+        concurrently = "CONCURRENTLY " if dialect == "postgresql" else ""
+        connection.exec_driver_sql(
+            f"CREATE INDEX {concurrently}IF NOT EXISTS {name} ON {table} ({column_list})"
+        )
+
+    operation.index_name = name
+    operation.autocommit = True
+    return operation
+
+
+def add_column(table: str, column: str, definition: str) -> Operation:
+    """
+    Add a nullable column if the table does not have it yet.
+
+    Checked through the inspector because SQLite has no ADD COLUMN IF NOT
+    EXISTS. Adding a nullable column without a default is a metadata-only
+    change on both SQLite and Postgres, so existing rows are not rewritten.
+    """
+    def operation(connection: Connection, dialect: str):
+        existing = {c["name"] for c in inspect(connection).get_columns(table)}
+        if column not in existing:
+            connection.exec_driver_sql(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+    return operation
@@ -0,0 +1,141 @@
+"""Apply versioned migrations and verify the indexes the models declare."""
+
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Dict, Iterator, List, Optional, Set
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, inspect, select
+from sqlalchemy.engine import Engine
+
+from app.migrations.operations import Migration
+from app.migrations.versions import MIGRATIONS
+
+schema_migrations = Table(
+    "schema_migrations",
+    MetaData(),
+    Column("version", Integer, primary_key=True),
+    Column("name", String, nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+# Arbitrary key for the Postgres advisory lock that serializes migration runs
+_ADVISORY_LOCK_KEY = 72_403_117
+
+
+@contextmanager
+def _migration_lock(engine: Engine) -> Iterator[None]:
+    """Hold a Postgres advisory lock so concurrent deploys migrate one at a time."""
+    if engine.dialect.name != "postgresql":
+        yield
+        return
+
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        connection.exec_driver_sql(f"SELECT pg_advisory_lock({_ADVISORY_LOCK_KEY})")
+        try:
+            yield
+        finally:
+            connection.exec_driver_sql(f"SELECT pg_advisory_unlock({_ADVISORY_LOCK_KEY})")
+
+
+def applied_versions(engine: Engine) -> Set[int]:
+    """Return the versions recorded in schema_migrations (empty if never migrated)."""
+    if not inspect(engine).has_table(schema_migrations.name):
+        return set()
+    with engine.connect() as connection:
+        return set(connection.execute(select(schema_migrations.c.version)).scalars())
+
+
+def pending_migrations(engine: Engine, migrations: List[Migration] = MIGRATIONS) -> List[Migration]:
+    """Return migrations not yet applied, in version order."""
+    applied = applied_versions(engine)
+    return sorted((m for m in migrations if m.version not in applied), key=lambda m: m.version)
+
+
+def apply_migrations(engine: Engine, migrations: List[Migration] = MIGRATIONS) -> List[Migration]:
+    """
+    Apply every pending migration and record it in schema_migrations.
+
+    Safe to run on every deploy and at startup: applied versions are
+    skipped, and index operations are idempotent. A transactional
+    migration's other operations commit or roll back together before its
+    index builds run, and the version is only recorded once both succeed.
+
+    Returns:
+        The migrations applied by this call
+    """
+    schema_migrations.create(engine, checkfirst=True)
+    dialect = engine.dialect.name
+    applied = []
+
+    with _migration_lock(engine):
+        for migration in pending_migrations(engine, migrations):
+            print(f"🔧 Applying migration {migration.version:03d}_{migration.name}")
+            autocommit_operations = migration.operations
+            if migration.transactional:
+                autocommit_operations = [op for op in migration.operations if getattr(op, "autocommit", False)]
+                with engine.begin() as connection:
+                    for operation in migration.operations:
+                        if operation not in autocommit_operations:
+                            operation(connection, dialect)
+
+            with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+                for operation in autocommit_operations:
+                    operation(connection, dialect)
+                connection.execute(schema_migrations.insert().values(
+                    version=migration.version,
+                    name=migration.name,
+                    applied_at=datetime.now(timezone.utc).replace(tzinfo=None)
+                ))
+            applied.append(migration)
+
+    return applied
+
+
+def check_indexes(engine: Engine, metadata: Optional[MetaData] = None) -> List[Dict[str, str]]:
+    """
+    Report indexes the models declare but the database lacks.
+
+    Postgres indexes left invalid by a failed concurrent build are
+    reported too, since IF NOT EXISTS would otherwise skip over them.
+
+    Returns:
+        One dict per problem with table, index, columns and status
+        ("missing", "invalid" or "table_missing"); empty when healthy
+    """
+    if metadata is None:
+        from app.database import Base
+        import app.models  # noqa: F401  (registers every table on Base.metadata)
+        metadata = Base.metadata
+
+    inspector = inspect(engine)
+    invalid = set()
+    if engine.dialect.name == "postgresql":
+        with engine.connect() as connection:
+            invalid = set(connection.exec_driver_sql(
+                "SELECT c.relname FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+                "WHERE NOT i.indisvalid"
+            ).scalars())
+
+    problems = []
+    for table in metadata.sorted_tables:
+        if not table.indexes:
+            continue
+        if not inspector.has_table(table.name):
+            problems.append({"table": table.name, "index": "", "columns": "", "status": "table_missing"})
+            continue
+
+        existing = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in sorted(table.indexes, key=lambda i: i.name):
+            status = None
+            if index.name not in existing:
+                status = "missing"
+            elif index.name in invalid:
+                status = "invalid"
+            if status:
+                problems.append({
+                    "table": table.name,
+                    "index": index.name,
+                    "columns": ", ".join(column.name for column in index.columns),
+                    "status": status,
+                })
+    return problems
@@ -0,0 +1,106 @@
+"""Ordered list of schema migrations. Append new ones; never edit applied ones."""
+
+import uuid
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+from app.migrations.operations import Migration, add_column, create_index
+
+
+def _link_cards_to_templates(connection: Connection, dialect: str):
+    """
+    Point customer cards at their template and drop the copied rows.
+
+    Cards are linked by the same (card_name, issuer) lookup that used to
+    copy the template. Bonus and offer rows identical to one on the
+    template are deleted; anything else the customer added stays as an
+    override. Safe to re-run.
+    """
+    same = "IS" if dialect == "sqlite" else "IS NOT DISTINCT FROM"  # NULL-safe equality
+    connection.exec_driver_sql(
+        "UPDATE credit_cards SET template_id = ("
+        "  SELECT t.id FROM credit_cards AS t"
+        "  WHERE t.customer_id IS NULL AND t.card_name = credit_cards.card_name"
+        "  AND t.issuer = credit_cards.issuer ORDER BY t.id LIMIT 1"
+        ") WHERE customer_id IS NOT NULL AND template_id IS NULL"
+    )
+    connection.exec_driver_sql(
+        "DELETE FROM category_bonuses WHERE EXISTS ("
+        "  SELECT 1 FROM credit_cards AS c JOIN category_bonuses AS template_bonus ON template_bonus.card_id = c.template_id"
+        "  WHERE c.id = category_bonuses.card_id"
+        "  AND template_bonus.category = category_bonuses.category"
+        "  AND template_bonus.reward_rate = category_bonuses.reward_rate"
+        f"  AND template_bonus.start_date {same} category_bonuses.start_date"
+        f"  AND template_bonus.end_date {same} category_bonuses.end_date"
+        ")"
+    )
+    connection.exec_driver_sql(
+        "DELETE FROM offers WHERE EXISTS ("
+        "  SELECT 1 FROM credit_cards AS c JOIN offers AS template_offer ON template_offer.card_id = c.template_id"
+        "  WHERE c.id = offers.card_id"
+        "  AND template_offer.description = offers.description"
+        f"  AND template_offer.merchant_name {same} offers.merchant_name"
+        f"  AND template_offer.category {same} offers.category"
+        "  AND template_offer.bonus_rate = offers.bonus_rate"
+        f"  AND template_offer.expiry_date {same} offers.expiry_date"
+        ")"
+    )
+
+
+def _create_catalog_versions(connection: Connection, dialect: str):
+    """
+    Create the catalog version table and stamp the existing merchant catalog.
+
+    Workers compare this row instead of rereading merchant_categories, so
+    it must exist before any of them checks it. Safe to re-run.
+    """
+    connection.exec_driver_sql(
+        "CREATE TABLE IF NOT EXISTS catalog_versions ("
+        "  name VARCHAR NOT NULL PRIMARY KEY,"
+        "  version INTEGER NOT NULL,"
+        "  revision VARCHAR NOT NULL"
+        ")"
+    )
+    connection.execute(
+        text(
+            "INSERT INTO catalog_versions (name, version, revision)"
+            " SELECT 'merchant_categories', 1, :revision"
+            " WHERE NOT EXISTS (SELECT 1 FROM catalog_versions WHERE name = 'merchant_categories')"
+        ),
+        {"revision": uuid.uuid4().hex}
+    )
+
+MIGRATIONS = [
+    Migration(
+        version=1,
+        name="hot_path_indexes",
+        description="Index wallet loads, offer lookups and customer email lookups",
+        operations=[
+            create_index("ix_credit_cards_customer_id", "credit_cards", ["customer_id"]),
+            create_index("ix_category_bonuses_card_id", "category_bonuses", ["card_id"]),
+            create_index("ix_offers_card_id", "offers", ["card_id"]),
+            create_index("ix_offers_merchant_name", "offers", ["merchant_name"]),
+            create_index("ix_customers_email", "customers", ["email"]),
+        ],
+    ),
+    Migration(
+        version=2,
+        name="card_templates",
+        description="Reference template cards instead of copying their bonuses and offers",
+        operations=[
+            add_column("credit_cards", "template_id", "VARCHAR REFERENCES credit_cards (id)"),
+            _link_cards_to_templates,
+            create_index("ix_credit_cards_template_id", "credit_cards", ["template_id"]),
+        ],
+        # Link cards and drop their copies all-or-nothing
+        transactional=True,
+    ),
+    Migration(
+        version=3,
+        name="catalog_versions",
+        description="Store the merchant catalog version so every worker sees catalog writes",
+        operations=[_create_catalog_versions],
+        transactional=True,
+    ),
+]
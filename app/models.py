@@ -11,7 +11,7 @@ class Customer(Base):
     
     id = Column(String, primary_key=True)
     name = Column(String, nullable=False)
-    email = Column(String, nullable=False)
+    email = Column(String, nullable=False, index=True)
     
     cards = relationship("CreditCard", back_populates="customer", cascade="all, delete-orphan")
     
@@ -24,7 +24,9 @@ class CreditCard(Base):
     __tablename__ = "credit_cards"
     
     id = Column(String, primary_key=True)
-    customer_id = Column(String, ForeignKey("customers.id"), nullable=True)  # NULL for template cards
+    customer_id = Column(String, ForeignKey("customers.id"), nullable=True, index=True)  # NULL for template cards
+    # Customer cards added from a template reference it; their own bonus and offer rows are overrides
+    template_id = Column(String, ForeignKey("credit_cards.id"), nullable=True, index=True)
     card_name = Column(String, nullable=False)
     issuer = Column(String, nullable=False)
     last_four = Column(String, nullable=False)
@@ -49,7 +51,7 @@ class CategoryBonus(Base):
     __tablename__ = "category_bonuses"
     
     id = Column(Integer, primary_key=True, autoincrement=True)
-    card_id = Column(String, ForeignKey("credit_cards.id"), nullable=False)
+    card_id = Column(String, ForeignKey("credit_cards.id"), nullable=False, index=True)
     category = Column(String, nullable=False)
     reward_rate = Column(Float, nullable=False)  # 3.0 = 3%
     start_date = Column(Date, nullable=True)
@@ -77,9 +79,9 @@ class Offer(Base):
     __tablename__ = "offers"
     
     id = Column(Integer, primary_key=True, autoincrement=True)
-    card_id = Column(String, ForeignKey("credit_cards.id"), nullable=False)
+    card_id = Column(String, ForeignKey("credit_cards.id"), nullable=False, index=True)
     description = Column(String, nullable=False)
-    merchant_name = Column(String, nullable=True)  # Specific merchant
+    merchant_name = Column(String, nullable=True, index=True)  # Specific merchant
     category = Column(String, nullable=True)  # Or category-wide
     bonus_rate = Column(Float, nullable=False)  # Additional % bonus
     expiry_date = Column(Date, nullable=True)
@@ -104,3 +106,13 @@ class MerchantCategory(Base):
         return f"<MerchantCategory(merchant={self.merchant_name}, categories={self.categories})>"
 
 
+class CatalogVersion(Base):
+    """Version of a reference data catalog, bumped in the same transaction as every write to it."""
+    __tablename__ = "catalog_versions"
+    
+    name = Column(String, primary_key=True)  # Versioned table, e.g. "merchant_categories"
+    version = Column(Integer, nullable=False)
+    revision = Column(String, nullable=False)  # Random per write, so a recreated database never reuses a version
+    
+    def __repr__(self):
+        return f"<CatalogVersion(name={self.name}, version={self.version})>"
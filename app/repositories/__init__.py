@@ -4,11 +4,14 @@ from app.repositories.base_repository import BaseRepository
 from app.repositories.customer_repository import CustomerRepository
 from app.repositories.card_repository import CardRepository
 from app.repositories.recommendation_repository import RecommendationRepository
+from app.repositories.async_repository import AsyncCustomerRepository, AsyncCardRepository
 
 __all__ = [
     'BaseRepository',
     'CustomerRepository',
     'CardRepository',
     'RecommendationRepository',
+    'AsyncCustomerRepository',
+    'AsyncCardRepository',
 ]
 
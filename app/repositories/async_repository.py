@@ -0,0 +1,62 @@
+"""Async repositories for the read paths served by async routes."""
+
+from typing import List, Optional
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+from app.models import Customer, CreditCard
+
+
+class AsyncCustomerRepository:
+    """Async customer reads."""
+    
+    def __init__(self, db: AsyncSession):
+        self.db = db
+    
+    async def get_by_id(self, customer_id: str) -> Optional[Customer]:
+        """Get a customer by ID."""
+        return await self.db.get(Customer, customer_id)
+    
+    async def get_by_email(self, email: str) -> Optional[Customer]:
+        """Get customer by email address."""
+        result = await self.db.execute(select(Customer).where(Customer.email == email).limit(1))
+        return result.scalars().first()
+    
+    async def exists(self, customer_id: str) -> bool:
+        """Check if a customer exists by ID."""
+        result = await self.db.execute(select(Customer.id).where(Customer.id == customer_id))
+        return result.first() is not None
+
+
+class AsyncCardRepository:
+    """Async credit card reads."""
+    
+    def __init__(self, db: AsyncSession):
+        self.db = db
+    
+    async def get_wallet(self, customer_id: str) -> List[CreditCard]:
+        """
+        Get a customer's cards with category bonuses and offers eager-loaded.
+        
+        Same fixed three queries as CardRepository.get_wallet; eager loading
+        is required here because async sessions cannot lazy-load.
+        """
+        result = await self.db.execute(
+            select(CreditCard).options(
+                selectinload(CreditCard.category_bonuses),
+                selectinload(CreditCard.offers)
+            ).where(CreditCard.customer_id == customer_id)
+        )
+        return list(result.scalars().all())
+    
+    async def get_templates(self, template_ids: List[str]) -> List[CreditCard]:
+        """Get template cards by ID with category bonuses and offers eager-loaded."""
+        if not template_ids:
+            return []
+        result = await self.db.execute(
+            select(CreditCard).options(
+                selectinload(CreditCard.category_bonuses),
+                selectinload(CreditCard.offers)
+            ).where(CreditCard.id.in_(template_ids), CreditCard.customer_id.is_(None))
+        )
+        return list(result.scalars().all())
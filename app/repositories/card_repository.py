@@ -1,8 +1,8 @@
 """Repository for Credit Card database operations."""
 
 from typing import List, Optional
-from sqlalchemy.orm import Session
-from app.models import CreditCard, CategoryBonus, Offer
+from sqlalchemy.orm import Session, selectinload
+from app.models import CreditCard
 from app.repositories.base_repository import BaseRepository
 
 
@@ -16,6 +16,28 @@ class CardRepository(BaseRepository[CreditCard]):
         """Get all cards for a specific customer."""
         return self.db.query(CreditCard).filter(CreditCard.customer_id == customer_id).all()
     
+    def get_wallet(self, customer_id: str) -> List[CreditCard]:
+        """
+        Get a customer's cards with category bonuses and offers eager-loaded.
+        
+        Issues a fixed three queries (cards, bonuses, offers) regardless of
+        wallet size, so callers can walk card.category_bonuses and
+        card.offers without triggering lazy loads.
+        """
+        return self.db.query(CreditCard).options(
+            selectinload(CreditCard.category_bonuses),
+            selectinload(CreditCard.offers)
+        ).filter(CreditCard.customer_id == customer_id).all()
+    
+    def get_templates(self, template_ids: List[str]) -> List[CreditCard]:
+        """Get template cards by ID with category bonuses and offers eager-loaded."""
+        if not template_ids:
+            return []
+        return self.db.query(CreditCard).options(
+            selectinload(CreditCard.category_bonuses),
+            selectinload(CreditCard.offers)
+        ).filter(CreditCard.id.in_(template_ids), CreditCard.customer_id.is_(None)).all()
+    
     def get_template_card(self, card_name: str, issuer: str) -> Optional[CreditCard]:
         """
         Find a template card (one without customer_id or with NULL customer_id)
@@ -34,15 +56,17 @@ class CardRepository(BaseRepository[CreditCard]):
         template_card: Optional[CreditCard] = None
     ) -> CreditCard:
         """
-        Create a credit card with optional template copying.
+        Create a credit card, referencing template_card if provided.
         
-        If template_card is provided, copies base_reward_rate, network,
-        annual_fee, reward_type, points_value, category bonuses, and offers.
+        The card stores template_id and copies the template's base_reward_rate,
+        network, annual_fee, reward_type and points_value for display. Category
+        bonuses and offers are not copied; the recommendation engine reads
+        them from the template.
         """
-        # Create the card with basic info
         db_card = CreditCard(
             id=card_data.get('id'),
             customer_id=customer_id,
+            template_id=template_card.id if template_card else None,
             card_name=card_data.get('card_name'),
             issuer=card_data.get('issuer'),
             last_four=card_data.get('last_four', '0000'),
@@ -53,40 +77,6 @@ class CardRepository(BaseRepository[CreditCard]):
             points_value=template_card.points_value if template_card else card_data.get('points_value')
         )
         self.db.add(db_card)
-        self.db.flush()  # Flush to get the card ID
-        
-        # Copy category bonuses from template if available
-        if template_card and template_card.category_bonuses:
-            for template_bonus in template_card.category_bonuses:
-                db_bonus = CategoryBonus(
-                    card_id=db_card.id,
-                    category=template_bonus.category,
-                    reward_rate=template_bonus.reward_rate,
-                    start_date=template_bonus.start_date,
-                    end_date=template_bonus.end_date,
-                    cap_per_year=template_bonus.cap_per_year,
-                    cap_per_quarter=template_bonus.cap_per_quarter,
-                    cap_per_month=template_bonus.cap_per_month,
-                    activation_required=template_bonus.activation_required,
-                    notes=template_bonus.notes,
-                    source_url=template_bonus.source_url,
-                    last_verified=template_bonus.last_verified
-                )
-                self.db.add(db_bonus)
-        
-        # Copy offers from template if available
-        if template_card and template_card.offers:
-            for template_offer in template_card.offers:
-                db_offer = Offer(
-                    card_id=db_card.id,
-                    description=template_offer.description,
-                    merchant_name=template_offer.merchant_name,
-                    category=template_offer.category,
-                    bonus_rate=template_offer.bonus_rate,
-                    expiry_date=template_offer.expiry_date
-                )
-                self.db.add(db_offer)
-        
         self.db.commit()
         self.db.refresh(db_card)
         return db_card
@@ -4,6 +4,7 @@ from typing import Optional
 from sqlalchemy.orm import Session
 from app.models import Customer, CreditCard
 from app.repositories.base_repository import BaseRepository
+from app.repositories.card_repository import CardRepository
 
 
 class CustomerRepository(BaseRepository[Customer]):
@@ -21,9 +22,8 @@ class CustomerRepository(BaseRepository[Customer]):
         return self.db.query(Customer).filter(Customer.id == customer_id).first()
     
     def get_customer_cards(self, customer_id: str):
-        """Get all credit cards for a customer."""
-        customer = self.get_by_id(customer_id)
-        return customer.cards if customer else []
+        """Get all credit cards for a customer, bonuses and offers included."""
+        return CardRepository(self.db).get_wallet(customer_id)
     
     def count_cards(self, customer_id: str) -> int:
         """Count number of cards a customer has."""
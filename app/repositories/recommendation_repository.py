@@ -3,6 +3,7 @@
 from typing import List
 from sqlalchemy.orm import Session
 from app.models import CreditCard, MerchantCategory
+from app.repositories.card_repository import CardRepository
 
 
 class RecommendationRepository:
@@ -12,10 +13,8 @@ class RecommendationRepository:
         self.db = db
     
     def get_customer_cards(self, customer_id: str) -> List[CreditCard]:
-        """Get all active credit cards for a customer."""
-        return self.db.query(CreditCard).filter(
-            CreditCard.customer_id == customer_id
-        ).all()
+        """Get all active credit cards for a customer, bonuses and offers included."""
+        return CardRepository(self.db).get_wallet(customer_id)
     
     def get_merchant_categories(self, merchant_name: str) -> List[str]:
         """Get categories for a merchant."""
@@ -1,10 +1,19 @@
 """Admin endpoints for database management."""
 
-from fastapi import APIRouter, Depends, HTTPException
+import io
+import tempfile
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 
-from app.database import get_db
+from app.database import engine, get_db, get_read_db
+from app.migrations import MIGRATIONS, applied_versions, check_indexes
 from app.models import CreditCard, CategoryBonus, MerchantCategory
+from app.services.descriptor_normalizer import descriptor_normalizer
+from app.services.merchant_import import IMPORT_FORMATS, MerchantImporter
+from app.services.merchant_matcher import match_cache
+from app.services.wallet import invalidate_wallets, template_cache, wallet_cache
 
 router = APIRouter(prefix="/admin", tags=["admin"])
 
@@ -52,8 +61,53 @@ def seed_database(db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail=f"Seeding failed: {str(e)}")
 
 
+@router.post("/import-merchants")
+async def import_merchants(
+    request: Request,
+    format: str = Query("ndjson", description="csv or ndjson"),
+    db: Session = Depends(get_db)
+):
+    """
+    Bulk upsert merchants from a CSV or NDJSON request body.
+    
+    The body is streamed to a spooled temporary file rather than held in
+    memory, then imported in batched multi-row upserts off the event loop
+    (all database work runs in the threadpool). The merchant index is
+    updated incrementally once all rows are in.
+    WARNING: This should be protected in production!
+    """
+    if format not in IMPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(IMPORT_FORMATS)}")
+    
+    with tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024) as upload:
+        async for chunk in request.stream():
+            upload.write(chunk)
+        upload.seek(0)
+        
+        lines = io.TextIOWrapper(upload, encoding="utf-8", newline="")
+        
+        def run_import():
+            return MerchantImporter(db).import_lines(lines, format), db.query(MerchantCategory).count()
+        
+        try:
+            result, merchants = await run_in_threadpool(run_import)
+        except UnicodeDecodeError:
+            raise HTTPException(status_code=400, detail="Import file must be UTF-8 encoded")
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Import failed: {str(e)}")
+    
+    return {
+        "status": "success" if not result.failed else "partial",
+        "rows_read": result.rows_read,
+        "upserted": result.upserted,
+        "failed": result.failed,
+        "errors": result.errors,
+        "merchants": merchants
+    }
+
+
 @router.get("/database-stats")
-def get_database_stats(db: Session = Depends(get_db)):
+def get_database_stats(db: Session = Depends(get_read_db)):
     """Get current database statistics."""
     from app.models import Customer, Offer
     
@@ -74,8 +128,32 @@ def get_database_stats(db: Session = Depends(get_db)):
     }
 
 
+@router.get("/cache-stats")
+def get_cache_stats():
+    """Get hit/miss counters for this worker's in-process caches."""
+    return {
+        "wallet_cache": wallet_cache.stats(),
+        "template_cache": template_cache.stats(),
+        "descriptor_cache": descriptor_normalizer.cache.stats(),
+        "match_cache": match_cache.stats()
+    }
+
+
+@router.get("/schema-status")
+def get_schema_status():
+    """Get applied/pending migrations and any missing or invalid indexes."""
+    applied = applied_versions(engine)
+    problems = check_indexes(engine)
+    return {
+        "status": "ok" if not problems and len(applied) == len(MIGRATIONS) else "needs_migration",
+        "applied": sorted(applied),
+        "pending": [m.version for m in MIGRATIONS if m.version not in applied],
+        "index_problems": problems
+    }
+
+
 @router.get("/template-cards")
-def get_template_cards(db: Session = Depends(get_db)):
+def get_template_cards(db: Session = Depends(get_read_db)):
     """Get all template cards for debugging."""
     template_cards = db.query(CreditCard).filter(CreditCard.customer_id.is_(None)).all()
     return [{
@@ -120,6 +198,7 @@ def clear_customer_data(db: Session = Depends(get_db)):
         db.query(Customer).delete(synchronize_session=False)
         
         db.commit()
+        invalidate_wallets()
         
         # Get stats
         template_cards = db.query(CreditCard).filter(CreditCard.customer_id.is_(None)).count()
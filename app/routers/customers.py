@@ -2,13 +2,18 @@
 
 from typing import List
 from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
-from app.database import get_db
+from app.database import get_async_read_db, get_db
 from app.models import Customer, CreditCard, CategoryBonus, Offer
+from app.repositories import AsyncCardRepository, AsyncCustomerRepository, CustomerRepository
+from app.services.wallet import invalidate_wallet
+from app.services.wallet_import import CARD_FAILED, WalletImporter
 from app.schemas import (
     CustomerCreate, CustomerResponse,
     CardCreate, CardResponse,
+    BatchCardCreateRequest, BatchCardCreateResponse, BatchCardResult,
     CategoryBonusCreate, OfferCreate
 )
 
@@ -35,30 +40,29 @@ def create_customer(customer: CustomerCreate, db: Session = Depends(get_db)):
 
 
 @router.get("/{customer_id}", response_model=CustomerResponse)
-def get_customer(customer_id: str, db: Session = Depends(get_db)):
+async def get_customer(customer_id: str, db: AsyncSession = Depends(get_async_read_db)):
     """Get customer by ID."""
-    customer = db.query(Customer).filter(Customer.id == customer_id).first()
+    customer = await AsyncCustomerRepository(db).get_by_id(customer_id)
     if not customer:
         raise HTTPException(status_code=404, detail="Customer not found")
     return customer
 
 
 @router.get("/by-email/{email}", response_model=CustomerResponse)
-def get_customer_by_email(email: str, db: Session = Depends(get_db)):
+async def get_customer_by_email(email: str, db: AsyncSession = Depends(get_async_read_db)):
     """Get customer by email address."""
-    customer = db.query(Customer).filter(Customer.email == email).first()
+    customer = await AsyncCustomerRepository(db).get_by_email(email)
     if not customer:
         raise HTTPException(status_code=404, detail="Customer not found with this email")
     return customer
 
 
 @router.get("/{customer_id}/cards", response_model=List[CardResponse])
-def get_customer_cards(customer_id: str, db: Session = Depends(get_db)):
+async def get_customer_cards(customer_id: str, db: AsyncSession = Depends(get_async_read_db)):
     """Get all cards for a customer."""
-    customer = db.query(Customer).filter(Customer.id == customer_id).first()
-    if not customer:
+    if not await AsyncCustomerRepository(db).exists(customer_id):
         raise HTTPException(status_code=404, detail="Customer not found")
-    return customer.cards
+    return await AsyncCardRepository(db).get_wallet(customer_id)
 
 
 @router.post("/{customer_id}/cards", response_model=CardResponse, status_code=201)
@@ -94,10 +98,13 @@ def add_card_to_customer(
         all_templates = db.query(CreditCard).filter(CreditCard.customer_id.is_(None)).all()
         print(f"   Available templates: {[f'{t.card_name} ({t.issuer})' for t in all_templates[:5]]}")
     
-    # Create the card with template data if available
+    # Create the card referencing its template. Bonuses and offers are read
+    # from the template at scoring time instead of being copied; the reward
+    # fields are kept on the row for display and for cards without a template.
     db_card = CreditCard(
         id=card.id,
         customer_id=customer_id,
+        template_id=template_card.id if template_card else None,
         card_name=card.card_name,
         issuer=card.issuer,
         last_four=card.last_four,
@@ -108,45 +115,45 @@ def add_card_to_customer(
         points_value=template_card.points_value if template_card else None
     )
     db.add(db_card)
-    db.flush()  # Flush to get the card ID before adding bonuses
-    
-    # Copy category bonuses from template if available
-    if template_card and template_card.category_bonuses:
-        for template_bonus in template_card.category_bonuses:
-            db_bonus = CategoryBonus(
-                card_id=db_card.id,
-                category=template_bonus.category,
-                reward_rate=template_bonus.reward_rate,
-                start_date=template_bonus.start_date,
-                end_date=template_bonus.end_date,
-                cap_per_year=template_bonus.cap_per_year,
-                cap_per_quarter=template_bonus.cap_per_quarter,
-                cap_per_month=template_bonus.cap_per_month,
-                activation_required=template_bonus.activation_required,
-                notes=template_bonus.notes,
-                source_url=template_bonus.source_url,
-                last_verified=template_bonus.last_verified
-            )
-            db.add(db_bonus)
-    
-    # Copy offers from template if available
-    if template_card and template_card.offers:
-        for template_offer in template_card.offers:
-            db_offer = Offer(
-                card_id=db_card.id,
-                description=template_offer.description,
-                merchant_name=template_offer.merchant_name,
-                category=template_offer.category,
-                bonus_rate=template_offer.bonus_rate,
-                expiry_date=template_offer.expiry_date
-            )
-            db.add(db_offer)
     
     db.commit()
+    invalidate_wallet(customer_id)
     db.refresh(db_card)
     return db_card
 
 
+@router.post("/{customer_id}/cards/batch", response_model=BatchCardCreateResponse, status_code=201)
+def add_cards_to_customer(
+    customer_id: str,
+    request: BatchCardCreateRequest,
+    db: Session = Depends(get_db)
+):
+    """
+    Add many credit cards to a customer in one request.
+    
+    Used for onboarding and account linking: templates for all cards are
+    resolved in one query and the cards (plus any bonuses and offers sent
+    with them) are inserted with multi-row statements in one transaction.
+    Results are reported per card, in request order; cards that already
+    exist fail individually without failing the batch.
+    """
+    if not CustomerRepository(db).exists(customer_id):
+        raise HTTPException(status_code=404, detail="Customer not found")
+    
+    try:
+        results = WalletImporter(db).add_cards(customer_id, request.cards)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to add cards: {str(e)}")
+    
+    failed = sum(1 for result in results if result.status == CARD_FAILED)
+    return BatchCardCreateResponse(
+        customer_id=customer_id,
+        created=len(results) - failed,
+        failed=failed,
+        results=[BatchCardResult.model_validate(result) for result in results]
+    )
+
+
 @router.delete("/{customer_id}/cards/{card_id}", status_code=200)
 def delete_card(customer_id: str, card_id: str, db: Session = Depends(get_db)):
     """Delete a credit card from customer's wallet."""
@@ -171,6 +178,7 @@ def delete_card(customer_id: str, card_id: str, db: Session = Depends(get_db)):
     # Delete the card
     db.delete(card)
     db.commit()
+    invalidate_wallet(customer_id)
     
     return {"message": "Card deleted successfully", "card_id": card_id}
 
@@ -199,6 +207,7 @@ def add_category_bonus(
     )
     db.add(db_bonus)
     db.commit()
+    invalidate_wallet(customer_id)
     db.refresh(db_bonus)
     return {"message": "Category bonus added successfully"}
 
@@ -228,6 +237,7 @@ def add_offer(
     )
     db.add(db_offer)
     db.commit()
+    invalidate_wallet(customer_id)
     db.refresh(db_offer)
     return {"message": "Offer added successfully"}
 
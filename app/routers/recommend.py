@@ -1,34 +1,48 @@
 """Credit card recommendation endpoints."""
 
 from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
-from app.database import get_db
-from app.schemas import RecommendationRequest, RecommendationResponse, MerchantInfo
+from app.database import get_async_read_db, get_read_db
+from app.schemas import (
+    RecommendationRequest, RecommendationResponse, MerchantInfo,
+    BatchRecommendationRequest, BatchRecommendationResponse, BatchRecommendationResult
+)
 from app.services.recommendation import RecommendationEngine
 
 router = APIRouter(prefix="/recommend", tags=["recommendations"])
 
 
 @router.post("/", response_model=RecommendationResponse)
-def get_recommendation(
+async def get_recommendation(
     request: RecommendationRequest,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_read_db)
 ):
     """
     Get credit card recommendation for a planned purchase.
     
     Given a customer, merchant name, and purchase amount,
     returns the best card(s) to use ranked by estimated rewards.
+    If a merchant category code (mcc) is supplied, it categorizes the
+    purchase directly and the merchant name is not fuzzy-matched.
+    
+    Served on a read-only (replica) async session: only a wallet cache miss
+    waits on the database, and it does so without holding a worker thread.
+    Merchant index rebuilds, wallet compiles and merchant names that need
+    the fuzzy match tiers run in the threadpool rather than on the event loop.
+    Send X-Read-Your-Writes: 1 right after a wallet change to read from
+    the primary.
     """
-    engine = RecommendationEngine(db)
+    engine = await RecommendationEngine.from_async_session(db)
     
-    # Get recommendations
-    recommendations = engine.recommend(
+    # Get recommendations and the merchant match they were scored against
+    recommendations, resolution = await engine.recommend_with_resolution_async(
         customer_id=request.customer_id,
         merchant_name=request.merchant_name,
         purchase_amount=request.purchase_amount,
-        top_n=request.top_n
+        top_n=request.top_n,
+        mcc=request.mcc
     )
     
     if not recommendations:
@@ -37,18 +51,56 @@ def get_recommendation(
             detail="No cards found for customer or customer does not exist"
         )
     
-    # Get merchant info
-    categories = engine.merchant_matcher.match(request.merchant_name)
-    confidence = engine.merchant_matcher.get_confidence(request.merchant_name)
-    
     return RecommendationResponse(
         recommendations=recommendations,
         merchant_info=MerchantInfo(
             merchant_name=request.merchant_name,
-            identified_categories=categories,
-            confidence=confidence
+            identified_categories=resolution.categories,
+            confidence=resolution.confidence
         )
     )
 
 
-
+@router.post("/batch", response_model=BatchRecommendationResponse)
+def get_batch_recommendations(
+    request: BatchRecommendationRequest,
+    db: Session = Depends(get_read_db)
+):
+    """
+    Get credit card recommendations for many purchases at once.
+    
+    Intended for statement analysis and receipt scanning: the customer's
+    wallet is loaded once and each distinct merchant is matched once.
+    Results are returned in the same order as the request items.
+    """
+    engine = RecommendationEngine(db)
+    
+    results = engine.recommend_batch(
+        customer_id=request.customer_id,
+        items=request.items,
+        top_n=request.top_n
+    )
+    
+    if results is None:
+        raise HTTPException(
+            status_code=404,
+            detail="No cards found for customer or customer does not exist"
+        )
+    
+    return BatchRecommendationResponse(
+        customer_id=request.customer_id,
+        results=[
+            BatchRecommendationResult(
+                merchant_name=item.merchant_name,
+                purchase_amount=item.purchase_amount,
+                transaction_date=item.transaction_date,
+                recommendations=result.recommendations,
+                merchant_info=MerchantInfo(
+                    merchant_name=item.merchant_name,
+                    identified_categories=result.resolution.categories,
+                    confidence=result.resolution.confidence
+                )
+            )
+            for item, result in zip(request.items, results)
+        ]
+    )
@@ -13,6 +13,7 @@ class RecommendationRequest(BaseModel):
     purchase_amount: Optional[float] = None  # Optional - for pre-purchase planning
     location: Optional[str] = None
     top_n: int = 1
+    mcc: Optional[str] = None  # Merchant category code from the card network, e.g. "5411"
     
     @validator('purchase_amount')
     def amount_must_be_positive(cls, v):
@@ -25,6 +26,46 @@ class RecommendationRequest(BaseModel):
         if v < 1:
             raise ValueError('top_n must be at least 1')
         return v
+    
+    @validator('mcc')
+    def mcc_must_be_four_digits(cls, v):
+        if v is not None and not (len(v) == 4 and v.isdigit()):
+            raise ValueError('mcc must be a 4-digit merchant category code')
+        return v
+
+
+class BatchRecommendationItem(BaseModel):
+    """A single purchase within a batch recommendation request."""
+    merchant_name: str
+    purchase_amount: Optional[float] = None
+    transaction_date: Optional[date] = None
+    
+    @validator('purchase_amount')
+    def amount_must_be_positive(cls, v):
+        if v is not None and v <= 0:
+            raise ValueError('Purchase amount must be positive')
+        return v
+
+
+class BatchRecommendationRequest(BaseModel):
+    """Request for recommendations on many purchases by one customer."""
+    customer_id: str
+    items: List[BatchRecommendationItem]
+    top_n: int = 1
+    
+    @validator('items')
+    def items_must_be_bounded(cls, v):
+        if not v:
+            raise ValueError('items must not be empty')
+        if len(v) > 500:
+            raise ValueError('items must contain at most 500 entries')
+        return v
+    
+    @validator('top_n')
+    def top_n_must_be_positive(cls, v):
+        if v < 1:
+            raise ValueError('top_n must be at least 1')
+        return v
 
 
 class CustomerCreate(BaseModel):
@@ -60,6 +101,25 @@ class OfferCreate(BaseModel):
     expiry_date: Optional[date] = None
 
 
+class BatchCardCreate(CardCreate):
+    """A card within a batch, with optional customer-specific bonuses and offers."""
+    category_bonuses: List[CategoryBonusCreate] = []
+    offers: List[OfferCreate] = []
+
+
+class BatchCardCreateRequest(BaseModel):
+    """Request to add many cards to one customer's wallet."""
+    cards: List[BatchCardCreate]
+    
+    @validator('cards')
+    def cards_must_be_bounded(cls, v):
+        if not v:
+            raise ValueError('cards must not be empty')
+        if len(v) > 100:
+            raise ValueError('cards must contain at most 100 entries')
+        return v
+
+
 # Response Schemas
 class CardRecommendation(BaseModel):
     """Individual card recommendation with scoring details."""
@@ -90,6 +150,21 @@ class RecommendationResponse(BaseModel):
     merchant_info: MerchantInfo
 
 
+class BatchRecommendationResult(BaseModel):
+    """Recommendations for one item of a batch request."""
+    merchant_name: str
+    purchase_amount: Optional[float] = None
+    transaction_date: Optional[date] = None
+    recommendations: List[CardRecommendation]
+    merchant_info: MerchantInfo
+
+
+class BatchRecommendationResponse(BaseModel):
+    """Response containing per-item recommendations, in request order."""
+    customer_id: str
+    results: List[BatchRecommendationResult]
+
+
 class CustomerResponse(BaseModel):
     """Response for customer data."""
     id: str
@@ -111,6 +186,7 @@ class CardResponse(BaseModel):
     annual_fee: Optional[float] = None
     reward_type: Optional[str] = None
     points_value: Optional[float] = None
+    template_id: Optional[str] = None
     
     class Config:
         from_attributes = True
@@ -131,3 +207,20 @@ class NearbyMerchantsResponse(BaseModel):
     location: Optional[Dict[str, float]] = None  # {lat, lng}
 
 
+class BatchCardResult(BaseModel):
+    """Outcome for one card of a batch card request."""
+    card_id: str
+    status: str  # 'created' or 'failed'
+    template_id: Optional[str] = None
+    error: Optional[str] = None
+    
+    class Config:
+        from_attributes = True
+
+
+class BatchCardCreateResponse(BaseModel):
+    """Response with per-card results, in request order."""
+    customer_id: str
+    created: int
+    failed: int
+    results: List[BatchCardResult]
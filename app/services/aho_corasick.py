@@ -0,0 +1,152 @@
+"""Aho-Corasick automaton for finding every known key inside a string."""
+
+from array import array
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+
+class AhoCorasick:
+    """
+    Multi-pattern substring matcher over a fixed set of keys.
+
+    Built once from the keys; find_all() then reports every key contained
+    in a text in a single left-to-right pass, independent of how many keys
+    the automaton holds.
+
+    The trie is stored in flat arrays rather than a dict per node: the
+    edges leaving node n are the slots edge_start[n]:edge_start[n + 1] of
+    edge_chars (one character per edge, sorted) and edge_targets. With the
+    failure, dictionary-suffix and key links this costs about 21 bytes per
+    node, and the arrays pickle as plain buffers.
+    """
+
+    def __init__(self, keys: Iterable[str]):
+        self._keys: List[str] = sorted({key for key in keys if key})
+        self.size = len(self._keys)
+
+        parents, labels, depths = self._build_trie()
+        self._build_edges(parents, labels)
+        self._build_links(parents, labels, depths)
+
+    def _build_trie(self) -> Tuple[array, array, array]:
+        """
+        Number the trie nodes from the sorted keys.
+
+        Keys sharing a prefix are adjacent once sorted, so a key only adds
+        nodes past its common prefix with the previous key, and every
+        node's children are created in character order.
+        """
+        parents = array("i", [0])
+        labels = array("I", [0])  # Code point of the edge into each node
+        depths = array("i", [0])
+        self._key_index = array("i", [-1])  # Key ending exactly at this node, or -1
+
+        path = [0]  # Nodes along the previous key
+        previous = ""
+        for key_index, key in enumerate(self._keys):
+            common = 0
+            limit = min(len(key), len(previous))
+            while common < limit and key[common] == previous[common]:
+                common += 1
+            del path[common + 1:]
+
+            for char in key[common:]:
+                parents.append(path[-1])
+                labels.append(ord(char))
+                depths.append(len(path))
+                self._key_index.append(-1)
+                path.append(len(parents) - 1)
+            self._key_index[path[-1]] = key_index
+            previous = key
+        return parents, labels, depths
+
+    def _build_edges(self, parents: array, labels: array):
+        """Group every node's outgoing edges into contiguous, character-sorted slots."""
+        node_count = len(parents)
+        self._edge_start = array("i", bytes(4 * (node_count + 1)))
+        for node in range(1, node_count):
+            self._edge_start[parents[node] + 1] += 1
+        for node in range(node_count):
+            self._edge_start[node + 1] += self._edge_start[node]
+
+        # Nodes were created in order, so each parent's slots fill in character order
+        cursor = array("i", self._edge_start)
+        targets = array("i", bytes(4 * max(node_count - 1, 0)))
+        chars = array("I", bytes(4 * max(node_count - 1, 0)))
+        for node in range(1, node_count):
+            slot = cursor[parents[node]]
+            cursor[parents[node]] = slot + 1
+            targets[slot] = node
+            chars[slot] = labels[node]
+        self._edge_targets = targets
+        self._edge_chars = "".join(map(chr, chars))
+        # Most characters of a text are read at the root, so its edges also get a dict
+        self._root = {
+            self._edge_chars[slot]: targets[slot] for slot in range(self._edge_start[0], self._edge_start[1])
+        }
+
+    def _goto(self, node: int, char: str) -> int:
+        """Return the child of node along char, or -1."""
+        slot = self._edge_chars.find(char, self._edge_start[node], self._edge_start[node + 1])
+        return self._edge_targets[slot] if slot >= 0 else -1
+
+    def _build_links(self, parents: array, labels: array, depths: array):
+        """Compute failure and dictionary-suffix links breadth first."""
+        node_count = len(parents)
+        self._fail = array("i", bytes(4 * node_count))
+        self._dict_link = array("i", bytes(4 * node_count))  # Nearest proper suffix node that ends a key
+
+        # Parents' links, and every shallower node's, are set before a node's own
+        for node in sorted(range(1, node_count), key=depths.__getitem__):
+            parent = parents[node]
+            if parent == 0:
+                continue
+            char = chr(labels[node])
+            fallback = self._fail[parent]
+            while True:
+                target = self._goto(fallback, char)
+                if target >= 0 or fallback == 0:
+                    break
+                fallback = self._fail[fallback]
+            suffix = max(target, 0)
+            self._fail[node] = suffix
+            self._dict_link[node] = suffix if self._key_index[suffix] >= 0 else self._dict_link[suffix]
+
+    def find_all(self, text: str) -> Iterator[Tuple[int, str]]:
+        """Yield (start offset, key) for every key occurrence in text."""
+        find, starts, targets, root = self._edge_chars.find, self._edge_start, self._edge_targets, self._root
+        fail, key_index, dict_link, keys = self._fail, self._key_index, self._dict_link, self._keys
+        node = 0
+        for end, char in enumerate(text, start=1):
+            while node:
+                slot = find(char, starts[node], starts[node + 1])
+                if slot >= 0:
+                    node = targets[slot]
+                    break
+                node = fail[node]
+            else:
+                node = root.get(char, 0)
+
+            match = node if key_index[node] >= 0 else dict_link[node]
+            while match:
+                key = keys[key_index[match]]
+                yield end - len(key), key
+                match = dict_link[match]
+
+    def longest_match(self, text: str) -> Optional[str]:
+        """
+        Return the most specific key contained in text.
+
+        Longer keys win; ties go to the earliest occurrence, then to the
+        alphabetically first key, so the result never depends on the order
+        keys were inserted.
+        """
+        best = None
+        best_rank = None
+        for start, key in self.find_all(text):
+            rank = (-len(key), start, key)
+            if best_rank is None or rank < best_rank:
+                best, best_rank = key, rank
+        return best
+
+    def __len__(self) -> int:
+        return self.size
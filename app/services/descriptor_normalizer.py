@@ -0,0 +1,102 @@
+"""Normalization of raw card-statement descriptors ahead of merchant matching."""
+
+import re
+from typing import Iterable, List
+
+from app.config.settings import settings
+from app.core.cache import LRUCache
+
+_US_STATES = (
+    "al|ak|az|ar|ca|co|ct|de|dc|fl|ga|hi|id|il|in|ia|ks|ky|la|me|md|ma|mi|mn|ms|mo|mt|ne|nv|nh|nj|nm|"
+    "ny|nc|nd|oh|ok|or|pa|ri|sc|sd|tn|tx|ut|vt|va|wa|wv|wi|wy"
+)
+
+# Left where processor artifacts were cut, so the "CITY ST" step only runs on
+# descriptors that carried them; removed before the abbreviation steps
+_STRIPPED = "\x00"
+
+# Applied in order. Every pattern is line-anchored so a whole statement can be
+# cleaned in one pass per pattern over newline-joined descriptors.
+_CLEANUP_STEPS = [
+    # Payment processor / aggregator prefixes: "SQ *", "TST* ", "PAYPAL *", "DD *"
+    (re.compile(r"^(?:sq|tst|sp|pp|paypal|dd|ic|gglpay|google|pos|clv|fs|py)[ \t]*\*[ \t]*", re.M), _STRIPPED),
+    # Store numbers, and the location text that follows them
+    (re.compile(r"[ \t]*(?:#|\bstore[ \t]*#?|\bsto[ \t]*#?)[ \t]*\d+[^\n]*$", re.M), ""),
+    # Bare store numbers followed by "CITY ST": "CHIPOTLE 0123 NEW YORK NY"
+    (re.compile(r"[ \t]+\d{3,}[ \t]+[^\n]*[ \t](?:" + _US_STATES + r")$", re.M), ""),
+    # Reference codes after a '*': "AMZN Mktp US*2K4AB12"
+    (re.compile(r"[ \t]*\*\S*", re.M), _STRIPPED),
+    # Long digit runs: terminal ids, phone numbers, dates
+    (re.compile(r"[ \t]*\b\d{4,}\b", re.M), _STRIPPED),
+    # Trailing "CITY ST" once something precedes it: "SQ *STARBUCKS SEATTLE WA".
+    # Only after a prefix, code or digit run was cut: in a plain name the
+    # two letters are part of it ("Coca Cola Co", "Cafe Rio OK")
+    (re.compile(
+        r"^(?=[^\n]*" + _STRIPPED + r")(\S+(?:[ \t]+\S+)*?)[ \t]+\S+[ \t]+(?:" + _US_STATES + r")$", re.M
+    ), r"\1"),
+    (re.compile(_STRIPPED), ""),  # Markers are no longer needed
+    # Known processor abbreviations
+    (re.compile(r"^amzn(?:[ \t]+(?:mktp|mktplace|marketplace)(?:[ \t]+us)?)?$", re.M), "amazon"),
+    (re.compile(r"^amzn[ \t]+", re.M), "amazon "),
+    (re.compile(r"^wm[ \t]+supercenter$", re.M), "walmart"),
+    # Leftover punctuation and whitespace
+    (re.compile(r"^[ \t\-*#.,]+|[ \t\-*#.,]+$", re.M), ""),
+    (re.compile(r"[ \t]{2,}"), " "),
+]
+
+class DescriptorNormalizer:
+    """
+    Turns raw statement descriptors into clean merchant names.
+
+    "SQ *STARBUCKS #1234 SEATTLE WA" -> "starbucks"
+    "AMZN Mktp US*2K4AB12"           -> "amazon"
+
+    Results are memoized in a bounded LRU keyed by the raw descriptor.
+    """
+
+    def __init__(self, cache_size: int = settings.DESCRIPTOR_CACHE_MAX_ENTRIES):
+        self.cache = LRUCache(maxsize=cache_size)
+
+    @staticmethod
+    def _clean(text: str) -> str:
+        """Apply every cleanup step to lowercase, newline-separated descriptors."""
+        for pattern, replacement in _CLEANUP_STEPS:
+            text = pattern.sub(replacement, text)
+        return text
+
+    def normalize(self, descriptor: str) -> str:
+        """Normalize a single descriptor."""
+        return self.normalize_many([descriptor])[0]
+
+    def normalize_many(self, descriptors: Iterable[str]) -> List[str]:
+        """
+        Normalize a whole statement at once.
+
+        Distinct uncached descriptors are joined into one newline-separated
+        text and each cleanup pattern runs once over it, rather than once
+        per descriptor. Output order matches input order.
+        """
+        descriptors = list(descriptors)
+        results = {}
+        pending = []
+        for descriptor in dict.fromkeys(descriptors):
+            cached = self.cache.get(descriptor)
+            if cached is not None:
+                results[descriptor] = cached
+            else:
+                pending.append(descriptor)
+
+        if pending:
+            # Newlines inside a descriptor would break the line-per-descriptor layout
+            lines = [" ".join(d.lower().replace(_STRIPPED, "").split()) for d in pending]
+            cleaned = self._clean("\n".join(lines)).split("\n")
+            for descriptor, line, value in zip(pending, lines, cleaned):
+                # Never clean a descriptor away entirely
+                value = value.strip() or line
+                self.cache.set(descriptor, value)
+                results[descriptor] = value
+
+        return [results[d] for d in descriptors]
+
+
+descriptor_normalizer = DescriptorNormalizer()
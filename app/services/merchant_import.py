@@ -0,0 +1,227 @@
+"""Streaming bulk import of the merchant catalog from CSV or NDJSON files."""
+
+import csv
+import json
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from sqlalchemy import insert
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from app.config.settings import settings
+from app.models import MerchantCategory
+from app.services.merchant_index import (
+    CatalogRevision, apply_catalog_changes, bump_catalog_version, record_catalog_change
+)
+
+IMPORT_FORMATS = ("csv", "ndjson")
+
+# Dialects with INSERT ... ON CONFLICT DO UPDATE
+_UPSERT_INSERTS = {
+    "sqlite": sqlite.insert,
+    "postgresql": postgresql.insert,
+}
+
+# Only the first few row errors are reported back; the rest are counted
+MAX_REPORTED_ERRORS = 100
+
+
+@dataclass(frozen=True)
+class MerchantRecord:
+    """One merchant row from an import file (same fields as MerchantCategory)."""
+    merchant_name: str
+    categories: List[str]
+    aliases: Optional[List[str]] = None
+    accepted_networks: Optional[List[str]] = None
+
+
+@dataclass
+class ImportResult:
+    """Outcome of a merchant import."""
+    rows_read: int = 0
+    upserted: int = 0
+    failed: int = 0
+    errors: List[str] = field(default_factory=list)
+
+    def add_error(self, line_number: int, message: str):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append(f"line {line_number}: {message}")
+
+
+def _as_list(value: Any) -> List[str]:
+    """
+    Read a list field.
+
+    NDJSON gives real lists; CSV cells hold either a JSON array or
+    '|'-separated values ("grocery|organic").
+    """
+    if value is None:
+        return []
+    if isinstance(value, list):
+        return [str(item).strip() for item in value if str(item).strip()]
+    text = str(value).strip()
+    if text.startswith("["):
+        return _as_list(json.loads(text))
+    return [item.strip() for item in text.split("|") if item.strip()]
+
+
+def _record_from_row(row: Dict[str, Any]) -> Union[MerchantRecord, str]:
+    """
+    Build a record from a parsed row, or return an error message.
+
+    Names and aliases are lowercased like the merchant index keys, so
+    "Costco" and "costco" upsert the same row instead of two rows that
+    collide in the index.
+    """
+    name = str(row.get("merchant_name") or row.get("name") or "").strip().lower()
+    if not name:
+        return "missing merchant_name"
+    try:
+        categories = _as_list(row.get("categories"))
+        aliases = [alias.lower() for alias in _as_list(row.get("aliases"))]
+        networks = [network.lower() for network in _as_list(row.get("accepted_networks"))]
+    except ValueError:
+        return "malformed list field"
+    if not categories:
+        return f"no categories for '{name}'"
+    return MerchantRecord(
+        merchant_name=name,
+        categories=categories,
+        aliases=aliases,
+        accepted_networks=networks or None
+    )
+
+
+def parse_merchant_records(
+    lines: Iterable[str],
+    file_format: str
+) -> Iterator[Tuple[int, Union[MerchantRecord, str]]]:
+    """
+    Yield (line number, record or error message) for each data row.
+
+    Rows are parsed lazily, so files of any size stream through in
+    constant memory. CSV files need a header row with merchant_name and
+    categories columns (aliases and accepted_networks are optional).
+    """
+    if file_format == "csv":
+        reader = csv.DictReader(lines)
+        for row in reader:
+            yield reader.line_num, _record_from_row(row)
+        return
+
+    for line_number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            yield line_number, "invalid JSON"
+            continue
+        if not isinstance(row, dict):
+            yield line_number, "expected a JSON object"
+            continue
+        yield line_number, _record_from_row(row)
+
+
+class MerchantImporter:
+    """
+    Upserts merchant records in batched multi-row statements.
+
+    Each batch is one INSERT ... ON CONFLICT (merchant_name) DO UPDATE
+    statement committed on its own, so write locks are held briefly and
+    recommendation traffic keeps reading. Once every batch is in, the
+    shared merchant index is updated incrementally with the changed
+    merchants instead of being rebuilt from the table.
+    """
+
+    def __init__(self, db: Session, batch_size: int = settings.MERCHANT_IMPORT_BATCH_SIZE):
+        self.db = db
+        self.batch_size = batch_size
+
+    def import_lines(self, lines: Iterable[str], file_format: str) -> ImportResult:
+        """
+        Import a CSV or NDJSON stream of merchants.
+
+        Args:
+            lines: Text lines of the file (an open file works)
+            file_format: "csv" or "ndjson"
+
+        Returns:
+            ImportResult with row counts and the first row errors
+        """
+        if file_format not in IMPORT_FORMATS:
+            raise ValueError(f"Unsupported import format: {file_format}")
+
+        result = ImportResult()
+        imported: Dict[str, MerchantRecord] = {}
+        revisions: List[CatalogRevision] = []
+        batch: Dict[str, MerchantRecord] = {}
+        try:
+            for line_number, record in parse_merchant_records(lines, file_format):
+                result.rows_read += 1
+                if isinstance(record, str):
+                    result.add_error(line_number, record)
+                    continue
+
+                # Later rows for the same merchant win, within and across batches
+                batch[record.merchant_name] = record
+                if len(batch) >= self.batch_size:
+                    revisions.append(self._upsert(list(batch.values())))
+                    imported.update(batch)
+                    batch = {}
+
+            if batch:
+                revisions.append(self._upsert(list(batch.values())))
+                imported.update(batch)
+        except Exception:
+            if revisions:
+                # Earlier batches are committed; the shared index must not miss them
+                bump_catalog_version()
+            raise
+
+        result.upserted = len(imported)
+        if imported:
+            apply_catalog_changes(self.db, imported.values(), revisions)
+        return result
+
+    def _upsert(self, records: List[MerchantRecord]) -> CatalogRevision:
+        """Write one batch as multi-row upsert statements and commit it with a new catalog revision."""
+        rows = [
+            {
+                "merchant_name": record.merchant_name,
+                "categories": record.categories,
+                "aliases": record.aliases,
+                "accepted_networks": record.accepted_networks,
+            }
+            for record in records
+        ]
+
+        upsert_insert = _UPSERT_INSERTS.get(self.db.get_bind().dialect.name)
+        try:
+            if upsert_insert is not None:
+                statement = upsert_insert(MerchantCategory)
+                statement = statement.on_conflict_do_update(
+                    index_elements=[MerchantCategory.merchant_name],
+                    set_={
+                        "categories": statement.excluded.categories,
+                        "aliases": statement.excluded.aliases,
+                        "accepted_networks": statement.excluded.accepted_networks,
+                    }
+                )
+                # One parameter list: SQLAlchemy renders it as multi-row VALUES
+                self.db.execute(statement, rows)
+            else:
+                # No portable upsert: replace the batch's rows in one transaction
+                names = [row["merchant_name"] for row in rows]
+                self.db.query(MerchantCategory).filter(
+                    MerchantCategory.merchant_name.in_(names)
+                ).delete(synchronize_session=False)
+                self.db.execute(insert(MerchantCategory), rows)
+            revision = record_catalog_change(self.db)
+            self.db.commit()
+        except Exception:
+            self.db.rollback()
+            raise
+        return revision
@@ -0,0 +1,616 @@
+"""Process-wide merchant index shared by all requests."""
+
+import asyncio
+import copy
+import json
+import math
+import mmap
+import os
+import pickle
+import re
+import struct
+import threading
+import time
+import uuid
+import weakref
+from bisect import bisect_right
+from typing import Dict, FrozenSet, Iterable, Iterator, List, Optional, Tuple
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from app.config.settings import settings
+from app.models import CatalogVersion, MerchantCategory
+from app.services.aho_corasick import AhoCorasick
+from app.services.trigram_index import TrigramIndex
+
+# Separates keys in the joined containment-search string; never part of a key
+_KEY_SEPARATOR = "\n"
+
+# Word tier: only tokens longer than this carry meaning
+MIN_TOKEN_LENGTH = 4
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+# catalog_versions row of the merchant catalog
+MERCHANT_CATALOG = MerchantCategory.__tablename__
+
+# (stored version, random revision token) of a catalog
+CatalogRevision = Tuple[int, str]
+
+# Snapshot file layout: magic, 4-byte header length, JSON header, pickled index
+_SNAPSHOT_MAGIC = b"MERCHIDX4"
+_SNAPSHOT_HEADER = struct.Struct("<I")
+
+
+def tokenize(text: str) -> List[str]:
+    """Split normalized text into meaningful lowercase tokens."""
+    return [t for t in _TOKEN_PATTERN.findall(text) if len(t) >= MIN_TOKEN_LENGTH]
+
+
+class KeyLayer:
+    """
+    Substring, token and trigram structures over one set of lookup keys.
+
+    A MerchantIndex searches a base layer built from the whole catalog plus,
+    after incremental updates, a small delta layer holding only the changed
+    keys. Layers are never mutated; keys since removed from the catalog are
+    filtered out at lookup time.
+    """
+
+    def __init__(self, keys: Iterable[str]):
+        keys = sorted(set(keys))
+        self.size = len(keys)
+
+        # Keys contained in a query: one automaton pass over the query
+        self.automaton = AhoCorasick(keys)
+
+        # Queries contained in a key: one C-level str.find scan over all keys
+        joinable = [k for k in keys if k and _KEY_SEPARATOR not in k]
+        self._joined_keys = _KEY_SEPARATOR.join(joinable)
+        self._joined_order = joinable
+        self._joined_offsets = []
+        offset = 0
+        for key in joinable:
+            self._joined_offsets.append(offset)
+            offset += len(key) + len(_KEY_SEPARATOR)
+
+        # Token -> keys inverted index (posting lists come out sorted)
+        self.token_index: Dict[str, List[str]] = {}
+        self.key_token_counts: Dict[str, int] = {}
+        for key in keys:
+            tokens = set(tokenize(key))
+            self.key_token_counts[key] = len(tokens)
+            for token in tokens:
+                self.token_index.setdefault(token, []).append(key)
+
+        self.trigram_index = TrigramIndex(keys)
+
+    def containing_keys(self, text: str) -> Iterator[str]:
+        """Yield every key that contains text, in alphabetical order."""
+        if not text or _KEY_SEPARATOR in text:
+            return
+
+        position = self._joined_keys.find(text)
+        while position != -1:
+            slot = bisect_right(self._joined_offsets, position) - 1
+            key = self._joined_order[slot]
+            yield key
+            # Skip to the next key; later hits in this key add nothing
+            position = self._joined_keys.find(text, self._joined_offsets[slot] + len(key) + 1)
+
+
+class MerchantIndex:
+    """
+    Immutable lookup tables built from the merchant_categories table.
+
+    One instance is shared by every request in a worker process, so the
+    structures here must never be mutated after construction; with_changes()
+    returns a new index instead.
+    """
+
+    # Fold the delta layer into the base once it holds this share of all keys
+    COMPACTION_RATIO = 0.1
+
+    def __init__(self, merchants: Iterable[MerchantCategory], version: int):
+        self.version = version
+        # Stored catalog revision the index reflects (see read_catalog_revision)
+        self.revision: Optional[CatalogRevision] = None
+        self.merchant_map: Dict[str, List[str]] = {}
+        self.canonical_names: Dict[str, str] = {}
+        # Canonical merchant -> accepted networks; absent means all networks accepted
+        self.accepted_networks: Dict[str, FrozenSet[str]] = {}
+        # Canonical merchant -> every key it registered (name and aliases)
+        self._merchant_keys: Dict[str, List[str]] = {}
+
+        for merchant in merchants:
+            self._add_merchant(merchant)
+
+        self.layers: List[KeyLayer] = [KeyLayer(self.merchant_map)]
+        self._delta_keys: FrozenSet[str] = frozenset()
+
+    def _add_merchant(self, merchant: MerchantCategory) -> List[str]:
+        """Register a merchant's name and aliases; returns the keys added."""
+        normalized_name = merchant.merchant_name.lower().strip()
+        keys = [normalized_name]
+        # Add aliases if they exist
+        if merchant.aliases:
+            keys.extend(alias.lower().strip() for alias in merchant.aliases)
+
+        for key in keys:
+            self.merchant_map[key] = merchant.categories
+            self.canonical_names[key] = normalized_name
+        self._merchant_keys[normalized_name] = keys
+
+        if merchant.accepted_networks:
+            self.accepted_networks[normalized_name] = frozenset(
+                network.lower() for network in merchant.accepted_networks
+            )
+        return keys
+
+    def _remove_merchant(self, canonical_name: str):
+        """Drop a merchant's keys, leaving keys another merchant has since claimed."""
+        for key in self._merchant_keys.pop(canonical_name, ()):
+            if self.canonical_names.get(key) == canonical_name:
+                del self.merchant_map[key]
+                del self.canonical_names[key]
+        self.accepted_networks.pop(canonical_name, None)
+
+    def with_changes(self, merchants: Iterable[MerchantCategory], version: int) -> "MerchantIndex":
+        """
+        Return a new index with merchants added or replaced.
+
+        The lookup dicts are copied, but only the changed keys are indexed:
+        they go into a delta layer searched alongside the existing base
+        layer, which is shared with this index as-is. Once the delta passes
+        COMPACTION_RATIO of the catalog, everything is rebuilt into a single
+        layer from memory.
+        """
+        index = copy.copy(self)
+        index.version = version
+        index.merchant_map = dict(self.merchant_map)
+        index.canonical_names = dict(self.canonical_names)
+        index.accepted_networks = dict(self.accepted_networks)
+        index._merchant_keys = dict(self._merchant_keys)
+
+        changed = set(self._delta_keys)
+        for merchant in merchants:
+            index._remove_merchant(merchant.merchant_name.lower().strip())
+            changed.update(index._add_merchant(merchant))
+
+        delta = frozenset(key for key in changed if key in index.merchant_map)
+        if len(delta) > self.COMPACTION_RATIO * len(index.merchant_map):
+            index.layers = [KeyLayer(index.merchant_map)]
+            index._delta_keys = frozenset()
+        else:
+            index.layers = [self.layers[0], KeyLayer(delta)]
+            index._delta_keys = delta
+        return index
+
+    def longest_contained_key(self, text: str) -> Optional[str]:
+        """
+        Return the longest key that appears inside text.
+
+        Ties go to the earliest occurrence, then alphabetically.
+        """
+        if len(self.layers) == 1:
+            return self.layers[0].automaton.longest_match(text)
+
+        best = None
+        best_rank = None
+        for layer in self.layers:
+            for start, key in layer.automaton.find_all(text):
+                rank = (-len(key), start, key)
+                if key in self.merchant_map and (best_rank is None or rank < best_rank):
+                    best, best_rank = key, rank
+        return best
+
+    def shortest_containing_key(self, text: str) -> Optional[str]:
+        """Return the shortest key that contains text (alphabetical on ties)."""
+        best = None
+        for layer in self.layers:
+            for key in layer.containing_keys(text):
+                if key in self.merchant_map and (best is None or (len(key), key) < (len(best), best)):
+                    best = key
+        return best
+
+    def best_token_match(self, text: str) -> Optional[str]:
+        """
+        Return the key sharing the most token weight with text.
+
+        Rare tokens weigh more (IDF). Ties go to the key with fewer tokens
+        (the query covers more of it), then alphabetically.
+        """
+        total_keys = max(len(self.merchant_map), 1)
+        scores: Dict[str, float] = {}
+        for token in set(tokenize(text)):
+            if len(self.layers) == 1:
+                keys = self.layers[0].token_index.get(token)
+            else:
+                keys = {
+                    key
+                    for layer in self.layers
+                    for key in layer.token_index.get(token, ())
+                    if key in self.merchant_map
+                }
+            if not keys:
+                continue
+            weight = math.log(1 + total_keys / len(keys))
+            for key in keys:
+                scores[key] = scores.get(key, 0.0) + weight
+
+        if not scores:
+            return None
+        return min(scores, key=lambda k: (-scores[k], self._key_token_count(k), k))
+
+    def _key_token_count(self, key: str) -> int:
+        """Number of distinct tokens in an indexed key, newest layer first."""
+        for layer in reversed(self.layers):
+            count = layer.key_token_counts.get(key)
+            if count is not None:
+                return count
+        return 0
+
+    def closest_key(self, text: str) -> Optional[str]:
+        """Return the key closest to a misspelled name, within a bounded edit distance."""
+        if len(self.layers) == 1:
+            return self.layers[0].trigram_index.search(text)
+
+        best = None
+        for layer in self.layers:
+            found = layer.trigram_index.search_ranked(text, accept=self.merchant_map.__contains__)
+            if found is not None and (best is None or found < best):
+                best = found
+        return best[1] if best else None
+
+    def canonical_name(self, merchant_name: str) -> str:
+        """Resolve a merchant name or alias to its canonical merchant name."""
+        normalized = merchant_name.lower().strip()
+        return self.canonical_names.get(normalized, normalized)
+
+    def networks_for(self, canonical_name: str) -> Optional[FrozenSet[str]]:
+        """Return the networks a merchant accepts, or None if unrestricted."""
+        return self.accepted_networks.get(canonical_name)
+
+    @classmethod
+    def from_db(cls, db: Session, version: int) -> "MerchantIndex":
+        """Build an index from every merchant row in the database."""
+        return cls(db.query(MerchantCategory).all(), version)
+
+    def save_snapshot(self, path: str, fingerprint: CatalogRevision):
+        """
+        Write the fully built index to path.
+
+        The file is written next to path and renamed into place, so workers
+        reading the old snapshot never see a partial file.
+        """
+        header = json.dumps({"fingerprint": list(fingerprint)}).encode()
+        payload = pickle.dumps(self, protocol=pickle.HIGHEST_PROTOCOL)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, "wb") as snapshot:
+            snapshot.write(_SNAPSHOT_MAGIC)
+            snapshot.write(_SNAPSHOT_HEADER.pack(len(header)))
+            snapshot.write(header)
+            snapshot.write(payload)
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load_snapshot(
+        cls,
+        path: str,
+        fingerprint: CatalogRevision,
+        version: int
+    ) -> Optional["MerchantIndex"]:
+        """
+        Load an index written by save_snapshot, or None if missing or stale.
+
+        The file is memory-mapped, so its pages come from the shared OS page
+        cache and the header can be checked without reading the payload.
+        Only load snapshots this service wrote itself: the payload is a pickle.
+        """
+        try:
+            with open(path, "rb") as snapshot, \
+                    mmap.mmap(snapshot.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                offset = len(_SNAPSHOT_MAGIC)
+                if mapped[:offset] != _SNAPSHOT_MAGIC:
+                    return None
+                (header_length,) = _SNAPSHOT_HEADER.unpack_from(mapped, offset)
+                offset += _SNAPSHOT_HEADER.size
+                header = json.loads(mapped[offset:offset + header_length])
+                if tuple(header["fingerprint"]) != tuple(fingerprint):
+                    return None
+
+                view = memoryview(mapped)[offset + header_length:]
+                try:
+                    index = pickle.loads(view)
+                finally:
+                    view.release()
+        except (OSError, ValueError, KeyError, struct.error, pickle.UnpicklingError, EOFError):
+            return None
+
+        if not isinstance(index, cls):
+            return None
+        index.version = version
+        index.revision = tuple(fingerprint)
+        return index
+
+    def __len__(self) -> int:
+        return len(self.merchant_map)
+
+
+# Shared index state for this worker process. _catalog_version is local: it
+# moves on every catalog change seen here, whether written by this process
+# or found in catalog_versions (written by another one).
+_catalog_version = 0
+_index: Optional[MerchantIndex] = None
+_revision_checked_at = -math.inf
+_index_lock = threading.Lock()  # Guards the state above; only held briefly
+_build_lock = threading.Lock()  # One sync rebuild at a time
+# One rebuild lock per event loop: coroutines share the loop's thread, so
+# they must never wait on _build_lock for each other
+_async_rebuild_locks: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Lock]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def _catalog_revision_query():
+    return select(CatalogVersion.version, CatalogVersion.revision).where(CatalogVersion.name == MERCHANT_CATALOG)
+
+
+def read_catalog_revision(db: Session) -> Optional[CatalogRevision]:
+    """Return the stored (version, revision) of the merchant catalog, or None if never stamped."""
+    row = db.execute(_catalog_revision_query()).first()
+    return (row.version, row.revision) if row else None
+
+
+async def read_catalog_revision_async(db: AsyncSession) -> Optional[CatalogRevision]:
+    """Async counterpart of read_catalog_revision."""
+    row = (await db.execute(_catalog_revision_query())).first()
+    return (row.version, row.revision) if row else None
+
+
+def record_catalog_change(db: Session) -> CatalogRevision:
+    """
+    Stamp a new merchant catalog revision in the session's transaction.
+
+    Every write to merchant_categories must call this before committing,
+    so workers in other processes see the change (bump_catalog_version()
+    only reaches this one). The version is incremented in place, so
+    concurrent writers never hand out the same one.
+
+    Returns:
+        The new (version, revision)
+    """
+    revision = uuid.uuid4().hex
+    updated = db.execute(
+        update(CatalogVersion)
+        .where(CatalogVersion.name == MERCHANT_CATALOG)
+        .values(version=CatalogVersion.version + 1, revision=revision)
+    ).rowcount
+    if not updated:
+        db.add(CatalogVersion(name=MERCHANT_CATALOG, version=1, revision=revision))
+        db.flush()
+    return read_catalog_revision(db)
+
+
+def catalog_fingerprint(db: Session) -> Optional[CatalogRevision]:
+    """
+    Identity of the merchant catalog: its stored (version, revision).
+
+    Writers stamp a new revision with every change (record_catalog_change),
+    so in-place upserts, alias or category edits and reseeds all change it,
+    and comparing it costs one primary-key read however large the catalog
+    is. None if the catalog was never stamped.
+    """
+    return read_catalog_revision(db)
+
+
+def load_merchant_index(db: Session, version: int) -> MerchantIndex:
+    """
+    Build the index for a catalog version, going through the snapshot file if configured.
+
+    A snapshot matching the catalog fingerprint is loaded instead of building
+    merchant objects and rebuilding the automaton, token and trigram tables.
+    Otherwise the index is built from the database and written out
+    for the next worker to boot from. The fingerprint is read before the
+    rows, so a write landing mid-build leaves the index outdated, not
+    mislabeled.
+    """
+    fingerprint = catalog_fingerprint(db)
+    path = settings.MERCHANT_INDEX_SNAPSHOT_PATH
+    index = None
+    if path and fingerprint is not None:
+        index = MerchantIndex.load_snapshot(path, fingerprint, version)
+    if index is None:
+        index = MerchantIndex.from_db(db, version)
+        if path and fingerprint is not None:
+            _write_snapshot(index, path, fingerprint)
+    index.revision = fingerprint
+    return index
+
+
+def _write_snapshot(index: MerchantIndex, path: str, fingerprint: CatalogRevision):
+    """Save a snapshot, logging rather than failing if the file cannot be written."""
+    try:
+        index.save_snapshot(path, fingerprint)
+    except OSError as e:
+        print(f"⚠️  Could not write merchant index snapshot: {e}")
+
+
+def get_catalog_version() -> int:
+    """Return the current merchant catalog version."""
+    return _catalog_version
+
+
+def bump_catalog_version() -> int:
+    """
+    Mark the merchant catalog as changed in this process.
+
+    Call this after any write to merchant_categories; the shared index is
+    rebuilt lazily on the next lookup. Other processes notice the write
+    through record_catalog_change(), within MERCHANT_CATALOG_CHECK_SECONDS.
+    """
+    global _catalog_version
+    with _index_lock:
+        _catalog_version += 1
+        return _catalog_version
+
+
+def apply_catalog_changes(
+    db: Session,
+    merchants: Iterable[MerchantCategory],
+    revisions: List[CatalogRevision]
+) -> MerchantIndex:
+    """
+    Publish a new shared index with changed merchant rows folded in.
+
+    Call this after committing upserts to merchant_categories when the
+    changed rows are known, instead of bump_catalog_version(). revisions
+    are the ones record_catalog_change() returned for those commits, in
+    order. The new index is derived from the current one via
+    with_changes(), without rereading the table, and is built outside the
+    lock so lookups keep using the previous index until it is swapped in.
+    Without a current index it is built from the table instead.
+    """
+    global _index, _catalog_version
+    # No revision check here: it would find these very writes and rebuild
+    current = current_merchant_index()
+    if current is None:
+        # Nothing to fold the changes into (e.g. a fresh import process):
+        # build once from the table, which already holds them
+        bump_catalog_version()
+        return get_merchant_index(db)
+    updated = current.with_changes(merchants, current.version)
+    # Only our own writes landed since the current index was built, so the
+    # updated index reflects the last of them
+    base_version = current.revision[0] if current.revision else 0
+    consecutive = [version for version, _ in revisions] == list(
+        range(base_version + 1, base_version + 1 + len(revisions))
+    )
+    updated.revision = revisions[-1] if revisions else current.revision
+
+    with _index_lock:
+        stale = _index is not current or current.version != _catalog_version or not consecutive
+        _catalog_version += 1
+        if stale:
+            # The catalog changed underneath us; fall back to a lazy full rebuild
+            return updated
+        updated.version = _catalog_version
+        _index = updated
+
+    if settings.MERCHANT_INDEX_SNAPSHOT_PATH and updated.revision is not None:
+        _write_snapshot(updated, settings.MERCHANT_INDEX_SNAPSHOT_PATH, updated.revision)
+    return updated
+
+
+def current_merchant_index() -> Optional[MerchantIndex]:
+    """Return the shared merchant index if it is up to date, without building it."""
+    index = _index
+    if index is not None and index.version == _catalog_version:
+        return index
+    return None
+
+
+def _revision_check_due() -> bool:
+    """Whether MERCHANT_CATALOG_CHECK_SECONDS have passed since catalog_versions was last read."""
+    return time.monotonic() - _revision_checked_at >= settings.MERCHANT_CATALOG_CHECK_SECONDS
+
+
+def _note_catalog_revision(revision: Optional[CatalogRevision]):
+    """Record a catalog_versions read; a revision the shared index lacks outdates it."""
+    global _catalog_version, _revision_checked_at
+    with _index_lock:
+        _revision_checked_at = time.monotonic()
+        if _index is not None and _index.version == _catalog_version and _index.revision != revision:
+            _catalog_version += 1
+
+
+def _publish(index: MerchantIndex):
+    """Make a freshly built index the shared one, unless the catalog moved on while it was built."""
+    global _index, _revision_checked_at
+    with _index_lock:
+        if index.version == _catalog_version:
+            _index = index
+            _revision_checked_at = time.monotonic()
+
+
+def get_merchant_index(db: Session) -> MerchantIndex:
+    """
+    Return the shared merchant index, building it if the catalog changed.
+
+    The current index is returned without touching the database, except
+    for one catalog_versions read every MERCHANT_CATALOG_CHECK_SECONDS.
+    The table itself is only read when no index exists yet or the catalog
+    version has moved since the index was built.
+    """
+    index = current_merchant_index()
+    if index is not None:
+        if not _revision_check_due():
+            return index
+        _note_catalog_revision(read_catalog_revision(db))
+        index = current_merchant_index()
+        if index is not None:
+            return index
+
+    with _build_lock:
+        # Another thread may have rebuilt while we waited for the lock
+        index = current_merchant_index()
+        if index is None:
+            index = load_merchant_index(db, _catalog_version)
+            _publish(index)
+        return index
+
+
+async def get_merchant_index_async(db: AsyncSession) -> MerchantIndex:
+    """
+    Async counterpart of get_merchant_index for async sessions.
+
+    A current index is returned without touching the session. Otherwise
+    one coroutine per event loop rebuilds while the others wait on an
+    asyncio lock: the catalog is read with awaited queries, and the
+    snapshot load or index build runs in the threadpool, so the event
+    loop never stalls on it or on the sync build lock.
+    """
+    index = current_merchant_index()
+    if index is not None:
+        if not _revision_check_due():
+            return index
+        _note_catalog_revision(await read_catalog_revision_async(db))
+        index = current_merchant_index()
+        if index is not None:
+            return index
+
+    lock = _async_rebuild_locks.setdefault(asyncio.get_running_loop(), asyncio.Lock())
+    async with lock:
+        index = current_merchant_index()
+        if index is not None:
+            return index
+
+        version = _catalog_version
+        fingerprint = await read_catalog_revision_async(db)
+        path = settings.MERCHANT_INDEX_SNAPSHOT_PATH
+        if path and fingerprint is not None:
+            index = await run_in_threadpool(MerchantIndex.load_snapshot, path, fingerprint, version)
+        if index is None:
+            # Plain rows, not ORM objects: MerchantIndex only reads these columns
+            merchants = (await db.execute(select(
+                MerchantCategory.merchant_name,
+                MerchantCategory.categories,
+                MerchantCategory.aliases,
+                MerchantCategory.accepted_networks
+            ))).all()
+            index = await run_in_threadpool(_build_index, merchants, version, fingerprint)
+        index.revision = fingerprint
+        _publish(index)
+        return index
+
+
+def _build_index(
+    merchants: Iterable[MerchantCategory],
+    version: int,
+    fingerprint: Optional[CatalogRevision]
+) -> MerchantIndex:
+    """Build an index from loaded merchant rows and snapshot it if configured."""
+    index = MerchantIndex(merchants, version)
+    if settings.MERCHANT_INDEX_SNAPSHOT_PATH and fingerprint is not None:
+        _write_snapshot(index, settings.MERCHANT_INDEX_SNAPSHOT_PATH, fingerprint)
+    return index
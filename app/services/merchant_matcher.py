@@ -1,80 +1,245 @@
 """Merchant matching service to identify categories from merchant names."""
 
-from typing import List, Dict
+import threading
+from dataclasses import dataclass, replace
+from typing import FrozenSet, List, Optional
 from sqlalchemy.orm import Session
-from app.models import MerchantCategory
+from app.config.constants import MCC_CATEGORIES, MCC_CATEGORY_RANGES
+from app.config.settings import settings
+from app.core.cache import LRUCache
+from app.services.descriptor_normalizer import descriptor_normalizer
+from app.services.merchant_index import MerchantIndex, get_merchant_index
+
+# Match tiers, in the order they are tried
+MATCH_TIER_MCC = "mcc"  # Categorized by merchant category code; name tiers skipped
+MATCH_TIER_EXACT = "exact"
+MATCH_TIER_SUBSTRING = "substring"
+MATCH_TIER_WORD = "word"
+MATCH_TIER_FUZZY = "fuzzy"
+MATCH_TIER_NONE = "none"
+
+# Tiers trusted to name the merchant itself, so its network restrictions
+# apply. A word or typo match may be a different store (BJ's Wholesale Club
+# vs. Costco), and refusing a card there would drop every other result.
+NETWORK_RESTRICTED_TIERS = frozenset({MATCH_TIER_MCC, MATCH_TIER_EXACT, MATCH_TIER_SUBSTRING})
+
+TIER_CONFIDENCE = {
+    MATCH_TIER_MCC: "high",
+    MATCH_TIER_EXACT: "high",
+    MATCH_TIER_SUBSTRING: "medium",
+    MATCH_TIER_WORD: "low",
+    MATCH_TIER_FUZZY: "fuzzy",
+    MATCH_TIER_NONE: "low",
+}
+
+
+@dataclass(frozen=True)
+class MerchantResolution:
+    """Result of matching one merchant name against the catalog."""
+    merchant_name: str
+    categories: List[str]
+    confidence: str
+    matched_key: Optional[str]
+    match_tier: str
+    canonical_name: str  # Canonical catalog merchant, or the normalized input if unmatched
+    accepted_networks: Optional[FrozenSet[str]] = None  # None means every network is accepted
+
+
+# MCC -> categories, with brand code ranges expanded for a single dict lookup
+_MCC_TABLE = {
+    f"{code:04d}": categories
+    for first, last, categories in MCC_CATEGORY_RANGES
+    for code in range(first, last + 1)
+}
+_MCC_TABLE.update(MCC_CATEGORIES)
+
+
+# Resolutions keyed by normalized name, including "general" fallbacks, for
+# the catalog version in _match_cache_version
+match_cache = LRUCache(maxsize=settings.MATCH_CACHE_MAX_ENTRIES)
+_match_cache_version = -1
+_match_cache_lock = threading.Lock()
+
+
+def _match_cache_for(version: int) -> Optional[LRUCache]:
+    """
+    Return the match cache if it may hold results for this catalog version.
+    
+    The cache is cleared the first time a newer version is seen. Matchers
+    still holding an older index bypass it rather than mixing versions.
+    """
+    global _match_cache_version
+    if version != _match_cache_version:
+        with _match_cache_lock:
+            if version > _match_cache_version:
+                match_cache.clear()
+                _match_cache_version = version
+            elif version < _match_cache_version:
+                return None
+    return match_cache
 
 
 class MerchantMatcher:
     """Matches merchant names to categories using lookup table and fuzzy matching."""
     
-    def __init__(self, db: Session):
+    def __init__(self, db: Optional[Session], index: Optional[MerchantIndex] = None):
         self.db = db
-        self.merchant_map = self._load_merchants()
+        # Shared per-process index; only rebuilt when the catalog version changes.
+        # An explicit index (benchmarks, tools) bypasses the database entirely.
+        self.index = index if index is not None else get_merchant_index(db)
+        self.merchant_map = self.index.merchant_map
     
-    def _load_merchants(self) -> Dict[str, List[str]]:
-        """Load all merchants from database into memory for fast lookup."""
-        merchant_map = {}
-        merchants = self.db.query(MerchantCategory).all()
-        
-        for merchant in merchants:
-            normalized_name = merchant.merchant_name.lower().strip()
-            merchant_map[normalized_name] = merchant.categories
-            
-            # Add aliases if they exist
-            if merchant.aliases:
-                for alias in merchant.aliases:
-                    alias_normalized = alias.lower().strip()
-                    merchant_map[alias_normalized] = merchant.categories
-        
-        return merchant_map
+    def resolve(self, merchant_name: str) -> MerchantResolution:
+        """
+        Match a merchant name once and return everything known about the match.
+        
+        Tiers are tried in order: exact name/alias, substring, shared words
+        (IDF-weighted), then misspellings via the trigram index. Raw statement
+        descriptors are cleaned first ("SQ *STARBUCKS #1234" -> "starbucks").
+        Falls back to ["general"] with low confidence if nothing matches.
+        
+        Results (misses included) are memoized per normalized name in
+        match_cache until the catalog version changes.
+        """
+        resolution = self.resolve_cached(merchant_name)
+        if resolution is not None:
+            return resolution
+        
+        normalized = descriptor_normalizer.normalize(merchant_name)
+        resolution = self._resolve_normalized(merchant_name, normalized)
+        cache = _match_cache_for(self.index.version)
+        if cache is None:
+            return resolution
+        cache.set(normalized, resolution)
+        return replace(resolution, categories=list(resolution.categories))
     
-    def match(self, merchant_name: str) -> List[str]:
+    def resolve_cached(self, merchant_name: str) -> Optional[MerchantResolution]:
         """
-        Match merchant name to categories.
+        Resolve a merchant name only if no match tier has to run.
         
-        Returns list of categories (e.g., ["grocery", "organic"]).
-        Falls back to ["general"] if no match found.
+        Exact names and results memoized in match_cache are returned;
+        otherwise None, and resolve() does the (CPU-bound) tier scans.
+        Async callers use this to keep cache misses off the event loop.
         """
-        normalized = merchant_name.lower().strip()
+        plain = merchant_name.lower().strip()
         
-        # Try exact match first
+        # Try exact match first, on the name as given
+        if plain in self.merchant_map:
+            return self._resolution(merchant_name, plain, MATCH_TIER_EXACT)
+        
+        cache = _match_cache_for(self.index.version)
+        if cache is None:
+            return None
+        
+        cached = cache.get(descriptor_normalizer.normalize(merchant_name))
+        if cached is None:
+            return None
+        if cached.merchant_name != merchant_name:
+            cached = replace(cached, merchant_name=merchant_name)
+        return replace(cached, categories=list(cached.categories))
+    
+    def resolve_mcc(self, merchant_name: str, mcc: str) -> Optional[MerchantResolution]:
+        """
+        Categorize a purchase by its merchant category code, without name matching.
+        
+        The name is only used for a direct canonical lookup, so exact-name
+        merchant offers and network restrictions still apply. Returns None
+        for codes not in the MCC table.
+        """
+        categories = _MCC_TABLE.get(mcc)
+        if categories is None:
+            return None
+        
+        canonical_name = self.index.canonical_name(merchant_name)
+        return MerchantResolution(
+            merchant_name=merchant_name,
+            categories=list(categories),
+            confidence=TIER_CONFIDENCE[MATCH_TIER_MCC],
+            matched_key=None,
+            match_tier=MATCH_TIER_MCC,
+            canonical_name=canonical_name,
+            accepted_networks=self.index.networks_for(canonical_name)
+        )
+    
+    def offer_key(self, merchant_name: str) -> str:
+        """
+        Return the canonical merchant that offers on merchant_name are filed under.
+        
+        Offer names go through the same normalizer, alias and substring tiers
+        as purchase queries, so an offer on "Starbucks Coffee" is found by a
+        query for "Starbucks". Word and typo matches are too loose to attach
+        an offer to another merchant; those names keep their normalized form.
+        """
+        resolution = self.resolve(merchant_name)
+        if resolution.match_tier in (MATCH_TIER_EXACT, MATCH_TIER_SUBSTRING):
+            return resolution.canonical_name
+        return descriptor_normalizer.normalize(merchant_name)
+    
+    def _resolve_normalized(self, merchant_name: str, normalized: str) -> MerchantResolution:
+        """Run the match tiers for a cleaned descriptor."""
         if normalized in self.merchant_map:
-            return self.merchant_map[normalized]
+            return self._resolution(merchant_name, normalized, MATCH_TIER_EXACT)
+        
+        # Try fuzzy match (substring matching): the most specific known key
+        # inside the name, else the closest key that contains the name
+        if normalized:
+            key = (
+                self.index.longest_contained_key(normalized)
+                or self.index.shortest_containing_key(normalized)
+            )
+            if key:
+                return self._resolution(merchant_name, key, MATCH_TIER_SUBSTRING)
         
-        # Try fuzzy match (substring matching)
-        for key, categories in self.merchant_map.items():
-            if normalized in key or key in normalized:
-                return categories
+        # Try partial word match: best shared-token score via the inverted index
+        key = self.index.best_token_match(normalized)
+        if key:
+            return self._resolution(merchant_name, key, MATCH_TIER_WORD)
         
-        # Try partial word match
-        words = normalized.split()
-        for word in words:
-            if len(word) > 3:  # Only match meaningful words
-                for key, categories in self.merchant_map.items():
-                    if word in key:
-                        return categories
+        # Try typo-tolerant match (only once every other tier has missed)
+        key = self.index.closest_key(normalized)
+        if key:
+            return self._resolution(merchant_name, key, MATCH_TIER_FUZZY)
         
         # Default fallback
-        return ["general"]
+        return MerchantResolution(
+            merchant_name=merchant_name,
+            categories=["general"],
+            confidence=TIER_CONFIDENCE[MATCH_TIER_NONE],
+            matched_key=None,
+            match_tier=MATCH_TIER_NONE,
+            canonical_name=normalized
+        )
+    
+    def _resolution(self, merchant_name: str, key: str, tier: str) -> MerchantResolution:
+        """
+        Build a resolution for a matched index key.
+        
+        Network restrictions only come with NETWORK_RESTRICTED_TIERS matches.
+        """
+        canonical_name = self.index.canonical_names[key]
+        return MerchantResolution(
+            merchant_name=merchant_name,
+            categories=list(self.merchant_map[key]),
+            confidence=TIER_CONFIDENCE[tier],
+            matched_key=key,
+            match_tier=tier,
+            canonical_name=canonical_name,
+            accepted_networks=(
+                self.index.networks_for(canonical_name) if tier in NETWORK_RESTRICTED_TIERS else None
+            )
+        )
+    
+    def match(self, merchant_name: str) -> List[str]:
+        """
+        Match merchant name to categories.
+        
+        Returns list of categories (e.g., ["grocery", "organic"]).
+        Falls back to ["general"] if no match found.
+        """
+        return list(self.resolve(merchant_name).categories)
     
     def get_confidence(self, merchant_name: str) -> str:
         """
         Return confidence level of the match.
         """
-        normalized = merchant_name.lower().strip()
-        
-        # Exact match
-        if normalized in self.merchant_map:
-            return "high"
-        
-        # Fuzzy match
-        for key in self.merchant_map.keys():
-            if normalized in key or key in normalized:
-                return "medium"
-        
-        # Partial match or default
-        return "low"
-
-
-
+        return self.resolve(merchant_name).confidence
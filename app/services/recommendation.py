@@ -1,31 +1,77 @@
 """Core recommendation engine for credit card selection."""
 
-from typing import List, Optional
+import heapq
+from typing import Dict, FrozenSet, List, Optional, Tuple, Union
 from datetime import date, datetime
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from dataclasses import dataclass
+from fastapi.concurrency import run_in_threadpool
 
-from app.models import Customer, CreditCard, CategoryBonus, Offer, MerchantCategory
-from app.schemas import CardRecommendation
-from app.services.merchant_matcher import MerchantMatcher
+from app.config.settings import settings
+from app.models import CreditCard
+from app.database import READ_FROM_REPLICA, READ_YOUR_WRITES
+from app.repositories.async_repository import AsyncCardRepository
+from app.repositories.card_repository import CardRepository
+from app.schemas import CardRecommendation, BatchRecommendationItem
+from app.services.descriptor_normalizer import descriptor_normalizer
+from app.services.merchant_index import MerchantIndex, get_merchant_index_async
+from app.services.merchant_matcher import MerchantMatcher, MerchantResolution
+from app.services.scoring_kernel import WalletKernel
+from app.services.wallet import (
+    BonusInterval, CompiledCard, OfferEntry, compile_wallet, store_wallet, template_cache, wallet_cache,
+    wallet_generation
+)
 
 
 @dataclass
 class CardScore:
-    """Internal scoring result for a credit card."""
-    card: CreditCard
+    """
+    Internal scoring result for a credit card.
+    
+    Numeric only; display text is built afterwards, and only for the
+    cards that are actually returned.
+    """
+    card: CompiledCard
     reward_rate: float
     reward_value: float
-    reason: str
+    earning_rate: float  # Rate before the points multiplier, as shown to the user
     categories_matched: List[str]
+    matched_category: Optional[str] = None
+    offer: Optional[OfferEntry] = None
+
+
+@dataclass
+class BatchItemResult:
+    """Recommendations and merchant match for one item of a batch request."""
+    recommendations: List[CardRecommendation]
+    resolution: MerchantResolution
+
+
+# _generate_comparison looks at up to 4 ranked cards, so at least this many are selected
+COMPARISON_DEPTH = 4
 
 
 class RecommendationEngine:
     """Engine to score and rank credit cards for purchase recommendations."""
     
-    def __init__(self, db: Session):
+    def __init__(self, db: Optional[Session], merchant_index: Optional[MerchantIndex] = None):
         self.db = db
-        self.merchant_matcher = MerchantMatcher(db)
+        self.async_db: Optional[AsyncSession] = None
+        self.merchant_matcher = MerchantMatcher(db, index=merchant_index)
+        self.card_repository = CardRepository(db)
+    
+    @classmethod
+    async def from_async_session(cls, db: AsyncSession) -> "RecommendationEngine":
+        """
+        Build an engine for async routes.
+        
+        The shared merchant index is used as-is when it is current; only a
+        rebuild reads the catalog, through the async session.
+        """
+        engine = cls(None, merchant_index=await get_merchant_index_async(db))
+        engine.async_db = db
+        return engine
     
     def recommend(
         self,
@@ -33,7 +79,8 @@ class RecommendationEngine:
         merchant_name: str,
         purchase_amount: Optional[float] = None,
         top_n: int = 1,
-        transaction_date: Optional[date] = None
+        transaction_date: Optional[date] = None,
+        mcc: Optional[str] = None
     ) -> List[CardRecommendation]:
         """
         Generate top N credit card recommendations for a purchase.
@@ -44,59 +91,344 @@ class RecommendationEngine:
             purchase_amount: Purchase amount in dollars (optional)
             top_n: Number of recommendations to return
             transaction_date: Date of transaction (defaults to today)
+            mcc: Merchant category code (optional); when known, categories
+                come from the MCC table and name matching is skipped
         
         Returns:
             List of CardRecommendation objects, sorted by reward value (or rate if no amount)
         """
-        if transaction_date is None:
-            transaction_date = date.today()
+        recommendations, _ = self.recommend_with_resolution(
+            customer_id=customer_id,
+            merchant_name=merchant_name,
+            purchase_amount=purchase_amount,
+            top_n=top_n,
+            transaction_date=transaction_date,
+            mcc=mcc
+        )
+        return recommendations
+    
+    def recommend_with_resolution(
+        self,
+        customer_id: str,
+        merchant_name: str,
+        purchase_amount: Optional[float] = None,
+        top_n: int = 1,
+        transaction_date: Optional[date] = None,
+        mcc: Optional[str] = None
+    ) -> Tuple[List[CardRecommendation], Optional[MerchantResolution]]:
+        """
+        Generate recommendations along with the merchant resolution used to score them.
         
+        The merchant is matched exactly once; callers that report merchant
+        info should use the returned resolution instead of matching again.
+        The resolution is None when the customer has no cards.
+        """
         # 1. Get customer and their cards
-        customer = self.db.query(Customer).filter(Customer.id == customer_id).first()
-        if not customer or not customer.cards:
-            return []
+        wallet = self._load_wallet(customer_id)
+        if not wallet:
+            return [], None
+        return self._recommend_for_wallet(
+            wallet, merchant_name, purchase_amount, top_n, transaction_date, mcc
+        )
+    
+    async def recommend_with_resolution_async(
+        self,
+        customer_id: str,
+        merchant_name: str,
+        purchase_amount: Optional[float] = None,
+        top_n: int = 1,
+        transaction_date: Optional[date] = None,
+        mcc: Optional[str] = None
+    ) -> Tuple[List[CardRecommendation], Optional[MerchantResolution]]:
+        """
+        Async counterpart of recommend_with_resolution for engines built with from_async_session().
+        
+        The wallet load awaits the database. Compiling a freshly loaded
+        wallet (its offer names go through the match tiers) and matching a
+        merchant that is not an exact name or already memoized both run in
+        the threadpool, in one call on a wallet cache miss, so neither
+        stalls the event loop; scoring runs in memory as on the sync path.
+        """
+        wallet = self._cached_wallet(customer_id)
+        resolution = self._resolve_without_tiers(merchant_name, mcc)
+        if wallet is None:
+            generation = wallet_generation(customer_id)
+            repository = AsyncCardRepository(self.async_db)
+            cards = await repository.get_wallet(customer_id)
+            templates, missing = self._cached_templates(cards)
+            template_cards = await repository.get_templates(missing) if missing else []
+            wallet, resolution = await run_in_threadpool(
+                self._compile_loaded_wallet,
+                customer_id, cards, templates, template_cards, generation, merchant_name, resolution
+            )
+        elif wallet and resolution is None:
+            resolution = await run_in_threadpool(self.merchant_matcher.resolve, merchant_name)
+        if not wallet:
+            return [], None
+        
+        return self._recommend_for_wallet(
+            wallet, merchant_name, purchase_amount, top_n, transaction_date, mcc, resolution
+        )
+    
+    def _compile_loaded_wallet(
+        self,
+        customer_id: str,
+        cards: List[CreditCard],
+        templates: Dict[str, CompiledCard],
+        template_cards: List[CreditCard],
+        generation: int,
+        merchant_name: str,
+        resolution: Optional[MerchantResolution]
+    ) -> Tuple[List[CompiledCard], Optional[MerchantResolution]]:
+        """
+        Compile and cache a loaded wallet, then resolve the merchant if still needed.
+        
+        Called in the threadpool by the async path; templates holds the
+        cached compiled templates and template_cards the ones just loaded.
+        """
+        if template_cards:
+            templates.update(template_cache.store(template_cards, self.merchant_matcher.index, self._cache_ttl()))
+        wallet = self._store_wallet(customer_id, cards, templates, generation)
+        if wallet and resolution is None:
+            resolution = self.merchant_matcher.resolve(merchant_name)
+        return wallet, resolution
+    
+    def _recommend_for_wallet(
+        self,
+        wallet: List[CompiledCard],
+        merchant_name: str,
+        purchase_amount: Optional[float],
+        top_n: int,
+        transaction_date: Optional[date],
+        mcc: Optional[str],
+        resolution: Optional[MerchantResolution] = None
+    ) -> Tuple[List[CardRecommendation], MerchantResolution]:
+        """Match the merchant (unless already resolved) and rank an already loaded wallet."""
+        # 2. Identify merchant categories and accepted networks (both from the in-memory index),
+        #    straight from the MCC table when the caller knows the code
+        if resolution is None:
+            resolution = self._resolve_without_tiers(merchant_name, mcc)
+        if resolution is None:
+            resolution = self.merchant_matcher.resolve(merchant_name)
+        
+        # 3. Score and rank the wallet
+        recommendations = self._rank_wallet(
+            wallet=wallet,
+            resolution=resolution,
+            purchase_amount=purchase_amount,
+            top_n=top_n,
+            transaction_date=transaction_date
+        )
+        return recommendations, resolution
+    
+    def _resolve_without_tiers(self, merchant_name: str, mcc: Optional[str]) -> Optional[MerchantResolution]:
+        """Resolve from the MCC table, an exact name or the match cache; None if the tiers must run."""
+        resolution = None
+        if mcc:
+            resolution = self.merchant_matcher.resolve_mcc(merchant_name, mcc)
+        if resolution is None:
+            resolution = self.merchant_matcher.resolve_cached(merchant_name)
+        return resolution
+    
+    def recommend_batch(
+        self,
+        customer_id: str,
+        items: List[BatchRecommendationItem],
+        top_n: int = 1
+    ) -> Optional[List[BatchItemResult]]:
+        """
+        Generate recommendations for many purchases by the same customer.
+        
+        The wallet is loaded and compiled once, descriptors are normalized in
+        one bulk pass, and each distinct merchant is matched once no matter
+        how many items reference it. Cards
+        are ranked with a vectorized WalletKernel per transaction date, and
+        only the selected cards go through full scoring and formatting.
+        
+        Args:
+            customer_id: Customer identifier
+            items: Purchases to score, each with merchant, amount and date
+            top_n: Number of recommendations to return per item
+        
+        Returns:
+            One BatchItemResult per item in request order, or None if the
+            customer does not exist or has no cards
+        """
+        wallet = self._load_wallet(customer_id)
+        if not wallet:
+            return None
+        
+        # Clean every descriptor in the statement in one bulk pass
+        normalized_names = descriptor_normalizer.normalize_many(item.merchant_name for item in items)
+        
+        merchants = {}
+        kernels = {}
+        results = []
+        for item, key in zip(items, normalized_names):
+            transaction_date = item.transaction_date or date.today()
+            if transaction_date not in kernels:
+                kernels[transaction_date] = WalletKernel(wallet, transaction_date)
+            
+            if key not in merchants:
+                merchants[key] = self.merchant_matcher.resolve(item.merchant_name)
+            resolution = merchants[key]
+            
+            recommendations = self._rank_wallet(
+                wallet=wallet,
+                resolution=resolution,
+                purchase_amount=item.purchase_amount,
+                top_n=top_n,
+                transaction_date=transaction_date,
+                kernel=kernels[transaction_date]
+            )
+            results.append(BatchItemResult(
+                recommendations=recommendations,
+                resolution=resolution
+            ))
+        
+        return results
+    
+    def _load_wallet(self, customer_id: str) -> List[CompiledCard]:
+        """
+        Return a customer's compiled wallet, from the wallet cache when possible.
+        
+        On a miss the cards are loaded in one eager fetch and compiled on top
+        of their templates. Cached wallets compiled against an older merchant
+        index are recompiled.
+        """
+        wallet = self._cached_wallet(customer_id)
+        if wallet is None:
+            generation = wallet_generation(customer_id)
+            cards = self.card_repository.get_wallet(customer_id)
+            wallet = self._store_wallet(customer_id, cards, self._load_templates(cards), generation)
+        return wallet
+    
+    def _cached_templates(self, cards: List[CreditCard]) -> Tuple[Dict[str, CompiledCard], List[str]]:
+        """Split the templates a wallet references into (compiled from cache, ids to load)."""
+        template_ids = {card.template_id for card in cards if card.template_id}
+        return template_cache.lookup(template_ids, self.merchant_matcher.index)
+    
+    def _load_templates(self, cards: List[CreditCard]) -> Dict[str, CompiledCard]:
+        """Return the compiled templates of cards, loading only those not cached in one query."""
+        templates, missing = self._cached_templates(cards)
+        if missing:
+            templates.update(template_cache.store(
+                self.card_repository.get_templates(missing), self.merchant_matcher.index, self._cache_ttl()
+            ))
+        return templates
+    
+    def _cached_wallet(self, customer_id: str) -> Optional[List[CompiledCard]]:
+        """
+        Return the cached wallet if it was compiled against the current index.
+        
+        Read-your-writes sessions always reload, since the cached wallet may
+        have been loaded from a replica that had not caught up.
+        """
+        session = self._session()
+        if session is not None and session.info.get(READ_YOUR_WRITES):
+            return None
+        cached = wallet_cache.get(customer_id)
+        if cached is not None and cached[0] == self.merchant_matcher.index.version:
+            return cached[1]
+        return None
+    
+    def _store_wallet(
+        self,
+        customer_id: str,
+        cards: List[CreditCard],
+        templates: Dict[str, CompiledCard],
+        generation: int
+    ) -> List[CompiledCard]:
+        """
+        Compile freshly loaded cards and cache the wallet.
+        
+        generation is the wallet_generation() taken before the cards were
+        loaded; if the wallet was invalidated since, the result is used for
+        this request only.
+        """
+        index = self.merchant_matcher.index
+        wallet = compile_wallet(cards, index, templates) if cards else []
+        store_wallet(customer_id, generation, (index.version, wallet), self._cache_ttl())
+        return wallet
+    
+    def _session(self) -> Optional[Union[Session, AsyncSession]]:
+        """Return the session wallets are loaded through."""
+        return self.async_db if self.async_db is not None else self.db
+    
+    def _cache_ttl(self) -> Optional[float]:
+        """
+        Return the TTL for caching what this engine loads, or None for the cache default.
         
-        # 2. Identify merchant categories and accepted networks
-        categories = self.merchant_matcher.match(merchant_name)
-        accepted_networks = self._get_accepted_networks(merchant_name)
+        Data read from a replica may predate a write whose invalidation has
+        already run, so it is cached no longer than the acceptable lag.
+        """
+        session = self._session()
+        if session is not None and session.info.get(READ_FROM_REPLICA):
+            return settings.REPLICA_CACHE_TTL_SECONDS
+        return None
+    
+    def _rank_wallet(
+        self,
+        wallet: List[CompiledCard],
+        resolution: MerchantResolution,
+        purchase_amount: Optional[float],
+        top_n: int,
+        transaction_date: Optional[date],
+        kernel: Optional[WalletKernel] = None
+    ) -> List[CardRecommendation]:
+        """
+        Score a compiled wallet for one purchase and format the top N cards.
         
-        # 3. Filter cards by accepted networks
-        eligible_cards = []
-        rejected_cards = []
-        for card in customer.cards:
-            if self._is_card_accepted(card, accepted_networks):
-                eligible_cards.append(card)
-            else:
-                rejected_cards.append((card, accepted_networks))
+        With a kernel (built for the same wallet and date) the candidates are
+        picked by vectorized scoring first, so only they are scored per card.
+        """
+        if transaction_date is None:
+            transaction_date = date.today()
         
-        if not eligible_cards:
+        # Filter cards by accepted networks
+        eligible = [self._is_card_accepted(card, resolution.accepted_networks) for card in wallet]
+        if not any(eligible):
             return []
         
-        # 4. Score each eligible card (use 100.0 as default for comparison if no amount given)
+        selection_size = max(top_n, COMPARISON_DEPTH)
+        if kernel is not None:
+            rates = kernel.effective_rates(
+                resolution.categories, resolution.canonical_name, resolution.merchant_name
+            )
+            candidates = [wallet[i] for i in kernel.top_indices(rates, selection_size, eligible)]
+        else:
+            candidates = [card for card, accepted in zip(wallet, eligible) if accepted]
+        
+        # Score each candidate card (use 100.0 as default for comparison if no amount given)
         reference_amount = purchase_amount if purchase_amount else 100.0
         scored_cards = []
-        for card in eligible_cards:
+        for card in candidates:
             score = self.calculate_card_score(
                 card=card,
-                merchant_name=merchant_name,
-                categories=categories,
+                merchant_name=resolution.merchant_name,
+                categories=resolution.categories,
                 purchase_amount=reference_amount,
-                transaction_date=transaction_date
+                transaction_date=transaction_date,
+                merchant_key=resolution.canonical_name  # offers are keyed by canonical merchant
             )
             scored_cards.append(score)
         
-        # 4. Sort by reward rate (descending) - rate is what matters without amount
-        scored_cards.sort(key=lambda x: x.reward_rate, reverse=True)
+        # Select the best cards by reward rate (descending) - rate is what matters without amount.
+        # nlargest keeps the stable ordering of a full sort without sorting the whole wallet.
+        ranked_cards = heapq.nlargest(
+            selection_size,
+            scored_cards,
+            key=lambda x: x.reward_rate
+        )
         
-        # 5. Convert to response format
+        # Convert to response format, formatting text only for returned cards
         recommendations = []
-        best_rate = scored_cards[0].reward_rate if scored_cards else 0
         
-        for rank, score in enumerate(scored_cards[:top_n], start=1):
+        for rank, score in enumerate(ranked_cards[:top_n], start=1):
             # Generate comparison text
             comparison = self._generate_comparison(
                 score, 
-                scored_cards, 
+                ranked_cards, 
                 rank, 
                 purchase_amount
             )
@@ -109,7 +441,7 @@ class RecommendationEngine:
                     last_four=score.card.last_four,
                     estimated_reward=round(score.reward_value, 2) if purchase_amount else None,
                     reward_rate=score.reward_rate,
-                    reason=score.reason,
+                    reason=self._describe_score(score),
                     details=self._format_reward_details(score.reward_value, score.reward_rate, purchase_amount),
                     comparison=comparison
                 )
@@ -119,15 +451,19 @@ class RecommendationEngine:
     
     def calculate_card_score(
         self,
-        card: CreditCard,
+        card: Union[CompiledCard, CreditCard],
         merchant_name: str,
         categories: List[str],
         purchase_amount: float,
-        transaction_date: date
+        transaction_date: date,
+        merchant_key: Optional[str] = None
     ) -> CardScore:
         """
         Calculate reward score for a specific card.
         
+        merchant_key is the canonical merchant from an existing resolution
+        of merchant_name; without it the name is resolved here.
+        
         Priority order:
         1. Merchant-specific offers
         2. Category bonuses
@@ -135,22 +471,26 @@ class RecommendationEngine:
         
         For points/miles cards, effective value = rate × points_value
         """
+        if not isinstance(card, CompiledCard):
+            template = self._load_templates([card]).get(card.template_id) if card.template_id else None
+            card = CompiledCard(card, self.merchant_matcher.index, template)
+        
         # Get effective multiplier for points/miles cards
         points_multiplier = card.points_value if card.points_value else 1.0
         
         # Priority 1: Check for merchant-specific offers
-        merchant_offer = self._find_merchant_offer(card, merchant_name, transaction_date)
+        merchant_offer = self._find_merchant_offer(card, merchant_name, transaction_date, merchant_key)
         if merchant_offer:
             total_rate = card.base_reward_rate + merchant_offer.bonus_rate
             effective_rate = total_rate * points_multiplier
             reward_value = purchase_amount * (effective_rate / 100)
-            reason = self._format_reward_reason(total_rate, card.reward_type, None, merchant_offer.description)
             return CardScore(
                 card=card,
                 reward_rate=effective_rate,
                 reward_value=reward_value,
-                reason=reason,
-                categories_matched=categories
+                earning_rate=total_rate,
+                categories_matched=categories,
+                offer=merchant_offer
             )
         
         # Priority 2: Check for category-specific bonuses
@@ -166,66 +506,55 @@ class RecommendationEngine:
         if matching_category:
             effective_rate = best_category_rate * points_multiplier
             reward_value = purchase_amount * (effective_rate / 100)
-            reason = self._format_reward_reason(best_category_rate, card.reward_type, matching_category)
             return CardScore(
                 card=card,
                 reward_rate=effective_rate,
                 reward_value=reward_value,
-                reason=reason,
-                categories_matched=[matching_category]
+                earning_rate=best_category_rate,
+                categories_matched=[matching_category],
+                matched_category=matching_category
             )
         
         # Priority 3: Base reward rate
         effective_rate = card.base_reward_rate * points_multiplier
         reward_value = purchase_amount * (effective_rate / 100)
-        reason = self._format_reward_reason(card.base_reward_rate, card.reward_type, None)
         return CardScore(
             card=card,
             reward_rate=effective_rate,
             reward_value=reward_value,
-            reason=reason,
+            earning_rate=card.base_reward_rate,
             categories_matched=categories
         )
     
     def _find_merchant_offer(
         self,
-        card: CreditCard,
+        card: CompiledCard,
         merchant_name: str,
-        transaction_date: date
-    ) -> Optional[Offer]:
-        """Find active merchant-specific offer for card."""
-        for offer in card.offers:
-            # Check if offer is for this merchant
-            if offer.merchant_name:
-                if merchant_name.lower() in offer.merchant_name.lower():
-                    # Check if offer is not expired
-                    if offer.expiry_date is None or offer.expiry_date >= transaction_date:
-                        return offer
-        return None
+        transaction_date: date,
+        merchant_key: Optional[str] = None
+    ) -> Optional[OfferEntry]:
+        """Find the best active merchant-specific offer for card."""
+        if merchant_key is None:
+            merchant_key = self.merchant_matcher.resolve(merchant_name).canonical_name
+        return card.find_merchant_offer(merchant_key, transaction_date, merchant_name)
     
     def _find_category_bonus(
         self,
-        card: CreditCard,
+        card: CompiledCard,
         category: str,
         transaction_date: date
-    ) -> Optional[CategoryBonus]:
-        """Find active category bonus for card."""
-        best_bonus = None
-        
-        for bonus in card.category_bonuses:
-            if bonus.category.lower() == category.lower():
-                # Check if bonus is active
-                is_active = True
-                if bonus.start_date and bonus.start_date > transaction_date:
-                    is_active = False
-                if bonus.end_date and bonus.end_date < transaction_date:
-                    is_active = False
-                
-                if is_active:
-                    if best_bonus is None or bonus.reward_rate > best_bonus.reward_rate:
-                        best_bonus = bonus
-        
-        return best_bonus
+    ) -> Optional[BonusInterval]:
+        """Find active category bonus for card via its compiled reward table."""
+        return card.find_category_bonus(category, transaction_date)
+    
+    def _describe_score(self, score: CardScore) -> str:
+        """Build the user-facing reason for a scored card."""
+        return self._format_reward_reason(
+            score.earning_rate,
+            score.card.reward_type,
+            score.matched_category,
+            score.offer.description if score.offer else None
+        )
     
     def _format_reward_reason(
         self, 
@@ -281,7 +610,7 @@ class RecommendationEngine:
         
         Args:
             current_score: Score for the current card
-            all_scores: All card scores sorted by reward rate (descending)
+            all_scores: Top-ranked card scores sorted by reward rate (descending)
             rank: Current rank (1 = best)
             purchase_amount: Optional purchase amount
         
@@ -334,26 +663,14 @@ class RecommendationEngine:
             
             return comparison + "."
     
-    def _get_accepted_networks(self, merchant_name: str) -> Optional[List[str]]:
-        """
-        Get list of accepted card networks for a merchant.
-        Returns None if all networks accepted (or merchant not in database).
-        """
-        merchant = self.db.query(MerchantCategory).filter(
-            MerchantCategory.merchant_name == merchant_name.lower()
-        ).first()
-        
-        if merchant and merchant.accepted_networks:
-            return merchant.accepted_networks
-        return None  # Accept all networks if not specified
-    
-    def _is_card_accepted(self, card: CreditCard, accepted_networks: Optional[List[str]]) -> bool:
+    def _is_card_accepted(self, card: CompiledCard, accepted_networks: Optional[FrozenSet[str]]) -> bool:
         """
         Check if a card's network is accepted by the merchant.
         
         Args:
             card: Credit card to check
-            accepted_networks: List of accepted networks, or None if all accepted
+            accepted_networks: Lowercase accepted networks from the merchant
+                index, or None if all accepted
         
         Returns:
             True if card is accepted, False otherwise
@@ -363,10 +680,10 @@ class RecommendationEngine:
             return True
         
         # If card has no network info, assume it's accepted
-        if not card.network:
+        if not card.network_key:
             return True
         
-        # Check if card network is in accepted list
-        return card.network.lower() in [n.lower() for n in accepted_networks]
+        # Check if card network is in accepted set
+        return card.network_key in accepted_networks
 
 
@@ -0,0 +1,114 @@
+"""Vectorized wallet scoring for batch and simulation workloads."""
+
+from datetime import date
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.services.wallet import CompiledCard, normalize_category
+
+
+class WalletKernel:
+    """
+    Array form of a compiled wallet on a single transaction date.
+
+    Holds per-card base rates and points multipliers, plus a
+    cards × categories matrix of the best bonus rate active on the date.
+    Scoring a purchase is then a handful of vector operations, applying
+    the same priority rules as RecommendationEngine.calculate_card_score:
+    merchant offer > category bonus (if above base) > base rate.
+    """
+
+    def __init__(self, wallet: List[CompiledCard], transaction_date: date):
+        self.cards = wallet
+        self.transaction_date = transaction_date
+        self.base_rates = np.array([card.base_reward_rate for card in wallet], dtype=np.float64)
+        self.multipliers = np.array(
+            [card.points_value if card.points_value else 1.0 for card in wallet],
+            dtype=np.float64
+        )
+
+        # One column per category that any card has a bonus for
+        self.category_columns: Dict[str, int] = {}
+        for card in wallet:
+            for category in card.reward_table:
+                self.category_columns.setdefault(category, len(self.category_columns))
+
+        self.bonus_matrix = np.zeros((len(wallet), len(self.category_columns)), dtype=np.float64)
+        for row, card in enumerate(wallet):
+            for category in card.reward_table:
+                bonus = card.find_category_bonus(category, transaction_date)
+                if bonus:
+                    self.bonus_matrix[row, self.category_columns[category]] = bonus.reward_rate
+
+        # Offer vectors are built lazily, once per merchant
+        self._offer_vectors: Dict[Tuple[str, Optional[str]], Tuple[np.ndarray, np.ndarray]] = {}
+
+    def offer_vector(
+        self,
+        merchant_key: str,
+        merchant_name: Optional[str] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Return (has_offer mask, offer bonus rates) for a canonical merchant and purchase name."""
+        vectors = self._offer_vectors.get((merchant_key, merchant_name))
+        if vectors is None:
+            bonuses = np.zeros(len(self.cards), dtype=np.float64)
+            has_offer = np.zeros(len(self.cards), dtype=bool)
+            for row, card in enumerate(self.cards):
+                offer = card.find_merchant_offer(merchant_key, self.transaction_date, merchant_name)
+                if offer:
+                    bonuses[row] = offer.bonus_rate
+                    has_offer[row] = True
+            vectors = (has_offer, bonuses)
+            self._offer_vectors[(merchant_key, merchant_name)] = vectors
+        return vectors
+
+    def effective_rates(
+        self,
+        categories: List[str],
+        merchant_key: str,
+        merchant_name: Optional[str] = None
+    ) -> np.ndarray:
+        """Return the effective reward rate of every card for one purchase."""
+        columns = [
+            self.category_columns[key]
+            for key in (normalize_category(c) for c in categories)
+            if key in self.category_columns
+        ]
+        if columns:
+            best_bonus = self.bonus_matrix[:, columns].max(axis=1)
+            earning = np.where(best_bonus > self.base_rates, best_bonus, self.base_rates)
+        else:
+            earning = self.base_rates
+
+        has_offer, offer_bonus = self.offer_vector(merchant_key, merchant_name)
+        earning = np.where(has_offer, self.base_rates + offer_bonus, earning)
+        return earning * self.multipliers
+
+    def top_indices(
+        self,
+        rates: np.ndarray,
+        k: int,
+        eligible: Optional[Sequence[bool]] = None
+    ) -> List[int]:
+        """
+        Return wallet positions of the k best cards, best first.
+
+        Ties keep wallet order, matching the stable ordering of the
+        per-card scoring path. Ineligible cards are never returned.
+        """
+        if eligible is not None:
+            eligible = np.asarray(eligible, dtype=bool)
+            rates = np.where(eligible, rates, -np.inf)
+            k = min(k, int(eligible.sum()))
+        order = np.argsort(-rates, kind="stable")
+        return order[:k].tolist()
+
+    def best_card(
+        self,
+        categories: List[str],
+        merchant_key: str,
+        merchant_name: Optional[str] = None
+    ) -> CompiledCard:
+        """Return the single best card for a purchase (argmax over the wallet)."""
+        return self.cards[int(np.argmax(self.effective_rates(categories, merchant_key, merchant_name)))]
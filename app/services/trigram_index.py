@@ -0,0 +1,149 @@
+"""Trigram candidate index for typo-tolerant merchant lookups."""
+
+import heapq
+import re
+from collections import Counter
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+_NON_ALNUM = re.compile(r"[^a-z0-9]")
+
+
+def compact(text: str) -> str:
+    """Lowercase text with spaces and punctuation removed ('Whole Foods' -> 'wholefoods')."""
+    return _NON_ALNUM.sub("", text.lower())
+
+
+def trigrams(text: str) -> Set[str]:
+    """Return the padded character trigrams of compacted text."""
+    padded = f"${text}$"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def bounded_edit_distance(a: str, b: str, limit: int) -> Optional[int]:
+    """
+    Optimal string alignment distance between a and b, or None if above limit.
+
+    Counts insertions, deletions, substitutions and adjacent transpositions
+    ('chipolte' -> 'chipotle' is 1). Stops early once two consecutive rows
+    exceed the limit everywhere, since a transposition reaches back one row.
+    """
+    if abs(len(a) - len(b)) > limit:
+        return None
+
+    previous_previous = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if (previous_previous is not None and i > 1 and j > 1
+                    and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]):
+                current[j] = min(current[j], previous_previous[j - 2] + 1)
+        if min(current) > limit and min(previous) > limit:
+            return None
+        previous_previous, previous = previous, current
+
+    distance = previous[len(b)]
+    return distance if distance <= limit else None
+
+
+class TrigramIndex:
+    """
+    Trigram inverted index over merchant keys with bounded verification.
+
+    Lookups touch at most max_postings posting entries (rarest trigrams
+    first) and verify at most max_candidates keys with a bounded edit
+    distance, so worst-case cost per query is fixed regardless of how many
+    keys are indexed.
+    """
+
+    MIN_QUERY_LENGTH = 4
+    MAX_CANDIDATES = 32
+    MAX_POSTINGS = 20000
+
+    def __init__(
+        self,
+        keys: Iterable[str],
+        max_candidates: int = MAX_CANDIDATES,
+        max_postings: int = MAX_POSTINGS
+    ):
+        self.max_candidates = max_candidates
+        self.max_postings = max_postings
+        self.keys: List[str] = []
+        self._compact_keys: List[str] = []
+        self.postings: Dict[str, List[int]] = {}
+
+        for key in sorted(set(keys)):
+            compacted = compact(key)
+            if len(compacted) < self.MIN_QUERY_LENGTH:
+                continue
+            key_id = len(self.keys)
+            self.keys.append(key)
+            self._compact_keys.append(compacted)
+            for gram in trigrams(compacted):
+                self.postings.setdefault(gram, []).append(key_id)
+
+    @staticmethod
+    def max_distance(length: int) -> int:
+        """Edits allowed for a query of the given compacted length."""
+        if length <= 5:
+            return 1
+        if length <= 10:
+            return 2
+        return 3
+
+    def search(self, text: str) -> Optional[str]:
+        """Return the closest key within the edit budget, or None."""
+        found = self.search_ranked(text)
+        return found[1] if found else None
+
+    def search_ranked(
+        self,
+        text: str,
+        accept: Optional[Callable[[str], bool]] = None
+    ) -> Optional[Tuple[tuple, str]]:
+        """
+        Return (rank, key) for the closest key, or None.
+
+        Ranks order by edit distance, then shared trigrams, length and key,
+        so results from several indexes can be compared. Keys rejected by
+        accept are never considered.
+        """
+        query = compact(text)
+        if len(query) < self.MIN_QUERY_LENGTH:
+            return None
+
+        # Count shared trigrams, rarest first, within the posting budget
+        grams = [g for g in trigrams(query) if g in self.postings]
+        grams.sort(key=lambda g: (len(self.postings[g]), g))
+        shared = Counter()
+        scanned = 0
+        for gram in grams:
+            posting = self.postings[gram]
+            if scanned + len(posting) > self.max_postings:
+                continue
+            scanned += len(posting)
+            shared.update(posting)
+
+        limit = self.max_distance(len(query))
+        best_rank = None
+        best_key = None
+        counts = shared.items()
+        if accept is not None:
+            counts = [(key_id, count) for key_id, count in counts if accept(self.keys[key_id])]
+        candidates = heapq.nsmallest(
+            self.max_candidates, counts, key=lambda item: (-item[1], item[0])
+        )
+        for key_id, count in candidates:
+            distance = bounded_edit_distance(query, self._compact_keys[key_id], limit)
+            if distance is None:
+                continue
+            key = self.keys[key_id]
+            rank = (distance, -count, len(key), key)
+            if best_rank is None or rank < best_rank:
+                best_rank, best_key = rank, key
+        return (best_rank, best_key) if best_key is not None else None
+
+    def __len__(self) -> int:
+        return len(self.keys)
@@ -0,0 +1,329 @@
+"""Compiled, read-only views of customer cards used by the recommendation engine."""
+
+import threading
+from bisect import bisect_right
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import date
+from typing import Collection, Dict, Iterable, List, Optional, Tuple
+
+from app.config.settings import settings
+from app.core.cache import LRUCache
+from app.models import CategoryBonus, CreditCard, Offer
+from app.services.descriptor_normalizer import descriptor_normalizer
+from app.services.merchant_index import MerchantIndex
+from app.services.merchant_matcher import MerchantMatcher
+
+
+@dataclass(frozen=True)
+class BonusInterval:
+    """A category bonus rate and the dates it is active."""
+    category: str
+    reward_rate: float
+    start_date: Optional[date] = None
+    end_date: Optional[date] = None
+
+
+@dataclass(frozen=True)
+class OfferEntry:
+    """A merchant-specific offer and its expiry."""
+    description: str
+    merchant_name: str
+    bonus_rate: float
+    expiry_date: Optional[date] = None
+
+
+def normalize_category(category: str) -> str:
+    """Normalize a category name for table lookups."""
+    return category.lower().strip()
+
+
+class CompiledCard:
+    """
+    Snapshot of a credit card with its reward table precomputed.
+
+    Category bonuses are grouped by normalized category and sorted by
+    start date, so scoring a category is a dict lookup plus a bisect
+    instead of a scan over every bonus row on the card. Merchant offers
+    are keyed by the canonical merchant their name resolves to (see
+    MerchantMatcher.offer_key) and sorted by bonus rate, best first.
+
+    A card that references a template takes its reward terms from the
+    compiled template and shares the template's tables; its own bonus and
+    offer rows are customer-specific additions merged into copies of only
+    the entries they touch.
+    """
+
+    def __init__(
+        self,
+        card: CreditCard,
+        merchant_index: Optional[MerchantIndex] = None,
+        template: Optional["CompiledCard"] = None
+    ):
+        self.id = card.id
+        self.card_name = card.card_name
+        self.issuer = card.issuer
+        self.last_four = card.last_four
+
+        # Reward terms come from the template, so template corrections apply
+        terms = template if template is not None else card
+        self.network = terms.network
+        self.network_key = terms.network.lower() if terms.network else None
+        self.base_reward_rate = terms.base_reward_rate
+        self.reward_type = terms.reward_type
+        self.points_value = terms.points_value
+
+        if template is not None:
+            self.reward_table: Dict[str, List[BonusInterval]] = template.reward_table
+            self._start_keys: Dict[str, List[date]] = template._start_keys
+            self.offer_index: Dict[str, List[OfferEntry]] = template.offer_index
+            self._offer_names: List[Tuple[str, OfferEntry]] = template._offer_names
+        else:
+            self.reward_table = {}
+            self._start_keys = {}
+            self.offer_index = {}
+            self._offer_names = []
+
+        if card.category_bonuses:
+            self._compile_bonuses(card.category_bonuses)
+        if card.offers:
+            self._compile_offers(card.offers, merchant_index)
+
+    def _compile_bonuses(self, bonuses: Iterable[CategoryBonus]):
+        """Group bonuses by category, sorted by start date (open-ended first)."""
+        added: Dict[str, List[BonusInterval]] = {}
+        for bonus in bonuses:
+            key = normalize_category(bonus.category)
+            added.setdefault(key, []).append(
+                BonusInterval(
+                    category=bonus.category,
+                    reward_rate=bonus.reward_rate,
+                    start_date=bonus.start_date,
+                    end_date=bonus.end_date
+                )
+            )
+
+        # Copy the (possibly shared) tables before replacing any entry
+        self.reward_table = dict(self.reward_table)
+        self._start_keys = dict(self._start_keys)
+        for key, intervals in added.items():
+            intervals = self.reward_table.get(key, []) + intervals
+            intervals.sort(key=lambda b: b.start_date or date.min)
+            self.reward_table[key] = intervals
+            self._start_keys[key] = [b.start_date or date.min for b in intervals]
+
+    def _compile_offers(self, offers: Iterable[Offer], merchant_index: Optional[MerchantIndex]):
+        """Key merchant offers by canonical merchant, highest bonus first."""
+        matcher = MerchantMatcher(None, index=merchant_index) if merchant_index is not None else None
+        added: Dict[str, List[OfferEntry]] = {}
+        names: List[Tuple[str, OfferEntry]] = []
+        for offer in offers:
+            if not offer.merchant_name:
+                continue
+            if matcher is not None:
+                key = matcher.offer_key(offer.merchant_name)
+            else:
+                key = descriptor_normalizer.normalize(offer.merchant_name)
+            entry = OfferEntry(
+                description=offer.description,
+                merchant_name=offer.merchant_name,
+                bonus_rate=offer.bonus_rate,
+                expiry_date=offer.expiry_date
+            )
+            added.setdefault(key, []).append(entry)
+            names.append((offer.merchant_name.lower(), entry))
+
+        self.offer_index = dict(self.offer_index)
+        for key, entries in added.items():
+            entries = self.offer_index.get(key, []) + entries
+            entries.sort(key=lambda o: o.bonus_rate, reverse=True)
+            self.offer_index[key] = entries
+        self._offer_names = sorted(self._offer_names + names, key=lambda n: n[1].bonus_rate, reverse=True)
+
+    def find_merchant_offer(
+        self,
+        merchant_key: str,
+        transaction_date: date,
+        merchant_name: Optional[str] = None
+    ) -> Optional[OfferEntry]:
+        """
+        Return the highest-bonus offer for a merchant that has not expired.
+
+        Offers filed under merchant_key are tried first. If none applies and
+        the purchase's merchant_name is given, any offer whose merchant name
+        contains it is used instead, for offer names the catalog cannot
+        resolve.
+        """
+        for offer in self.offer_index.get(merchant_key, ()):
+            if offer.expiry_date is None or offer.expiry_date >= transaction_date:
+                return offer
+
+        text = merchant_name.lower().strip() if merchant_name else ""
+        if text:
+            for offer_name, offer in self._offer_names:
+                if text in offer_name and (offer.expiry_date is None or offer.expiry_date >= transaction_date):
+                    return offer
+        return None
+
+    def find_category_bonus(self, category: str, transaction_date: date) -> Optional[BonusInterval]:
+        """Return the highest-rate bonus for a category active on the given date."""
+        key = normalize_category(category)
+        intervals = self.reward_table.get(key)
+        if not intervals:
+            return None
+
+        # Only bonuses that have already started can be active
+        started = bisect_right(self._start_keys[key], transaction_date)
+        best_bonus = None
+        for bonus in intervals[:started]:
+            if bonus.end_date and bonus.end_date < transaction_date:
+                continue
+            if best_bonus is None or bonus.reward_rate > best_bonus.reward_rate:
+                best_bonus = bonus
+        return best_bonus
+
+    def __repr__(self):
+        return f"<CompiledCard(id={self.id}, name={self.card_name})>"
+
+
+def compile_wallet(
+    cards: Iterable[CreditCard],
+    merchant_index: Optional[MerchantIndex] = None,
+    templates: Optional[Dict[str, CompiledCard]] = None
+) -> List[CompiledCard]:
+    """Compile every card in a wallet once, ahead of scoring, on top of its compiled template."""
+    templates = templates or {}
+    return [
+        CompiledCard(card, merchant_index, templates.get(card.template_id) if card.template_id else None)
+        for card in cards
+    ]
+
+
+class TemplateCache:
+    """
+    Compiled template cards shared by every wallet in this worker.
+
+    Entries are (merchant index version, compiled template), since offer
+    keys depend on the merchant catalog. A template is compiled once and
+    its reward tables are shared by every customer card that references
+    it. Every write to template cards, bonuses or offers must call
+    invalidate_templates().
+    """
+
+    def __init__(self, maxsize: int, ttl_seconds: Optional[float] = None):
+        self.cache = LRUCache(maxsize=maxsize, ttl_seconds=ttl_seconds)
+
+    def lookup(
+        self,
+        template_ids: Collection[str],
+        merchant_index: MerchantIndex
+    ) -> Tuple[Dict[str, CompiledCard], List[str]]:
+        """Return (cached templates by id, ids that must be loaded)."""
+        found: Dict[str, CompiledCard] = {}
+        missing = []
+        for template_id in template_ids:
+            cached = self.cache.get(template_id)
+            if cached is not None and cached[0] == merchant_index.version:
+                found[template_id] = cached[1]
+            else:
+                missing.append(template_id)
+        return found, missing
+
+    def store(
+        self,
+        templates: Iterable[CreditCard],
+        merchant_index: MerchantIndex,
+        ttl_seconds: Optional[float] = None
+    ) -> Dict[str, CompiledCard]:
+        """Compile freshly loaded template cards and cache them (ttl_seconds overrides the cache TTL)."""
+        compiled = {}
+        for template in templates:
+            compiled[template.id] = CompiledCard(template, merchant_index)
+            self.cache.set(template.id, (merchant_index.version, compiled[template.id]), ttl_seconds)
+        return compiled
+
+    def clear(self):
+        """Remove every compiled template."""
+        self.cache.clear()
+
+    def stats(self) -> Dict[str, object]:
+        """Return the underlying cache counters for monitoring."""
+        return self.cache.stats()
+
+
+template_cache = TemplateCache(
+    maxsize=settings.TEMPLATE_CACHE_MAX_ENTRIES,
+    ttl_seconds=settings.TEMPLATE_CACHE_TTL_SECONDS
+)
+
+
+# Compiled wallets keyed by customer_id. Entries are (merchant index version,
+# wallet) because offer keys depend on the merchant catalog. Every write to a
+# customer's cards, bonuses or offers must call invalidate_wallet().
+wallet_cache = LRUCache(
+    maxsize=settings.WALLET_CACHE_MAX_ENTRIES,
+    ttl_seconds=settings.WALLET_CACHE_TTL_SECONDS
+)
+
+# Invalidation clock. Each invalidation takes the next tick; a load that
+# started before a customer's last invalidation must not store its wallet
+# after it. Only the most recent invalidations are kept (as many as the
+# wallet cache holds); older ones are folded into _wallet_floor, the latest
+# tick forgotten, which a customer without an entry is assumed to have.
+_wallet_clock = 0
+_wallet_floor = 0
+_wallet_invalidations: "OrderedDict[str, int]" = OrderedDict()
+_wallet_lock = threading.Lock()
+
+
+def wallet_generation(customer_id: str) -> int:
+    """Return a token to pass to store_wallet() once the customer's cards are loaded."""
+    return _wallet_clock
+
+
+def store_wallet(
+    customer_id: str,
+    generation: int,
+    entry: Tuple[int, List[CompiledCard]],
+    ttl_seconds: Optional[float] = None
+) -> bool:
+    """
+    Cache a wallet entry unless the wallet was invalidated since generation was taken.
+
+    Take the generation with wallet_generation() before loading the cards.
+    Returns whether the entry was stored.
+    """
+    with _wallet_lock:
+        if _wallet_invalidations.get(customer_id, _wallet_floor) > generation:
+            return False
+        wallet_cache.set(customer_id, entry, ttl_seconds)
+        return True
+
+
+def invalidate_wallet(customer_id: str):
+    """Drop a customer's compiled wallet so the next read reloads it."""
+    global _wallet_clock, _wallet_floor
+    with _wallet_lock:
+        _wallet_clock += 1
+        _wallet_invalidations[customer_id] = _wallet_clock
+        _wallet_invalidations.move_to_end(customer_id)
+        while len(_wallet_invalidations) > wallet_cache.maxsize:
+            _, _wallet_floor = _wallet_invalidations.popitem(last=False)
+        wallet_cache.pop(customer_id)
+
+
+def invalidate_wallets():
+    """Drop every compiled wallet, e.g. after customer data is cleared in bulk."""
+    global _wallet_clock, _wallet_floor
+    with _wallet_lock:
+        # Every earlier load is outdated, so the per-customer ticks can go
+        _wallet_clock += 1
+        _wallet_floor = _wallet_clock
+        _wallet_invalidations.clear()
+        wallet_cache.clear()
+
+
+def invalidate_templates():
+    """Drop compiled templates, and the wallets built on them, after a template change."""
+    template_cache.clear()
+    invalidate_wallets()
@@ -0,0 +1,175 @@
+"""Batch creation of a customer's cards, as used by onboarding and account linking."""
+
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+from sqlalchemy import insert, tuple_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.models import CategoryBonus, CreditCard, Offer
+from app.schemas import BatchCardCreate
+from app.services.wallet import invalidate_wallet
+
+CARD_CREATED = "created"
+CARD_FAILED = "failed"
+
+# Inserts attempted per batch; ids taken by concurrent requests are dropped between attempts
+MAX_INSERT_ATTEMPTS = 3
+
+
+@dataclass
+class CardImportResult:
+    """Outcome for one card of a batch, in request order."""
+    card_id: str
+    status: str
+    template_id: Optional[str] = None
+    error: Optional[str] = None
+
+
+class WalletImporter:
+    """
+    Adds many cards to one customer's wallet in a single transaction.
+
+    Templates for every card are resolved in one query and existing card
+    ids are checked in another. The accepted cards, and any customer-specific
+    bonuses and offers sent with them, are then written with one multi-row
+    INSERT per table and one commit. Template bonuses and offers are not
+    copied; cards reference their template. Cards that cannot be added are
+    reported individually and do not fail the rest of the batch.
+    """
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    def add_cards(self, customer_id: str, cards: Sequence[BatchCardCreate]) -> List[CardImportResult]:
+        """
+        Create cards for a customer that is known to exist.
+
+        Args:
+            customer_id: Owner of the new cards
+            cards: Cards to create, with optional bonus/offer overrides
+
+        Returns:
+            One CardImportResult per requested card, in request order
+        """
+        templates = self._resolve_templates(cards)
+        results, accepted = self._validate(cards, templates)
+        by_id = {result.card_id: result for result in results if result.status == CARD_CREATED}
+
+        for _ in range(MAX_INSERT_ATTEMPTS):
+            if not accepted:
+                break
+            try:
+                self._insert(customer_id, accepted, templates)
+            except IntegrityError:
+                # A concurrent request took some of the ids; report those and retry the rest
+                taken = self._existing_ids([card.id for card in accepted])
+                if not taken:
+                    # Not an id conflict (e.g. the customer was deleted); retrying cannot help
+                    break
+                for card_id in taken:
+                    self._fail(by_id[card_id], "Card already exists")
+                accepted = [card for card in accepted if card.id not in taken]
+            else:
+                accepted = []
+                invalidate_wallet(customer_id)
+
+        for card in accepted:
+            self._fail(by_id[card.id], "Card could not be added; retry the request")
+        return results
+
+    @staticmethod
+    def _fail(result: CardImportResult, error: str):
+        """Mark a card that was expected to be created as failed."""
+        result.status = CARD_FAILED
+        result.template_id = None
+        result.error = error
+
+    def _resolve_templates(self, cards: Sequence[BatchCardCreate]) -> Dict[Tuple[str, str], CreditCard]:
+        """Find the template of every (card_name, issuer) pair in one query."""
+        pairs = {(card.card_name, card.issuer) for card in cards}
+        if not pairs:
+            return {}
+        templates: Dict[Tuple[str, str], CreditCard] = {}
+        rows = self.db.query(CreditCard).filter(
+            CreditCard.customer_id.is_(None),
+            tuple_(CreditCard.card_name, CreditCard.issuer).in_(list(pairs))
+        ).order_by(CreditCard.id).all()
+        for template in rows:
+            templates.setdefault((template.card_name, template.issuer), template)
+        return templates
+
+    def _existing_ids(self, card_ids: List[str]) -> Set[str]:
+        """Return which of card_ids are already taken, by any customer or template."""
+        if not card_ids:
+            return set()
+        return {card_id for (card_id,) in self.db.query(CreditCard.id).filter(CreditCard.id.in_(card_ids))}
+
+    def _validate(
+        self,
+        cards: Sequence[BatchCardCreate],
+        templates: Dict[Tuple[str, str], CreditCard]
+    ) -> Tuple[List[CardImportResult], List[BatchCardCreate]]:
+        """Split the batch into per-card results and the cards to insert."""
+        existing = self._existing_ids([card.id for card in cards])
+        seen = set()
+        results, accepted = [], []
+        for card in cards:
+            error = None
+            if card.id in existing:
+                error = "Card already exists"
+            elif card.id in seen:
+                error = "Duplicate card id in batch"
+            seen.add(card.id)
+
+            if error:
+                results.append(CardImportResult(card_id=card.id, status=CARD_FAILED, error=error))
+                continue
+            template = templates.get((card.card_name, card.issuer))
+            results.append(CardImportResult(
+                card_id=card.id,
+                status=CARD_CREATED,
+                template_id=template.id if template else None
+            ))
+            accepted.append(card)
+        return results, accepted
+
+    def _insert(
+        self,
+        customer_id: str,
+        cards: List[BatchCardCreate],
+        templates: Dict[Tuple[str, str], CreditCard]
+    ):
+        """Write cards, bonuses and offers as multi-row inserts and commit once."""
+        card_rows, bonus_rows, offer_rows = [], [], []
+        for card in cards:
+            template = templates.get((card.card_name, card.issuer))
+            card_rows.append({
+                "id": card.id,
+                "customer_id": customer_id,
+                "template_id": template.id if template else None,
+                "card_name": card.card_name,
+                "issuer": card.issuer,
+                "last_four": card.last_four,
+                "base_reward_rate": template.base_reward_rate if template else card.base_reward_rate,
+                "network": template.network if template else None,
+                "annual_fee": template.annual_fee if template else 0.0,
+                "reward_type": template.reward_type if template else 'cashback',
+                "points_value": template.points_value if template else None,
+            })
+            bonus_rows.extend({"card_id": card.id, **bonus.model_dump()} for bonus in card.category_bonuses)
+            offer_rows.extend({"card_id": card.id, **offer.model_dump()} for offer in card.offers)
+
+        try:
+            # One executemany per table instead of a statement per row
+            # (batched into multi-row VALUES on PostgreSQL)
+            self.db.execute(insert(CreditCard), card_rows)
+            if bonus_rows:
+                self.db.execute(insert(CategoryBonus), bonus_rows)
+            if offer_rows:
+                self.db.execute(insert(Offer), offer_rows)
+            self.db.commit()
+        except Exception:
+            self.db.rollback()
+            raise
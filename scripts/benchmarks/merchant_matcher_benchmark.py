@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+"""
+Benchmark MerchantMatcher against synthetic merchant catalogs.
+
+Builds catalogs of increasing size (with aliases), runs a query mix per
+match tier, and reports index build time, index memory (in total, per
+lookup key and for the Aho-Corasick automaton) and per-tier latency
+percentiles as JSON.
+
+Usage:
+    python scripts/benchmarks/merchant_matcher_benchmark.py
+    python scripts/benchmarks/merchant_matcher_benchmark.py --sizes 1000 10000 --output bench.json
+    python scripts/benchmarks/merchant_matcher_benchmark.py --output new.json --baseline old.json
+"""
+
+import argparse
+import contextlib
+import gc
+import json
+import platform
+import random
+import sys
+import os
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+# Add project root to path
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, project_root)
+
+# The report goes to stdout, so startup banners printed by app modules
+# (e.g. the database in use) are sent to stderr
+with contextlib.redirect_stdout(sys.stderr):
+    from app.services.aho_corasick import AhoCorasick
+    from app.services.descriptor_normalizer import descriptor_normalizer
+    from app.services.merchant_import import MerchantRecord
+    from app.services.merchant_index import MerchantIndex, bump_catalog_version
+    from app.services.merchant_matcher import MerchantMatcher, match_cache
+
+DEFAULT_SIZES = [1_000, 10_000, 100_000, 1_000_000]
+QUERY_KINDS = ["exact", "alias", "substring", "token", "fuzzy", "miss"]
+# Match tier each query kind is meant to exercise
+EXPECTED_TIERS = {
+    "exact": "exact",
+    "alias": "exact",
+    "substring": "substring",
+    "token": "word",
+    "fuzzy": "fuzzy",
+    "miss": "none",
+}
+
+_SYLLABLES = [
+    "ba", "ber", "ca", "cor", "da", "del", "fa", "fin", "ga", "gro", "ha", "hol",
+    "ka", "kin", "la", "lor", "ma", "mon", "na", "nor", "pa", "pel", "ra", "ros",
+    "sa", "sel", "ta", "tor", "va", "ven", "wa", "wel", "za", "zen",
+]
+_CATEGORIES = ["grocery", "dining", "gas", "travel", "streaming", "transit", "drugstore", "shopping"]
+_ALIAS_SUFFIXES = ["store", "market", "online", "express", "outlet"]
+_MISS_LETTERS = "bcdfghjklmnpqrstvwxz"  # No vowels, so misses share no catalog words
+
+
+def _make_word(rng: random.Random) -> str:
+    return "".join(rng.choice(_SYLLABLES) for _ in range(rng.randint(2, 4)))
+
+
+def generate_catalog(size: int, seed: int = 42) -> List[MerchantRecord]:
+    """
+    Generate size merchants with two- or three-word names.
+
+    Words come from a vocabulary that grows with the catalog and are drawn
+    with a skew, so common words appear in many names like real "market" or
+    "grill". About half of the merchants get an alias.
+    """
+    rng = random.Random(seed)
+    vocabulary = sorted({_make_word(rng) for _ in range(max(200, size // 4))})
+    weights = [1.0 / (rank + 1) ** 0.8 for rank in range(len(vocabulary))]
+    rng.shuffle(vocabulary)
+
+    records = []
+    names = set()
+    while len(records) < size:
+        words = rng.choices(vocabulary, weights=weights, k=rng.randint(2, 3))
+        name = " ".join(words)
+        if name in names or len(set(words)) < len(words):
+            continue
+        names.add(name)
+        aliases = [f"{name} {rng.choice(_ALIAS_SUFFIXES)}"] if rng.random() < 0.5 else []
+        records.append(MerchantRecord(
+            merchant_name=name,
+            categories=rng.sample(_CATEGORIES, k=rng.randint(1, 2)),
+            aliases=aliases
+        ))
+    return records
+
+
+def _typo(name: str, rng: random.Random) -> str:
+    """
+    Run the words of name together and swap two adjacent letters.
+
+    Joining the words ("delmon zenta" -> "delmnozenta") keeps the query
+    from reaching the merchant through the substring or word tiers.
+    """
+    joined = name.replace(" ", "")
+    i = rng.randrange(1, len(joined) - 2)
+    return joined[:i] + joined[i + 1] + joined[i] + joined[i + 2:]
+
+
+def generate_queries(records: List[MerchantRecord], per_kind: int, seed: int = 7) -> Dict[str, List[str]]:
+    """Build per_kind queries for every query kind from the catalog."""
+    rng = random.Random(seed)
+    with_alias = [r for r in records if r.aliases]
+    queries: Dict[str, List[str]] = {kind: [] for kind in QUERY_KINDS}
+    for _ in range(per_kind):
+        record = rng.choice(records)
+        queries["exact"].append(record.merchant_name.upper())
+        queries["alias"].append(rng.choice(with_alias).aliases[0] if with_alias else record.merchant_name)
+        queries["substring"].append(f"purchase at {rng.choice(records).merchant_name} downtown")
+        queries["token"].append(f"{rng.choice(rng.choice(records).merchant_name.split())} qzx")
+        queries["fuzzy"].append(_typo(rng.choice(records).merchant_name, rng))
+        queries["miss"].append(" ".join(
+            "".join(rng.choice(_MISS_LETTERS) for _ in range(6)) for _ in range(2)
+        ))
+    return queries
+
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    """Summarize latencies (seconds) as microsecond percentiles."""
+    ordered = sorted(samples)
+
+    def at(fraction: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] * 1e6, 2)
+
+    return {
+        "p50_us": at(0.50),
+        "p90_us": at(0.90),
+        "p99_us": at(0.99),
+        "max_us": round(ordered[-1] * 1e6, 2),
+        "mean_us": round(sum(ordered) / len(ordered) * 1e6, 2),
+    }
+
+
+def traced_memory(build) -> int:
+    """Return the bytes still allocated by build() once it returns (result kept alive)."""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        result = build()
+        allocated = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    del result
+    return allocated
+
+
+def _clear_match_caches():
+    match_cache.clear()
+    descriptor_normalizer.cache.clear()
+
+
+def bench_size(size: int, queries_per_kind: int, measure_memory: bool = True) -> Dict:
+    """Build one catalog and time its index build and query mix."""
+    records = generate_catalog(size)
+
+    gc.collect()
+    started = time.perf_counter()
+    index = MerchantIndex(records, bump_catalog_version())
+    build_seconds = time.perf_counter() - started
+
+    index_memory = automaton_memory = None
+    if measure_memory:
+        # Separate traced builds: tracing slows the build, so it is not timed
+        index_memory = traced_memory(lambda: MerchantIndex(records, bump_catalog_version()))
+        automaton_memory = traced_memory(lambda: AhoCorasick(index.merchant_map))
+
+    matcher = MerchantMatcher(None, index=index)
+    queries = generate_queries(records, queries_per_kind)
+    tiers = {}
+    for kind, names in queries.items():
+        cold, warm = [], []
+        resolved_tiers: Dict[str, int] = {}
+        for name in names:
+            # Cold: both memo caches empty, so every tier runs
+            _clear_match_caches()
+            started = time.perf_counter()
+            resolution = matcher.resolve(name)
+            cold.append(time.perf_counter() - started)
+            resolved_tiers[resolution.match_tier] = resolved_tiers.get(resolution.match_tier, 0) + 1
+
+            # Warm: same query again, served from the match cache where possible
+            started = time.perf_counter()
+            matcher.resolve(name)
+            warm.append(time.perf_counter() - started)
+
+        tiers[kind] = {
+            "queries": len(names),
+            "expected_tier": EXPECTED_TIERS[kind],
+            "tier_hit_rate": round(resolved_tiers.get(EXPECTED_TIERS[kind], 0) / len(names), 4),
+            "resolved_tiers": resolved_tiers,
+            "cold": percentiles(cold),
+            "warm": percentiles(warm),
+        }
+    _clear_match_caches()
+
+    return {
+        "catalog_size": size,
+        "lookup_keys": len(index),
+        "build_seconds": round(build_seconds, 4),
+        "index_memory_bytes": index_memory,
+        "index_bytes_per_key": round(index_memory / len(index), 1) if index_memory else None,
+        "automaton_memory_bytes": automaton_memory,
+        "tiers": tiers,
+    }
+
+
+def run_benchmark(
+    sizes: List[int] = DEFAULT_SIZES,
+    queries_per_kind: int = 1000,
+    measure_memory: bool = True,
+    progress: bool = False
+) -> Dict:
+    """Run every catalog size and return the JSON-ready report."""
+    results = []
+    for size in sizes:
+        if progress:
+            print(f"⏱️  Benchmarking {size:,} merchants...", file=sys.stderr)
+        results.append(bench_size(size, queries_per_kind, measure_memory))
+    return {
+        "benchmark": "merchant_matcher",
+        "generated_at": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "queries_per_kind": queries_per_kind,
+        "results": results,
+    }
+
+
+def compare_to_baseline(report: Dict, baseline: Dict) -> List[str]:
+    """Describe build time, memory and cold p50 changes against a baseline report."""
+    lines = []
+    previous = {entry["catalog_size"]: entry for entry in baseline.get("results", [])}
+    for entry in report["results"]:
+        old = previous.get(entry["catalog_size"])
+        if old is None:
+            continue
+        line = f"{entry['catalog_size']:>9,} build: {old['build_seconds']:.3f}s -> {entry['build_seconds']:.3f}s"
+        if old.get("index_memory_bytes") and entry.get("index_memory_bytes"):
+            line += (
+                f", memory: {old['index_memory_bytes'] / 1e6:.1f} MB"
+                f" -> {entry['index_memory_bytes'] / 1e6:.1f} MB"
+            )
+        lines.append(line)
+        for kind, tier in entry["tiers"].items():
+            old_tier = old["tiers"].get(kind)
+            if old_tier is None:
+                continue
+            before, after = old_tier["cold"]["p50_us"], tier["cold"]["p50_us"]
+            change = (after - before) / before * 100 if before else 0.0
+            lines.append(f"{'':>9} {kind:<10} p50 {before:>9.1f}us -> {after:>9.1f}us ({change:+.1f}%)")
+    return lines
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Benchmark MerchantMatcher on synthetic catalogs")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--queries", type=int, default=1000, help="queries per query kind")
+    parser.add_argument("--skip-memory", action="store_true", help="skip the traced build used for memory")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    parser.add_argument("--baseline", help="previous JSON report to compare against")
+    args = parser.parse_args(argv)
+
+    report = run_benchmark(args.sizes, args.queries, not args.skip_memory, progress=True)
+    payload = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as output:
+            output.write(payload + "\n")
+        print(f"✅ Wrote {args.output}", file=sys.stderr)
+    else:
+        print(payload)
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            for line in compare_to_baseline(report, json.load(baseline_file)):
+                print(line, file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+Benchmark SQLite read/write concurrency with and without the tuning profile.
+
+Seeds a throwaway database with customers and wallets, then runs reader
+threads loading wallets (the recommendation read path) while a writer
+thread keeps adding offers to cards. The "baseline" run uses SQLite
+defaults (rollback journal, synchronous=FULL); the "tuned" run applies the
+SQLITE_* profile from settings, with readers on read-only connections.
+
+Usage:
+    python scripts/benchmarks/sqlite_concurrency_benchmark.py
+    python scripts/benchmarks/sqlite_concurrency_benchmark.py --readers 16 --duration 10 --output sqlite.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+# Add project root to path
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, project_root)
+
+from sqlalchemy import create_engine
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+
+from app.database import Base, configure_sqlite_engine, sqlite_pragmas
+from app.models import Customer, CreditCard, CategoryBonus, Offer
+from app.repositories import CardRepository
+from scripts.benchmarks.merchant_matcher_benchmark import percentiles
+
+PROFILES = ["baseline", "tuned"]
+CARDS_PER_CUSTOMER = 4
+_CATEGORIES = ["grocery", "dining", "gas", "travel", "streaming", "transit"]
+
+
+def seed_database(url: str, customers: int, seed: int = 42):
+    """Create the schema and customers with bonus- and offer-carrying wallets."""
+    rng = random.Random(seed)
+    engine = create_engine(url)
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    try:
+        for c in range(customers):
+            customer_id = f"bench_cust_{c}"
+            db.add(Customer(id=customer_id, name=f"Customer {c}", email=f"{customer_id}@example.com"))
+            for n in range(CARDS_PER_CUSTOMER):
+                card_id = f"{customer_id}_card_{n}"
+                db.add(CreditCard(
+                    id=card_id,
+                    customer_id=customer_id,
+                    card_name=f"Card {n}",
+                    issuer="Bench Bank",
+                    last_four=f"{n:04d}",
+                    base_reward_rate=rng.choice([1.0, 1.5, 2.0])
+                ))
+                db.add(CategoryBonus(card_id=card_id, category=rng.choice(_CATEGORIES), reward_rate=3.0))
+                db.add(Offer(card_id=card_id, description="Seed offer", merchant_name="seed", bonus_rate=1.0))
+        db.commit()
+    finally:
+        db.close()
+        engine.dispose()
+
+
+def _make_engine(url: str, profile: str, read_only: bool):
+    engine = create_engine(url, connect_args={"check_same_thread": False})
+    if profile == "tuned":
+        configure_sqlite_engine(engine, read_only=read_only)
+    return engine
+
+
+def run_profile(profile: str, customers: int, readers: int, duration: float) -> Dict:
+    """Seed a fresh database and run readers against one writer for duration seconds."""
+    directory = tempfile.mkdtemp(prefix="sqlite-bench-")
+    url = f"sqlite:///{os.path.join(directory, 'bench.db')}"
+    seed_database(url, customers)
+
+    read_engine = _make_engine(url, profile, read_only=True)
+    write_engine = _make_engine(url, profile, read_only=False)
+    ReadSession = sessionmaker(bind=read_engine)
+    WriteSession = sessionmaker(bind=write_engine)
+
+    read_latencies: List[List[float]] = [[] for _ in range(readers)]
+    write_latencies: List[float] = []
+    errors = {"read": 0, "write": 0}
+    errors_lock = threading.Lock()
+    stop = threading.Event()
+
+    def reader(slot: int):
+        rng = random.Random(slot)
+        while not stop.is_set():
+            db = ReadSession()
+            started = time.perf_counter()
+            try:
+                CardRepository(db).get_wallet(f"bench_cust_{rng.randrange(customers)}")
+                read_latencies[slot].append(time.perf_counter() - started)
+            except (OperationalError, sqlite3.OperationalError):
+                with errors_lock:
+                    errors["read"] += 1
+            finally:
+                db.close()
+
+    def writer():
+        rng = random.Random(-1)
+        while not stop.is_set():
+            db = WriteSession()
+            customer_id = f"bench_cust_{rng.randrange(customers)}"
+            started = time.perf_counter()
+            try:
+                db.add(Offer(
+                    card_id=f"{customer_id}_card_{rng.randrange(CARDS_PER_CUSTOMER)}",
+                    description="Bench offer",
+                    merchant_name="bench merchant",
+                    bonus_rate=2.0
+                ))
+                db.commit()
+                write_latencies.append(time.perf_counter() - started)
+            except (OperationalError, sqlite3.OperationalError):
+                db.rollback()
+                with errors_lock:
+                    errors["write"] += 1
+            finally:
+                db.close()
+
+    threads = [threading.Thread(target=reader, args=(slot,)) for slot in range(readers)]
+    threads.append(threading.Thread(target=writer))
+    for thread in threads:
+        thread.start()
+    time.sleep(duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    read_engine.dispose()
+    write_engine.dispose()
+
+    reads = [latency for samples in read_latencies for latency in samples]
+    return {
+        "profile": profile,
+        "pragmas": sqlite_pragmas() if profile == "tuned" else [],
+        "reads": len(reads),
+        "reads_per_second": round(len(reads) / duration, 1),
+        "read_latency": percentiles(reads) if reads else None,
+        "writes": len(write_latencies),
+        "writes_per_second": round(len(write_latencies) / duration, 1),
+        "write_latency": percentiles(write_latencies) if write_latencies else None,
+        "errors": errors,
+    }
+
+
+def run_benchmark(customers: int = 500, readers: int = 8, duration: float = 5.0, progress: bool = False) -> Dict:
+    """Run both profiles and return the JSON-ready report."""
+    results = []
+    for profile in PROFILES:
+        if progress:
+            print(f"⏱️  Benchmarking {profile} profile ({readers} readers, 1 writer)...", file=sys.stderr)
+        results.append(run_profile(profile, customers, readers, duration))
+
+    baseline, tuned = results
+    return {
+        "benchmark": "sqlite_concurrency",
+        "generated_at": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "customers": customers,
+        "readers": readers,
+        "duration_seconds": duration,
+        "results": results,
+        "read_throughput_ratio": round(tuned["reads"] / baseline["reads"], 2) if baseline["reads"] else None,
+        "write_throughput_ratio": round(tuned["writes"] / baseline["writes"], 2) if baseline["writes"] else None,
+    }
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Benchmark SQLite read/write concurrency by tuning profile")
+    parser.add_argument("--customers", type=int, default=500)
+    parser.add_argument("--readers", type=int, default=8, help="concurrent reader threads")
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds per profile")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    args = parser.parse_args(argv)
+
+    report = run_benchmark(args.customers, args.readers, args.duration, progress=True)
+    payload = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as output:
+            output.write(payload + "\n")
+        print(f"✅ Wrote {args.output}", file=sys.stderr)
+    else:
+        print(payload)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""Script to prebuild the merchant index snapshot that workers load at boot."""
+
+import sys
+import os
+import time
+
+# Add project root to path
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+
+from app.config.settings import settings
+from app.database import SessionLocal, init_db
+from app.services.merchant_index import MerchantIndex, catalog_fingerprint, record_catalog_change
+
+def build_merchant_index(path: str):
+    """Build the merchant index from the database and write it to path."""
+    init_db()
+    db = SessionLocal()
+    
+    try:
+        started = time.perf_counter()
+        fingerprint = catalog_fingerprint(db)
+        if fingerprint is None:
+            # Workers can only match a snapshot to a stamped catalog
+            fingerprint = record_catalog_change(db)
+            db.commit()
+        index = MerchantIndex.from_db(db, version=0)
+        index.save_snapshot(path, fingerprint)
+        elapsed = time.perf_counter() - started
+        
+        print(f"✅ Wrote merchant index snapshot to {path}")
+        print(f"   Catalog version: {fingerprint[0]}")
+        print(f"   Lookup keys: {len(index)}")
+        print(f"   Size: {os.path.getsize(path) / 1024:.1f} KiB")
+        print(f"   Build time: {elapsed:.2f}s")
+    except Exception as e:
+        print(f"❌ Error building merchant index snapshot: {e}")
+        sys.exit(1)
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    target = sys.argv[1] if len(sys.argv) > 1 else settings.MERCHANT_INDEX_SNAPSHOT_PATH
+    if not target:
+        print("❌ Pass a path or set MERCHANT_INDEX_SNAPSHOT_PATH")
+        sys.exit(1)
+    build_merchant_index(target)
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""Script to bulk import merchants from a CSV or NDJSON file."""
+
+import argparse
+import sys
+import os
+import time
+
+# Add project root to path
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+
+from app.config.settings import settings
+from app.database import SessionLocal, init_db
+from app.services.merchant_import import IMPORT_FORMATS, MerchantImporter
+
+def import_merchants(path: str, file_format: str, batch_size: int):
+    """Stream a merchant file into merchant_categories with batched upserts."""
+    init_db()
+    db = SessionLocal()
+    
+    try:
+        started = time.perf_counter()
+        with open(path, encoding="utf-8", newline="") as merchant_file:
+            result = MerchantImporter(db, batch_size=batch_size).import_lines(merchant_file, file_format)
+        elapsed = time.perf_counter() - started
+        
+        print(f"✅ Imported {path} in {elapsed:.2f}s")
+        print(f"   Rows read: {result.rows_read}")
+        print(f"   Merchants upserted: {result.upserted}")
+        if result.failed:
+            print(f"⚠️  {result.failed} rows failed:")
+            for error in result.errors:
+                print(f"   {error}")
+    except Exception as e:
+        db.rollback()
+        print(f"❌ Error importing merchants: {e}")
+        sys.exit(1)
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("path", help="CSV or NDJSON merchant file")
+    parser.add_argument("--format", choices=IMPORT_FORMATS, help="defaults to the file extension")
+    parser.add_argument("--batch-size", type=int, default=settings.MERCHANT_IMPORT_BATCH_SIZE)
+    args = parser.parse_args()
+    
+    file_format = args.format or ("csv" if args.path.lower().endswith(".csv") else "ndjson")
+    import_merchants(args.path, file_format, args.batch_size)
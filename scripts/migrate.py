@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+"""Script to apply schema migrations and check for missing indexes at deploy time."""
+
+import argparse
+import sys
+import os
+
+# Add project root to path
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+
+from app.database import Base, engine
+from app.migrations import MIGRATIONS, apply_migrations, applied_versions, check_indexes
+
+def upgrade():
+    """Create missing tables, then apply every pending migration."""
+    import app.models  # noqa: F401
+    Base.metadata.create_all(bind=engine)
+    applied = apply_migrations(engine)
+    print(f"✅ Applied {len(applied)} migration(s)")
+    return check()
+
+def status():
+    """List every migration with whether it has been applied."""
+    applied = applied_versions(engine)
+    for migration in MIGRATIONS:
+        marker = "✅" if migration.version in applied else "⏳"
+        print(f"{marker} {migration.version:03d}_{migration.name}: {migration.description}")
+    return 0
+
+def check():
+    """Report missing or invalid indexes; non-zero exit if any are found."""
+    problems = check_indexes(engine)
+    if not problems:
+        print("✅ All declared indexes are present")
+        return 0
+    for problem in problems:
+        print(f"❌ {problem['status']}: {problem['table']}.{problem['index']} ({problem['columns']})")
+    return 1
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("command", choices=["upgrade", "status", "check"], nargs="?", default="upgrade")
+    args = parser.parse_args()
+    sys.exit({"upgrade": upgrade, "status": status, "check": check}[args.command]())
@@ -5,6 +5,7 @@ from sqlalchemy.orm import Session
 
 from app.database import SessionLocal, init_db
 from app.models import Customer, CreditCard, CategoryBonus, Offer, MerchantCategory
+from app.services.merchant_index import record_catalog_change
 
 
 def seed_database():
@@ -23,6 +24,7 @@ def seed_database():
         db.query(CreditCard).delete()
         db.query(Customer).delete()
         db.query(MerchantCategory).delete()
+        record_catalog_change(db)  # Running workers rebuild their merchant index
         db.commit()
         
         # 1. Create sample customer
@@ -255,6 +257,7 @@ def seed_database():
         for merchant in merchants:
             db.add(merchant)
         
+        record_catalog_change(db)
         db.commit()
         
         print("✅ Database seeded successfully!")
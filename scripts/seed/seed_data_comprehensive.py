@@ -8,6 +8,8 @@ from sqlalchemy.orm import Session
 
 from app.database import SessionLocal, init_db
 from app.models import Customer, CreditCard, CategoryBonus, Offer, MerchantCategory
+from app.services.merchant_index import bump_catalog_version, record_catalog_change
+from app.services.wallet import invalidate_templates
 
 
 # Top 20 Popular Credit Cards with Real Reward Structures
@@ -487,11 +489,20 @@ def seed_comprehensive_data(db: Session):
     db.query(Offer).filter(Offer.card_id.in_(
         db.query(CreditCard.id).filter(CreditCard.customer_id.is_(None))
     )).delete(synchronize_session=False)
-    db.query(CreditCard).filter(CreditCard.customer_id.is_(None)).delete()
+    # Customer cards reference templates by id, so templates are updated in
+    # place; only retired templates that no card references are removed
+    db.query(CreditCard).filter(
+        CreditCard.customer_id.is_(None),
+        CreditCard.id.notin_([card_data['id'] for card_data in COMPREHENSIVE_CARD_DATABASE]),
+        CreditCard.id.notin_(
+            db.query(CreditCard.template_id).filter(CreditCard.template_id.isnot(None))
+        )
+    ).delete(synchronize_session=False)
     db.query(MerchantCategory).delete()
+    record_catalog_change(db)  # Workers in other processes rebuild their merchant index
     db.commit()
     
-    # Create all credit cards as TEMPLATES (no customer_id)
+    # Create or update all credit cards as TEMPLATES (no customer_id)
     print(f"  Creating {len(COMPREHENSIVE_CARD_DATABASE)} template credit cards...")
     card_count = 0
     bonus_count = 0
@@ -509,7 +520,7 @@ def seed_comprehensive_data(db: Session):
             points_value=card_data.get('points_value'),
             network=card_data.get('network')
         )
-        db.add(card)
+        db.merge(card)
         card_count += 1
         
         # Add category bonuses
@@ -532,6 +543,7 @@ def seed_comprehensive_data(db: Session):
             bonus_count += 1
     
     db.commit()
+    invalidate_templates()  # Customer cards pick up the new template terms
     print(f"  ✅ Created {card_count} template cards with {bonus_count} category bonuses")
     
     # Create merchant categories
@@ -545,7 +557,9 @@ def seed_comprehensive_data(db: Session):
         )
         db.add(merchant)
     
+    record_catalog_change(db)
     db.commit()
+    bump_catalog_version()  # Shared merchant index must be rebuilt
     print(f"  ✅ Created {len(COMPREHENSIVE_MERCHANT_DATABASE)} merchant mappings")
     print(f"  ✅ Database seeded successfully!")
     
@@ -573,6 +587,7 @@ def seed_comprehensive_database():
         db.query(CreditCard).delete()
         db.query(Customer).delete()
         db.query(MerchantCategory).delete()
+        record_catalog_change(db)  # Workers in other processes rebuild their merchant index
         db.commit()
         
         # Create sample customer
@@ -639,6 +654,7 @@ def seed_comprehensive_database():
             )
             db.add(merchant)
         
+        record_catalog_change(db)
         db.commit()
         print(f"  ✅ Created {len(COMPREHENSIVE_MERCHANT_DATABASE)} merchant mappings")
         
@@ -1,30 +1,56 @@
 """Pytest configuration and fixtures."""
 
+import os
+import tempfile
+
 import pytest
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
+from fastapi import Request
 from fastapi.testclient import TestClient
 from datetime import date, timedelta
 
-from app.database import Base, get_db
+from app.database import (
+    Base, READ_YOUR_WRITES, configure_sqlite_engine, get_async_db, get_async_read_db, get_db, get_read_db,
+    reads_own_writes
+)
 from app.main import app
 from app.models import Customer, CreditCard, CategoryBonus, Offer, MerchantCategory
+from app.services.merchant_index import bump_catalog_version
+from app.services.wallet import invalidate_templates
 
 
-# Use in-memory SQLite for tests
-SQLALCHEMY_DATABASE_URL = "sqlite:///:memory:"
+# Use a throwaway SQLite file for tests: the sync and async routes need
+# separate drivers, and an in-memory database cannot be shared between them
+TEST_DATABASE_PATH = os.path.join(tempfile.mkdtemp(prefix="cardrec-tests-"), "test.db")
+SQLALCHEMY_DATABASE_URL = f"sqlite:///{TEST_DATABASE_PATH}"
 
 engine = create_engine(
     SQLALCHEMY_DATABASE_URL,
     connect_args={"check_same_thread": False}
 )
+configure_sqlite_engine(engine)
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# NullPool: the TestClient runs each request on its own event loop, so async
+# connections must not be pooled across requests
+async_engine = create_async_engine(f"sqlite+aiosqlite:///{TEST_DATABASE_PATH}", poolclass=NullPool)
+configure_sqlite_engine(async_engine.sync_engine)
+TestingAsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+async_read_engine = create_async_engine(f"sqlite+aiosqlite:///{TEST_DATABASE_PATH}", poolclass=NullPool)
+configure_sqlite_engine(async_read_engine.sync_engine, read_only=True)
+TestingAsyncReadSessionLocal = async_sessionmaker(async_read_engine, autoflush=False, expire_on_commit=False)
+
 
 @pytest.fixture(scope="function")
 def db():
     """Create a fresh database for each test."""
     Base.metadata.create_all(bind=engine)
+    # Each test gets a new catalog and new wallets, so drop process-wide state
+    bump_catalog_version()
+    invalidate_templates()
     db = TestingSessionLocal()
     try:
         yield db
@@ -58,8 +84,24 @@ def client(db, request):
         finally:
             pass
     
-    # Override the dependency
+    async def override_get_async_db():
+        async with TestingAsyncSessionLocal() as async_db:
+            yield async_db
+    
+    async def override_get_async_read_db(request: Request):
+        if reads_own_writes(request):
+            async with TestingAsyncSessionLocal() as async_db:
+                async_db.info[READ_YOUR_WRITES] = True
+                yield async_db
+        else:
+            async with TestingAsyncReadSessionLocal() as async_db:
+                yield async_db
+    
+    # Override the dependencies
     app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_read_db] = override_get_db
+    app.dependency_overrides[get_async_db] = override_get_async_db
+    app.dependency_overrides[get_async_read_db] = override_get_async_read_db
     
     # Prevent startup events from running
     app.router.on_startup = []
@@ -72,6 +114,18 @@ def client(db, request):
     app.dependency_overrides.clear()
 
 
+@pytest.fixture
+def async_session_factory(db):
+    """Async session factory bound to the same test database as db."""
+    return TestingAsyncSessionLocal
+
+
+@pytest.fixture
+def async_read_session_factory(db):
+    """Read-only async session factory bound to the same test database as db."""
+    return TestingAsyncReadSessionLocal
+
+
 @pytest.fixture
 def sample_customer(db):
     """Create a sample customer."""
@@ -169,6 +223,25 @@ def sample_merchants(db):
     return merchants
 
 
+@pytest.fixture
+def sample_template(db):
+    """Create a template card (no customer) with a category bonus and a merchant offer."""
+    template = CreditCard(
+        id="template_dining",
+        customer_id=None,
+        card_name="Dining Rewards",
+        issuer="Test Bank",
+        last_four="0000",
+        base_reward_rate=1.0,
+        network="visa"
+    )
+    db.add(template)
+    db.add(CategoryBonus(card_id="template_dining", category="dining", reward_rate=3.0))
+    db.add(Offer(card_id="template_dining", description="Shell promo", merchant_name="Shell", bonus_rate=2.0))
+    db.commit()
+    return template
+
+
 @pytest.fixture
 def sample_offer(db, sample_cards):
     """Create a sample special offer."""
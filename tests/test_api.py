@@ -3,6 +3,9 @@
 import pytest
 from datetime import date
 
+from app.models import CategoryBonus, Offer
+from app.services.wallet import invalidate_templates
+
 
 class TestRecommendationAPI:
     """Test cases for recommendation API endpoint."""
@@ -40,6 +43,29 @@ class TestRecommendationAPI:
         assert merchant_info["merchant_name"] == "Whole Foods"
         assert "grocery" in merchant_info["identified_categories"]
     
+    def test_recommend_with_mcc(self, client, sample_customer, sample_cards, sample_merchants):
+        """Test that an MCC categorizes the purchase and is validated."""
+        response = client.post(
+            "/recommend/",
+            json={
+                "customer_id": sample_customer.id,
+                "merchant_name": "CORNER BISTRO 4471",
+                "purchase_amount": 50.0,
+                "mcc": "5812"
+            }
+        )
+        
+        assert response.status_code == 200
+        data = response.json()
+        assert data["recommendations"][0]["card_id"] == "test_card_3"
+        assert data["merchant_info"]["identified_categories"] == ["dining", "restaurant"]
+        
+        response = client.post(
+            "/recommend/",
+            json={"customer_id": sample_customer.id, "merchant_name": "x", "mcc": "58a2"}
+        )
+        assert response.status_code == 422
+    
     def test_recommend_invalid_customer(self, client, sample_merchants):
         """Test recommendation with nonexistent customer."""
         # sample_merchants ensures the merchant_categories table exists
@@ -95,6 +121,46 @@ class TestRecommendationAPI:
         data = response.json()
         assert len(data["recommendations"]) == 1
 
+    
+    def test_recommend_batch(self, client, sample_customer, sample_cards, sample_merchants):
+        """Test batch recommendations for several purchases."""
+        response = client.post(
+            "/recommend/batch",
+            json={
+                "customer_id": sample_customer.id,
+                "items": [
+                    {"merchant_name": "Whole Foods", "purchase_amount": 100.0},
+                    {"merchant_name": "Shell", "purchase_amount": 40.0, "transaction_date": "2025-06-01"},
+                    {"merchant_name": "Whole Foods"}
+                ]
+            }
+        )
+        
+        assert response.status_code == 200
+        data = response.json()
+        assert data["customer_id"] == sample_customer.id
+        assert [r["merchant_name"] for r in data["results"]] == ["Whole Foods", "Shell", "Whole Foods"]
+        assert data["results"][0]["recommendations"][0]["card_id"] == "test_card_1"
+        assert data["results"][1]["recommendations"][0]["card_id"] == "test_card_2"
+        assert "grocery" in data["results"][2]["merchant_info"]["identified_categories"]
+    
+    def test_recommend_batch_invalid_customer(self, client, sample_merchants):
+        """Test batch recommendations for a nonexistent customer."""
+        response = client.post(
+            "/recommend/batch",
+            json={"customer_id": "nonexistent", "items": [{"merchant_name": "Shell"}]}
+        )
+        
+        assert response.status_code == 404
+    
+    def test_recommend_batch_empty_items(self, client, sample_customer):
+        """Test validation for an empty batch."""
+        response = client.post(
+            "/recommend/batch",
+            json={"customer_id": sample_customer.id, "items": []}
+        )
+        
+        assert response.status_code == 422
 
 class TestCustomerAPI:
     """Test cases for customer management endpoints."""
@@ -138,6 +204,15 @@ class TestCustomerAPI:
         assert data["id"] == sample_customer.id
         assert data["name"] == sample_customer.name
     
+    def test_get_customer_by_email(self, client, sample_customer):
+        """Test getting customer details by email."""
+        response = client.get(f"/customers/by-email/{sample_customer.email}")
+        assert response.status_code == 200
+        assert response.json()["id"] == sample_customer.id
+        
+        response = client.get("/customers/by-email/nobody@example.com")
+        assert response.status_code == 404
+    
     def test_get_nonexistent_customer(self, client, sample_merchants):
         """Test getting nonexistent customer."""
         # sample_merchants ensures tables exist
@@ -199,6 +274,193 @@ class TestCustomerAPI:
         
         assert response.status_code == 201
 
+    
+    def test_wallet_cache_invalidated_on_write(self, client, sample_customer, sample_cards, sample_merchants):
+        """Test that wallet writes invalidate the cached wallet used by /recommend."""
+        request = {
+            "customer_id": sample_customer.id,
+            "merchant_name": "Shell",
+            "purchase_amount": 100.0
+        }
+        
+        first = client.post("/recommend/", json=request).json()
+        assert first["recommendations"][0]["card_id"] == "test_card_2"
+        client.post("/recommend/", json=request)
+        
+        stats = client.get("/admin/cache-stats").json()["wallet_cache"]
+        assert stats["hits"] >= 1
+        
+        response = client.post(
+            f"/customers/{sample_customer.id}/cards/test_card_3/offers",
+            json={"description": "Shell fuel promo", "merchant_name": "Shell", "bonus_rate": 4.0}
+        )
+        assert response.status_code == 201
+        
+        updated = client.post("/recommend/", json=request).json()
+        assert updated["recommendations"][0]["card_id"] == "test_card_3"
+        assert updated["recommendations"][0]["reward_rate"] == 5.0
+
+    def test_read_your_writes_bypasses_cached_wallet(
+        self, client, db, sample_customer, sample_cards, sample_merchants
+    ):
+        """Test that X-Read-Your-Writes reloads a wallet cached from a stale read."""
+        request = {"customer_id": sample_customer.id, "merchant_name": "Shell", "purchase_amount": 100.0}
+        assert client.post("/recommend/", json=request).json()["recommendations"][0]["card_id"] == "test_card_2"
+        
+        # A write this worker never saw (another worker, or a replica catching up)
+        db.add(Offer(card_id="test_card_3", description="Shell promo", merchant_name="Shell", bonus_rate=4.0))
+        db.commit()
+        
+        cached = client.post("/recommend/", json=request).json()
+        assert cached["recommendations"][0]["card_id"] == "test_card_2"
+        
+        fresh = client.post("/recommend/", json=request, headers={"X-Read-Your-Writes": "1"}).json()
+        assert fresh["recommendations"][0]["card_id"] == "test_card_3"
+        
+        # The fresh wallet replaced the stale cache entry
+        assert client.post("/recommend/", json=request).json()["recommendations"][0]["card_id"] == "test_card_3"
+
+    def test_card_added_from_template_references_it(
+        self, client, db, sample_customer, sample_template, sample_merchants
+    ):
+        """Test that a template card is referenced, not copied, and template changes reach it."""
+        response = client.post(
+            f"/customers/{sample_customer.id}/cards",
+            json={"id": "linked_card", "card_name": "Dining Rewards", "issuer": "Test Bank", "last_four": "4242"}
+        )
+        assert response.status_code == 201
+        assert response.json()["template_id"] == "template_dining"
+        assert db.query(CategoryBonus).filter(CategoryBonus.card_id == "linked_card").count() == 0
+        assert db.query(Offer).filter(Offer.card_id == "linked_card").count() == 0
+        
+        request = {"customer_id": sample_customer.id, "merchant_name": "Chipotle", "purchase_amount": 100.0}
+        assert client.post("/recommend/", json=request).json()["recommendations"][0]["reward_rate"] == 3.0
+        shell = {"customer_id": sample_customer.id, "merchant_name": "Shell", "purchase_amount": 100.0}
+        assert client.post("/recommend/", json=shell).json()["recommendations"][0]["reward_rate"] == 3.0
+        
+        # A correction to the template reaches the existing customer card
+        db.query(CategoryBonus).filter(CategoryBonus.card_id == "template_dining").update({"reward_rate": 4.0})
+        db.commit()
+        invalidate_templates()
+        assert client.post("/recommend/", json=request).json()["recommendations"][0]["reward_rate"] == 4.0
+        
+        # Customer-specific bonuses are stored on the card and merged over the template
+        response = client.post(
+            f"/customers/{sample_customer.id}/cards/linked_card/bonuses",
+            json={"category": "grocery", "reward_rate": 5.0}
+        )
+        assert response.status_code == 201
+        grocery = {"customer_id": sample_customer.id, "merchant_name": "Whole Foods", "purchase_amount": 100.0}
+        assert client.post("/recommend/", json=grocery).json()["recommendations"][0]["reward_rate"] == 5.0
+        assert client.post("/recommend/", json=request).json()["recommendations"][0]["reward_rate"] == 4.0
+    
+    def test_add_cards_batch(self, client, db, sample_customer, sample_cards, sample_template, sample_merchants):
+        """Test onboarding a wallet in one request with per-card results."""
+        response = client.post(
+            f"/customers/{sample_customer.id}/cards/batch",
+            json={"cards": [
+                {"id": "batch_dining", "card_name": "Dining Rewards", "issuer": "Test Bank", "last_four": "1111"},
+                {
+                    "id": "batch_plain", "card_name": "Store Card", "issuer": "Local CU", "last_four": "2222",
+                    "base_reward_rate": 1.5,
+                    "category_bonuses": [{"category": "grocery", "reward_rate": 6.0}],
+                    "offers": [{"description": "Target 10%", "merchant_name": "Target", "bonus_rate": 10.0}]
+                },
+                {"id": "batch_dining", "card_name": "Dining Rewards", "issuer": "Test Bank", "last_four": "3333"},
+                {"id": "test_card_1", "card_name": "Dining Rewards", "issuer": "Test Bank", "last_four": "4444"},
+            ]}
+        )
+        
+        assert response.status_code == 201
+        data = response.json()
+        assert data["created"] == 2
+        assert data["failed"] == 2
+        results = data["results"]
+        assert [result["card_id"] for result in results] == ["batch_dining", "batch_plain", "batch_dining", "test_card_1"]
+        assert results[0] == {"card_id": "batch_dining", "status": "created", "template_id": "template_dining", "error": None}
+        assert results[1]["status"] == "created" and results[1]["template_id"] is None
+        assert results[2]["status"] == "failed" and "Duplicate" in results[2]["error"]
+        assert results[3]["status"] == "failed" and "already exists" in results[3]["error"]
+        
+        # Template cards reference the template; overrides are stored on the card
+        assert db.query(CategoryBonus).filter(CategoryBonus.card_id == "batch_dining").count() == 0
+        assert db.query(CategoryBonus).filter(CategoryBonus.card_id == "batch_plain").count() == 1
+        assert db.query(Offer).filter(Offer.card_id == "batch_plain").count() == 1
+        cards = {card["id"]: card for card in client.get(f"/customers/{sample_customer.id}/cards").json()}
+        assert cards["batch_dining"]["last_four"] == "1111"
+        assert cards["batch_dining"]["network"] == "visa"
+        assert cards["batch_plain"]["base_reward_rate"] == 1.5
+        
+        # The new cards take part in recommendations straight away
+        target = {"customer_id": sample_customer.id, "merchant_name": "Target", "purchase_amount": 100.0}
+        assert client.post("/recommend/", json=target).json()["recommendations"][0]["card_id"] == "batch_plain"
+    
+    def test_add_cards_batch_uses_multi_row_inserts(self, client, db, sample_customer, sample_template, sample_merchants):
+        """Test that a batch costs a fixed number of statements, not one per card."""
+        from sqlalchemy import event
+        
+        statements = []
+        record = lambda conn, cursor, statement, *args: statements.append(statement)
+        bind = db.get_bind()
+        event.listen(bind, "before_cursor_execute", record)
+        try:
+            response = client.post(
+                f"/customers/{sample_customer.id}/cards/batch",
+                json={"cards": [
+                    {
+                        "id": f"bulk_{n}", "card_name": "Dining Rewards", "issuer": "Test Bank", "last_four": f"{n:04d}",
+                        "category_bonuses": [{"category": "travel", "reward_rate": 2.0}]
+                    }
+                    for n in range(8)
+                ]}
+            )
+        finally:
+            event.remove(bind, "before_cursor_execute", record)
+        
+        assert response.json()["created"] == 8
+        inserts = [statement for statement in statements if statement.startswith("INSERT")]
+        assert len(inserts) == 2
+    
+    def test_add_cards_batch_concurrent_id_conflicts(self, client, db, sample_customer, monkeypatch):
+        """Test that ids taken by concurrent requests fail per card instead of failing the batch."""
+        from app.models import CreditCard
+        from app.services.wallet_import import MAX_INSERT_ATTEMPTS, WalletImporter
+        
+        insert = WalletImporter._insert
+        races = {"left": 1}
+        
+        def insert_after_race(importer, customer_id, cards, templates):
+            # Another request commits the first card's id just before this insert
+            if races["left"]:
+                races["left"] -= 1
+                db.add(CreditCard(id=cards[0].id, customer_id=customer_id, card_name="Other",
+                                  issuer="Bank", last_four="0000"))
+                db.commit()
+            return insert(importer, customer_id, cards, templates)
+        
+        monkeypatch.setattr(WalletImporter, "_insert", insert_after_race)
+        card = lambda card_id: {"id": card_id, "card_name": "Card", "issuer": "Bank", "last_four": "0000"}
+        url = f"/customers/{sample_customer.id}/cards/batch"
+        
+        data = client.post(url, json={"cards": [card("race_0"), card("race_1")]}).json()
+        assert [r["status"] for r in data["results"]] == ["failed", "created"]
+        assert data["results"][0]["error"] == "Card already exists"
+        
+        # A race on every attempt still ends in per-card results
+        races["left"] = MAX_INSERT_ATTEMPTS
+        response = client.post(url, json={"cards": [card(f"retry_{n}") for n in range(MAX_INSERT_ATTEMPTS + 1)]})
+        assert response.status_code == 201
+        results = response.json()["results"]
+        assert [r["status"] for r in results] == ["failed"] * len(results)
+        assert results[0]["error"] == "Card already exists"
+        assert results[-1]["error"] == "Card could not be added; retry the request"
+        assert db.get(CreditCard, f"retry_{MAX_INSERT_ATTEMPTS}") is None
+    
+    def test_add_cards_batch_validation(self, client, sample_customer):
+        """Test that unknown customers and empty batches are rejected."""
+        card = {"id": "c1", "card_name": "Card", "issuer": "Bank", "last_four": "0000"}
+        assert client.post("/customers/nobody/cards/batch", json={"cards": [card]}).status_code == 404
+        assert client.post(f"/customers/{sample_customer.id}/cards/batch", json={"cards": []}).status_code == 422
 
 class TestSystemEndpoints:
     """Test system/utility endpoints."""
@@ -219,3 +481,24 @@ class TestSystemEndpoints:
         assert data["status"] == "healthy"
 
 
+    
+    def test_import_merchants(self, client, sample_customer, sample_cards, sample_merchants):
+        """Test streaming a CSV merchant file through the admin import endpoint."""
+        body = "merchant_name,categories,aliases\nstarbucks,dining|coffee,sbux\nbad row,,\n"
+        response = client.post("/admin/import-merchants?format=csv", content=body.encode())
+        
+        assert response.status_code == 200
+        data = response.json()
+        assert data["status"] == "partial"
+        assert data["upserted"] == 1
+        assert data["failed"] == 1
+        assert data["merchants"] == 4
+        
+        response = client.post(
+            "/recommend/",
+            json={"customer_id": sample_customer.id, "merchant_name": "SBUX", "purchase_amount": 10.0}
+        )
+        assert response.json()["merchant_info"]["identified_categories"] == ["dining", "coffee"]
+        
+        response = client.post("/admin/import-merchants?format=xml", content=b"")
+        assert response.status_code == 400
@@ -0,0 +1,136 @@
+"""Tests for database engine configuration."""
+
+import asyncio
+
+import pytest
+from fastapi import Request
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+
+from app.config.settings import settings
+from app.database import (
+    READ_FROM_REPLICA, READ_YOUR_WRITES, configure_sqlite_engine, engine, get_read_db, read_engine,
+    sqlite_pragmas
+)
+from app.models import Customer
+
+
+@pytest.fixture
+def sqlite_file_url(tmp_path):
+    """URL of an empty SQLite file database."""
+    return f"sqlite:///{tmp_path / 'tuning.db'}"
+
+
+class TestSqliteTuning:
+    """Test cases for the SQLite tuning profile."""
+
+    def test_pragmas_applied_on_connect(self, sqlite_file_url):
+        """Test that every new connection gets the configured pragmas."""
+        engine = create_engine(sqlite_file_url)
+        configure_sqlite_engine(engine)
+
+        with engine.connect() as connection:
+            pragma = lambda name: connection.exec_driver_sql(f"PRAGMA {name}").scalar()
+            assert pragma("journal_mode") == settings.SQLITE_JOURNAL_MODE.lower()
+            assert pragma("synchronous") == 1  # NORMAL
+            assert pragma("cache_size") == settings.SQLITE_CACHE_SIZE
+            assert pragma("temp_store") == 2  # MEMORY
+            assert pragma("busy_timeout") == settings.SQLITE_BUSY_TIMEOUT_MS
+            assert pragma("query_only") == 0
+        engine.dispose()
+
+    def test_tuning_can_be_disabled(self, monkeypatch):
+        """Test that disabling the profile keeps only the busy timeout."""
+        monkeypatch.setattr(settings, "SQLITE_TUNING_ENABLED", False)
+        assert sqlite_pragmas() == [f"PRAGMA busy_timeout = {settings.SQLITE_BUSY_TIMEOUT_MS}"]
+        assert sqlite_pragmas(read_only=True)[-1] == "PRAGMA query_only = ON"
+
+    def test_read_only_connections_reject_writes(self, db, sample_customer, async_read_session_factory):
+        """Test that read-only sessions can read but not write."""
+        async def read_then_write():
+            async with async_read_session_factory() as session:
+                customer = await session.get(Customer, sample_customer.id)
+                assert customer.name == sample_customer.name
+
+                session.add(Customer(id="ro_cust", name="Read Only", email="ro@example.com"))
+                with pytest.raises(OperationalError, match="readonly"):
+                    await session.commit()
+
+        asyncio.run(read_then_write())
+        assert db.get(Customer, "ro_cust") is None
+
+    def test_concurrency_benchmark_smoke(self):
+        """Test that a tiny concurrency benchmark run reports both profiles."""
+        from scripts.benchmarks.sqlite_concurrency_benchmark import PROFILES, run_benchmark
+
+        report = run_benchmark(customers=5, readers=2, duration=0.2)
+
+        assert [result["profile"] for result in report["results"]] == PROFILES
+        for result in report["results"]:
+            assert result["reads"] > 0
+            assert result["writes"] > 0
+            assert result["errors"] == {"read": 0, "write": 0}
+        assert "PRAGMA journal_mode = WAL" in report["results"][1]["pragmas"]
+
+
+def _request(headers=None):
+    return Request({
+        "type": "http",
+        "headers": [(name.lower().encode(), value.encode()) for name, value in (headers or {}).items()]
+    })
+
+
+class TestReadRouting:
+    """Test cases for read-only session routing."""
+
+    def test_reads_use_read_engine(self):
+        """Test that read-only routes get sessions on the read engine."""
+        sessions = get_read_db(_request())
+        db = next(sessions)
+        assert db.get_bind() is read_engine
+        assert not db.info.get(READ_YOUR_WRITES)
+        sessions.close()
+    
+    def test_no_replica_sqlite_reads_stay_read_only(self, monkeypatch, sqlite_file_url):
+        """Test that without a replica, the app's async read sessions on SQLite still refuse writes."""
+        import app.database as database
+        
+        async_url = database.to_async_url(sqlite_file_url)
+        monkeypatch.setattr(database, "ASYNC_DATABASE_URL", async_url)
+        monkeypatch.setattr(database, "ASYNC_READ_DATABASE_URL", async_url)
+        monkeypatch.setattr(database, "_async_engines", {})
+        monkeypatch.setattr(database, "_async_session_factories", {})
+        
+        async def write_through_read_session():
+            sessions = database.get_async_read_db(_request())
+            session = await sessions.__anext__()
+            try:
+                assert not session.info.get(READ_FROM_REPLICA)
+                with pytest.raises(OperationalError, match="readonly"):
+                    await session.execute(text("CREATE TABLE probe (id INTEGER)"))
+            finally:
+                await sessions.aclose()
+                for async_engine in database._async_engines.values():
+                    await async_engine.dispose()
+        
+        asyncio.run(write_through_read_session())
+        assert not settings.DATABASE_REPLICA_URL
+        assert read_engine is not engine
+    
+    def test_no_replica_shares_pools_outside_sqlite(self, monkeypatch):
+        """Test that without a replica, non-SQLite read-only routes open no extra pool."""
+        import app.database as database
+        
+        monkeypatch.setattr(database, "ASYNC_DATABASE_URL", "postgresql+asyncpg://db/cards")
+        monkeypatch.setattr(database, "ASYNC_READ_DATABASE_URL", "postgresql+asyncpg://db/cards")
+        assert not database._uses_read_engine(True)
+        monkeypatch.setattr(database, "ASYNC_READ_DATABASE_URL", "postgresql+asyncpg://replica/cards")
+        assert database._uses_read_engine(True) and database._uses_replica(True)
+
+    def test_read_your_writes_uses_primary(self):
+        """Test that the read-your-writes header routes the read to the primary."""
+        sessions = get_read_db(_request({"X-Read-Your-Writes": "1"}))
+        db = next(sessions)
+        assert db.get_bind() is engine
+        assert db.info[READ_YOUR_WRITES] is True
+        sessions.close()
@@ -1,7 +1,14 @@
 """Tests for merchant matching service."""
 
 import pytest
-from app.services.merchant_matcher import MerchantMatcher
+from app.models import MerchantCategory
+from app.services.descriptor_normalizer import DescriptorNormalizer
+from app.config.settings import settings
+from app.services.merchant_index import (
+    MerchantIndex, bump_catalog_version, catalog_fingerprint, read_catalog_revision, record_catalog_change
+)
+from app.services.merchant_import import MerchantImporter, MerchantRecord
+from app.services.merchant_matcher import MerchantMatcher, match_cache
 
 
 class TestMerchantMatcher:
@@ -83,3 +90,484 @@ class TestMerchantMatcher:
         assert "grocery" in categories
 
 
+    
+    def test_index_shared_between_matchers(self, db, sample_merchants):
+        """Test that matchers reuse one index until the catalog changes."""
+        first = MerchantMatcher(db)
+        second = MerchantMatcher(db)
+        assert first.index is second.index
+        
+        db.add(MerchantCategory(merchant_name="costco", categories=["wholesale"], aliases=[]))
+        db.commit()
+        
+        # Stale until the catalog version is bumped
+        assert MerchantMatcher(db).match("costco") == ["general"]
+        
+        bump_catalog_version()
+        rebuilt = MerchantMatcher(db)
+        assert rebuilt.index is not first.index
+        assert rebuilt.match("costco") == ["wholesale"]
+    
+    def test_index_picks_up_catalog_writes_from_other_processes(self, db, sample_merchants, monkeypatch):
+        """Test that a write stamped in catalog_versions reaches workers within the check interval."""
+        first = MerchantMatcher(db)
+        
+        # Another process: writes and stamps the catalog, but cannot bump this process's version
+        db.add(MerchantCategory(merchant_name="costco", categories=["wholesale"], aliases=[]))
+        record_catalog_change(db)
+        db.commit()
+        
+        monkeypatch.setattr(settings, "MERCHANT_CATALOG_CHECK_SECONDS", 3600.0)
+        assert MerchantMatcher(db).index is first.index
+        
+        monkeypatch.setattr(settings, "MERCHANT_CATALOG_CHECK_SECONDS", 0.0)
+        rebuilt = MerchantMatcher(db)
+        assert rebuilt.index is not first.index
+        assert rebuilt.index.revision == read_catalog_revision(db)
+        assert rebuilt.match("costco") == ["wholesale"]
+        assert MerchantMatcher(db).index is rebuilt.index
+    
+    def test_resolve_reports_tier_and_key(self, db, sample_merchants):
+        """Test that a single resolution carries categories, confidence and match details."""
+        matcher = MerchantMatcher(db)
+        
+        resolution = matcher.resolve("Whole Foods Market")
+        assert resolution.match_tier == "exact"
+        assert resolution.confidence == "high"
+        assert resolution.matched_key == "whole foods market"
+        assert resolution.canonical_name == "whole foods"
+        assert "organic" in resolution.categories
+        
+        resolution = matcher.resolve("shell station")
+        assert resolution.match_tier == "substring"
+        assert resolution.confidence == "medium"
+        assert resolution.canonical_name == "shell"
+        
+        resolution = matcher.resolve("unknown merchant xyz")
+        assert resolution.match_tier == "none"
+        assert resolution.matched_key is None
+        assert resolution.categories == ["general"]
+    
+    def test_substring_match_prefers_most_specific_key(self, db):
+        """Test that substring matching is deterministic regardless of seed order."""
+        db.add_all([
+            MerchantCategory(merchant_name="amazon", categories=["online_shopping"], aliases=[]),
+            MerchantCategory(merchant_name="amazon prime video", categories=["streaming"], aliases=[]),
+            MerchantCategory(merchant_name="shell", categories=["gas"], aliases=["shell gas station"]),
+        ])
+        db.commit()
+        matcher = MerchantMatcher(db)
+        
+        resolution = matcher.resolve("amazon prime video monthly")
+        assert resolution.matched_key == "amazon prime video"
+        assert resolution.categories == ["streaming"]
+        
+        assert matcher.resolve("amazon marketplace").matched_key == "amazon"
+        
+        # Input contained in a key resolves to the shortest containing key
+        resolution = matcher.resolve("gas stat")
+        assert resolution.matched_key == "shell gas station"
+        assert resolution.match_tier == "substring"
+    
+    def test_aho_corasick_finds_overlapping_keys(self):
+        """Test that the automaton reports every contained key, including overlaps."""
+        from app.services.aho_corasick import AhoCorasick
+        
+        automaton = AhoCorasick(["he", "she", "his", "hers", "shell"])
+        found = sorted(automaton.find_all("ushers shell"))
+        assert found == [(1, "she"), (2, "he"), (2, "hers"), (7, "she"), (7, "shell"), (8, "he")]
+        assert automaton.longest_match("ushers shell") == "shell"
+        assert automaton.longest_match("xyz") is None
+    
+    def test_word_match_scores_shared_tokens(self, db):
+        """Test that the word tier picks the merchant sharing the rarest tokens."""
+        db.add_all([
+            MerchantCategory(merchant_name="whole foods", categories=["grocery"], aliases=[]),
+            MerchantCategory(merchant_name="foods co", categories=["grocery", "discount"], aliases=[]),
+            MerchantCategory(merchant_name="foods market express", categories=["convenience"], aliases=[]),
+            MerchantCategory(merchant_name="market basket", categories=["grocery"], aliases=[]),
+        ])
+        db.commit()
+        matcher = MerchantMatcher(db)
+        
+        # "whole" is rarer than "foods", so whole foods outranks the other foods merchants
+        resolution = matcher.resolve("wholesome whole organic foods")
+        assert resolution.match_tier == "word"
+        assert resolution.matched_key == "whole foods"
+        assert resolution.confidence == "low"
+        
+        # Shared "foods": fewer tokens wins the tie
+        assert matcher.resolve("organic foods").matched_key == "foods co"
+        
+        # Two shared tokens beat one
+        assert matcher.resolve("downtown market foods").matched_key == "foods market express"
+    
+    def test_typo_tolerant_match(self, db, sample_merchants):
+        """Test that misspelled merchants resolve with fuzzy confidence."""
+        db.add(MerchantCategory(merchant_name="starbucks", categories=["dining", "coffee"], aliases=[]))
+        db.commit()
+        matcher = MerchantMatcher(db)
+        
+        for name, expected in (("chipolte", "chipotle"), ("starbuks", "starbucks"), ("wholefoods", "whole foods")):
+            resolution = matcher.resolve(name)
+            assert resolution.matched_key == expected
+            assert resolution.match_tier == "fuzzy"
+            assert resolution.confidence == "fuzzy"
+        
+        # Too many edits still falls back to general
+        assert matcher.match("stxrbxxks") == ["general"]
+    
+    def test_trigram_index_caps_candidates(self):
+        """Test that the trigram index verifies at most max_candidates keys."""
+        from app.services.trigram_index import TrigramIndex, bounded_edit_distance
+        
+        keys = [f"merchant{i:05d}" for i in range(2000)] + ["chipotle"]
+        index = TrigramIndex(keys, max_candidates=5, max_postings=500)
+        
+        assert index.search("chipolte") == "chipotle"
+        assert index.search("merchnt00042") in keys
+        assert bounded_edit_distance("chipolte", "chipotle", 1) == 1
+        assert bounded_edit_distance("abcdef", "uvwxyz", 2) is None
+
+
+class TestDescriptorNormalizer:
+    """Test cases for raw statement descriptor normalization."""
+    
+    def test_normalize_descriptors(self):
+        """Test that processor prefixes, store numbers and locations are stripped."""
+        normalizer = DescriptorNormalizer(cache_size=16)
+        
+        assert normalizer.normalize("SQ *STARBUCKS #1234 SEATTLE WA") == "starbucks"
+        assert normalizer.normalize("AMZN Mktp US*2K4AB12") == "amazon"
+        assert normalizer.normalize("TST* CHIPOTLE 0123 NEW YORK NY") == "chipotle"
+        assert normalizer.normalize("PAYPAL *NETFLIX 4029357733") == "netflix"
+        assert normalizer.normalize("Whole Foods Market") == "whole foods market"
+        assert normalizer.normalize("walmart.com") == "walmart.com"
+    
+    def test_plain_names_ending_in_state_codes_are_kept(self):
+        """Test that "CITY ST" is only stripped from descriptors that had processor text cut."""
+        normalizer = DescriptorNormalizer(cache_size=16)
+        
+        for name in ("Coca Cola Co", "Cafe Rio OK", "Go Go Curry Co", "Hotel Del Coronado CA"):
+            assert normalizer.normalize(name) == name.lower()
+        assert normalizer.normalize("SQ *STARBUCKS SEATTLE WA") == "starbucks"
+        assert normalizer.normalize("STARBUCKS*4AB12 SEATTLE WA") == "starbucks"
+    
+    def test_normalize_many_preserves_order_and_memoizes(self):
+        """Test the bulk API and its bounded memo cache."""
+        normalizer = DescriptorNormalizer(cache_size=2)
+        statement = ["SQ *STARBUCKS #1", "SHELL OIL 5744 AUSTIN TX", "SQ *STARBUCKS #1"]
+        
+        assert normalizer.normalize_many(statement) == ["starbucks", "shell oil", "starbucks"]
+        assert normalizer.normalize("SQ *STARBUCKS #1") == "starbucks"
+        assert normalizer.cache.hits == 1
+        assert len(normalizer.cache) == 2
+    
+    def test_matcher_resolves_raw_descriptor(self, db, sample_merchants):
+        """Test that raw descriptors resolve through the normalization stage."""
+        matcher = MerchantMatcher(db)
+        
+        resolution = matcher.resolve("SQ *CHIPOTLE #2231 DENVER CO")
+        assert resolution.match_tier == "exact"
+        assert resolution.canonical_name == "chipotle"
+
+
+class TestMatchCache:
+    """Test cases for memoized merchant resolutions."""
+    
+    def test_repeated_lookups_hit_cache(self, db, sample_merchants):
+        """Test that matches and "general" fallbacks are both served from the cache."""
+        matcher = MerchantMatcher(db)
+        match_cache.reset_stats()
+        
+        first = matcher.resolve("SQ *CHIPOTLE #1")
+        second = matcher.resolve("SQ *CHIPOTLE #2")
+        assert second.canonical_name == first.canonical_name == "chipotle"
+        assert second.merchant_name == "SQ *CHIPOTLE #2"
+        
+        assert matcher.match("qqzx unknown vendor") == ["general"]
+        assert matcher.match("qqzx unknown vendor") == ["general"]
+        
+        stats = match_cache.stats()
+        assert stats["hits"] == 2
+        assert stats["misses"] == 2
+    
+    def test_cache_cleared_on_catalog_change(self, db, sample_merchants):
+        """Test that a catalog version bump drops cached resolutions."""
+        assert MerchantMatcher(db).match("SQ *ZZYZX DINER #4") == ["general"]
+        assert "zzyzx diner" in match_cache
+        
+        db.add(MerchantCategory(merchant_name="zzyzx diner", categories=["dining"]))
+        db.commit()
+        bump_catalog_version()
+        
+        assert MerchantMatcher(db).match("SQ *ZZYZX DINER #4") == ["dining"]
+        assert len(match_cache) == 1
+
+
+class TestMerchantIndexSnapshot:
+    """Test cases for the on-disk merchant index snapshot."""
+    
+    def test_snapshot_round_trip(self, db, sample_merchants, tmp_path):
+        """Test that a loaded snapshot answers lookups like the built index."""
+        path = str(tmp_path / "merchants.snapshot")
+        fingerprint = record_catalog_change(db)
+        db.commit()
+        built = MerchantIndex.from_db(db, version=1)
+        built.save_snapshot(path, fingerprint)
+        
+        loaded = MerchantIndex.load_snapshot(path, fingerprint, version=7)
+        assert loaded.version == 7
+        assert loaded.revision == fingerprint
+        assert loaded.merchant_map == built.merchant_map
+        assert loaded.longest_contained_key("whole foods market #10") == "whole foods market"
+        assert loaded.closest_key("chipolte") == "chipotle"
+    
+    def test_stale_or_corrupt_snapshot_is_ignored(self, db, sample_merchants, tmp_path):
+        """Test that a snapshot for a different catalog is never loaded."""
+        record_catalog_change(db)
+        db.commit()
+        path = tmp_path / "merchants.snapshot"
+        MerchantIndex.from_db(db, version=1).save_snapshot(str(path), (1, "stale"))
+        assert MerchantIndex.load_snapshot(str(path), catalog_fingerprint(db), version=1) is None
+        
+        path.write_bytes(b"not a snapshot")
+        assert MerchantIndex.load_snapshot(str(path), (1, "stale"), version=1) is None
+        assert MerchantIndex.load_snapshot(str(tmp_path / "missing"), (1, "stale"), version=1) is None
+    
+    def test_snapshot_rebuilt_after_in_place_update(self, db, sample_merchants, tmp_path, monkeypatch):
+        """Test that updating a merchant row in place invalidates the snapshot."""
+        monkeypatch.setattr(settings, "MERCHANT_INDEX_SNAPSHOT_PATH", str(tmp_path / "merchants.snapshot"))
+        db.add(MerchantCategory(merchant_name="costco", categories=["grocery"], aliases=["costco wholesale"]))
+        record_catalog_change(db)
+        db.commit()
+        bump_catalog_version()
+        assert MerchantMatcher(db).match("Costco") == ["grocery"]
+        before = catalog_fingerprint(db)
+        
+        # Same row count and ids; only the contents change
+        costco = db.query(MerchantCategory).filter(MerchantCategory.merchant_name == "costco").one()
+        costco.categories = ["wholesale"]
+        record_catalog_change(db)
+        db.commit()
+        bump_catalog_version()
+        
+        assert catalog_fingerprint(db) != before
+        assert MerchantIndex.load_snapshot(settings.MERCHANT_INDEX_SNAPSHOT_PATH, catalog_fingerprint(db), 1) is None
+        assert MerchantMatcher(db).match("Costco") == ["wholesale"]
+        
+        costco.aliases = ["costco wholesale", "costco gas"]
+        record_catalog_change(db)
+        db.commit()
+        bump_catalog_version()
+        assert MerchantMatcher(db).match("costco gas") == ["wholesale"]
+    
+    def test_fingerprint_reads_no_merchant_rows(self, db, sample_merchants):
+        """Test that fingerprinting the catalog reads the stored version, not the table."""
+        from sqlalchemy import event
+        
+        record_catalog_change(db)
+        db.commit()
+        statements = []
+        listener = lambda conn, cursor, statement, *args: statements.append(statement)
+        event.listen(db.get_bind(), "before_cursor_execute", listener)
+        try:
+            assert catalog_fingerprint(db) == read_catalog_revision(db)
+        finally:
+            event.remove(db.get_bind(), "before_cursor_execute", listener)
+        assert statements and not any("merchant_categories" in statement for statement in statements)
+    
+    def test_shared_index_writes_and_reuses_snapshot(self, db, sample_merchants, tmp_path, monkeypatch):
+        """Test that the first build writes the snapshot and later builds load it."""
+        path = tmp_path / "merchants.snapshot"
+        monkeypatch.setattr(settings, "MERCHANT_INDEX_SNAPSHOT_PATH", str(path))
+        record_catalog_change(db)
+        db.commit()
+        
+        MerchantMatcher(db)
+        assert path.exists()
+        
+        monkeypatch.setattr(MerchantIndex, "from_db", classmethod(lambda cls, db, version: None))
+        bump_catalog_version()
+        matcher = MerchantMatcher(db)
+        assert matcher.match("Whole Foods") == ["grocery", "organic"]
+    
+    def test_startup_warms_the_merchant_index(self, db, sample_merchants, sample_template, monkeypatch):
+        """Test that the startup hook builds the shared index before the first request."""
+        from app import main
+        from app.services import merchant_index
+        
+        monkeypatch.setattr(main, "init_db", lambda: None)
+        monkeypatch.setattr("app.database.SessionLocal", lambda: db)
+        monkeypatch.setattr(db, "close", lambda: None)
+        bump_catalog_version()
+        assert merchant_index.current_merchant_index() is None
+        
+        main.startup_event()
+        
+        assert "whole foods" in merchant_index.current_merchant_index().merchant_map
+
+
+class TestMerchantImport:
+    """Test cases for bulk merchant import and incremental index updates."""
+    
+    def test_import_upserts_and_updates_index_incrementally(self, db, sample_merchants, monkeypatch):
+        """Test that an import upserts rows and layers the changes onto the shared index."""
+        # Keep the delta layer separate even though the catalog is tiny
+        monkeypatch.setattr(MerchantIndex, "COMPACTION_RATIO", 1.0)
+        matcher = MerchantMatcher(db)
+        base_layer = matcher.index.layers[0]
+        
+        lines = [
+            '{"merchant_name": "starbucks", "categories": ["dining", "coffee"], "aliases": ["sbux"]}',
+            '{"merchant_name": "shell", "categories": ["gas", "convenience"], "aliases": []}',
+            '{"merchant_name": "", "categories": ["x"]}',
+            'not json',
+        ]
+        result = MerchantImporter(db, batch_size=1).import_lines(lines, "ndjson")
+        
+        assert result.rows_read == 4
+        assert result.upserted == 2
+        assert result.failed == 2
+        assert result.errors[0] == "line 3: missing merchant_name"
+        assert db.query(MerchantCategory).count() == 4
+        
+        updated = MerchantMatcher(db)
+        assert updated.index.layers[0] is base_layer
+        assert updated.match("SBUX #123") == ["dining", "coffee"]
+        assert updated.match("starbuks") == ["dining", "coffee"]
+        
+        # The replaced merchant loses its old alias everywhere, base layer included
+        assert updated.match("shell") == ["gas", "convenience"]
+        assert updated.resolve("shell gas station").matched_key == "shell"
+    
+    def test_import_without_current_index_builds_once(self, db, sample_merchants, monkeypatch):
+        """Test that an import in a process with no index builds it from the table once, without layering."""
+        from app.services import merchant_index
+        
+        bump_catalog_version()
+        builds = []
+        from_db = MerchantIndex.from_db.__func__
+        monkeypatch.setattr(MerchantIndex, "from_db", classmethod(
+            lambda cls, db, version: builds.append(version) or from_db(cls, db, version)
+        ))
+        monkeypatch.setattr(MerchantIndex, "with_changes", lambda *args: pytest.fail("changes re-applied"))
+        
+        MerchantImporter(db).import_lines(['{"merchant_name": "costco", "categories": ["wholesale"]}'], "ndjson")
+        
+        assert len(builds) == 1
+        assert merchant_index.current_merchant_index().merchant_map["costco"] == ["wholesale"]
+    
+    def test_failed_import_still_publishes_committed_batches(self, db, sample_merchants, monkeypatch):
+        """Test that batches committed before a failing one reach the shared index."""
+        matcher = MerchantMatcher(db)
+        importer = MerchantImporter(db, batch_size=1)
+        upsert = importer._upsert
+        
+        def fail_second_batch(records):
+            if records[0].merchant_name == "costco":
+                raise RuntimeError("database went away")
+            return upsert(records)
+        
+        monkeypatch.setattr(importer, "_upsert", fail_second_batch)
+        lines = [
+            '{"merchant_name": "starbucks", "categories": ["dining"]}',
+            '{"merchant_name": "costco", "categories": ["wholesale"]}',
+        ]
+        with pytest.raises(RuntimeError):
+            importer.import_lines(lines, "ndjson")
+        
+        rebuilt = MerchantMatcher(db)
+        assert rebuilt.index is not matcher.index
+        assert rebuilt.match("starbucks") == ["dining"]
+    
+    def test_layered_index_matches_full_rebuild(self, db, sample_merchants, monkeypatch):
+        """Test that lookups on an incrementally updated index agree with a rebuilt one."""
+        monkeypatch.setattr(MerchantIndex, "COMPACTION_RATIO", 1.0)
+        records = [
+            MerchantRecord("whole foods", ["grocery"], aliases=["wholefds mkt"]),
+            MerchantRecord("foods co", ["grocery", "discount"]),
+            MerchantRecord("chipotle express", ["dining"]),
+        ]
+        layered = MerchantIndex.from_db(db, version=1).with_changes(records, version=2)
+        
+        for record in records:
+            db.query(MerchantCategory).filter_by(merchant_name=record.merchant_name).delete()
+            db.add(MerchantCategory(merchant_name=record.merchant_name, categories=record.categories, aliases=record.aliases))
+        db.commit()
+        rebuilt = MerchantIndex.from_db(db, version=3)
+        
+        assert len(layered.layers) == 2
+        assert layered.merchant_map == rebuilt.merchant_map
+        for text in ("whole foods market", "organic foods", "chipotle express downtown", "express", "chipolte", "wholefds"):
+            assert layered.longest_contained_key(text) == rebuilt.longest_contained_key(text)
+            assert layered.shortest_containing_key(text) == rebuilt.shortest_containing_key(text)
+            assert layered.best_token_match(text) == rebuilt.best_token_match(text)
+            assert layered.closest_key(text) == rebuilt.closest_key(text)
+    
+    def test_csv_import(self, db):
+        """Test CSV parsing with '|'-separated and JSON list cells."""
+        lines = [
+            "merchant_name,categories,aliases,accepted_networks\n",
+            "costco,grocery|wholesale,costco wholesale,\"[\"\"Visa\"\"]\"\n",
+            "target,retail|shopping,,\n",
+        ]
+        result = MerchantImporter(db).import_lines(lines, "csv")
+        
+        assert result.upserted == 2 and result.failed == 0
+        costco = db.query(MerchantCategory).filter_by(merchant_name="costco").one()
+        assert costco.categories == ["grocery", "wholesale"]
+        assert costco.accepted_networks == ["visa"]
+        assert MerchantMatcher(db).resolve("costco wholesale").accepted_networks == frozenset({"visa"})
+    
+    def test_import_normalizes_merchant_name_case(self, db):
+        """Test that names differing only in case upsert one merchant row."""
+        lines = [
+            '{"merchant_name": "Costco", "categories": ["grocery"], "aliases": ["Costco Wholesale"]}',
+            '{"merchant_name": "costco ", "categories": ["wholesale"]}',
+        ]
+        MerchantImporter(db, batch_size=1).import_lines(lines, "ndjson")
+        
+        assert db.query(MerchantCategory).count() == 1
+        costco = db.query(MerchantCategory).one()
+        assert costco.merchant_name == "costco"
+        assert costco.categories == ["wholesale"]
+        assert MerchantMatcher(db).match("COSTCO") == ["wholesale"]
+
+
+class TestMatcherBenchmark:
+    """Smoke test for the matcher benchmark suite."""
+    
+    def test_benchmark_report_shape(self):
+        """Test that a tiny benchmark run produces a complete, comparable report."""
+        from scripts.benchmarks.merchant_matcher_benchmark import (
+            QUERY_KINDS, compare_to_baseline, run_benchmark
+        )
+        
+        report = run_benchmark(sizes=[300], queries_per_kind=10, measure_memory=True)
+        entry = report["results"][0]
+        
+        assert entry["catalog_size"] == 300
+        assert entry["lookup_keys"] > 300  # Aliases add keys
+        assert entry["index_memory_bytes"] > 0
+        assert 0 < entry["automaton_memory_bytes"] < entry["index_memory_bytes"]
+        assert entry["index_bytes_per_key"] > 0
+        assert set(entry["tiers"]) == set(QUERY_KINDS)
+        assert entry["tiers"]["exact"]["tier_hit_rate"] == 1.0
+        assert entry["tiers"]["miss"]["tier_hit_rate"] == 1.0
+        assert entry["tiers"]["fuzzy"]["cold"]["p50_us"] > 0
+        assert len(compare_to_baseline(report, report)) == 1 + len(QUERY_KINDS)
+    
+    def test_benchmark_stdout_is_json(self):
+        """Test that the default stdout report parses as JSON, with banners kept off stdout."""
+        import json
+        import os
+        import subprocess
+        import sys
+        
+        script = os.path.join(os.path.dirname(__file__), "..", "scripts", "benchmarks", "merchant_matcher_benchmark.py")
+        completed = subprocess.run(
+            [sys.executable, script, "--sizes", "200", "--queries", "5", "--skip-memory"],
+            capture_output=True, text=True, check=True
+        )
+        assert json.loads(completed.stdout)["results"][0]["catalog_size"] == 200
@@ -0,0 +1,136 @@
+"""Tests for schema migrations and the missing-index check."""
+
+import pytest
+from sqlalchemy import create_engine, inspect
+from sqlalchemy.pool import StaticPool
+
+from app.database import Base
+from app.models import CategoryBonus, CreditCard, Customer, Offer
+from app.migrations import MIGRATIONS, apply_migrations, applied_versions, check_indexes, pending_migrations
+
+
+@pytest.fixture
+def legacy_engine():
+    """An in-memory database created before any index was declared."""
+    engine = create_engine(
+        "sqlite:///:memory:",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool
+    )
+    Base.metadata.create_all(bind=engine)
+    # Drop the declared indexes to simulate a database created by an older release
+    with engine.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                connection.exec_driver_sql(f"DROP INDEX IF EXISTS {index.name}")
+    yield engine
+    engine.dispose()
+
+
+class TestMigrations:
+    """Test cases for the migration runner."""
+    
+    def test_migrations_add_missing_indexes(self, legacy_engine):
+        """Test that an old database is reported and then fixed in place."""
+        missing = {problem["index"] for problem in check_indexes(legacy_engine)}
+        assert "ix_credit_cards_customer_id" in missing
+        assert "ix_customers_email" in missing
+        assert len(pending_migrations(legacy_engine)) == len(MIGRATIONS)
+        
+        applied = apply_migrations(legacy_engine)
+        
+        assert [m.version for m in applied] == [m.version for m in MIGRATIONS]
+        assert check_indexes(legacy_engine) == []
+        assert pending_migrations(legacy_engine) == []
+        indexes = {i["name"] for i in inspect(legacy_engine).get_indexes("offers")}
+        assert {"ix_offers_card_id", "ix_offers_merchant_name"} <= indexes
+    
+    def test_migrations_are_idempotent(self, legacy_engine):
+        """Test that re-running applies nothing and tolerates existing indexes."""
+        apply_migrations(legacy_engine)
+        assert apply_migrations(legacy_engine) == []
+        assert applied_versions(legacy_engine) == {m.version for m in MIGRATIONS}
+    
+    def test_models_and_migrations_declare_the_same_indexes(self):
+        """Test that every index a model declares is created by some migration."""
+        declared = {index.name for table in Base.metadata.sorted_tables for index in table.indexes}
+        migrated = {
+            operation.index_name
+            for migration in MIGRATIONS
+            for operation in migration.operations
+            if hasattr(operation, "index_name")
+        }
+        assert declared == migrated
+    
+    def test_catalog_versions_migration_stamps_the_merchant_catalog(self, legacy_engine):
+        """Test that migrated databases have a merchant catalog revision for workers to compare."""
+        with legacy_engine.begin() as connection:
+            connection.exec_driver_sql("DROP TABLE catalog_versions")
+        
+        apply_migrations(legacy_engine)
+        
+        with legacy_engine.connect() as connection:
+            rows = connection.exec_driver_sql("SELECT name, version FROM catalog_versions").all()
+        assert rows == [("merchant_categories", 1)]
+    
+    def test_versions_are_unique_and_ordered(self):
+        """Test that migration versions never collide."""
+        versions = [m.version for m in MIGRATIONS]
+        assert versions == sorted(set(versions))
+    
+    def test_card_templates_migration_links_cards_and_drops_copies(self, legacy_engine):
+        """Test that copied template rows are removed and customer additions kept."""
+        from sqlalchemy.orm import Session
+        
+        with Session(legacy_engine) as db:
+            db.add(Customer(id="c1", name="Legacy", email="legacy@example.com"))
+            for card_id, customer_id in [("tpl", None), ("copy", "c1")]:
+                db.add(CreditCard(id=card_id, customer_id=customer_id, card_name="Gold", issuer="Bank",
+                                  last_four="0000", base_reward_rate=1.0))
+                db.add(CategoryBonus(card_id=card_id, category="dining", reward_rate=4.0))
+                db.add(Offer(card_id=card_id, description="Promo", merchant_name="shell", bonus_rate=2.0))
+            db.add(CategoryBonus(card_id="copy", category="gas", reward_rate=3.0))
+            db.add(CreditCard(id="custom", customer_id="c1", card_name="Other", issuer="Bank",
+                              last_four="1111", base_reward_rate=2.0))
+            db.commit()
+        
+        apply_migrations(legacy_engine)
+        
+        with Session(legacy_engine) as db:
+            assert db.get(CreditCard, "copy").template_id == "tpl"
+            assert db.get(CreditCard, "custom").template_id is None
+            remaining = db.query(CategoryBonus.card_id, CategoryBonus.category).order_by(CategoryBonus.card_id).all()
+            assert remaining == [("copy", "gas"), ("tpl", "dining")]
+            assert [offer.card_id for offer in db.query(Offer).all()] == ["tpl"]
+    
+    def test_card_templates_migration_rolls_back_partial_linking(self, legacy_engine):
+        """Test that a failure after linking leaves every card and copied row untouched."""
+        from dataclasses import replace
+        from sqlalchemy.orm import Session
+        from app.migrations.versions import _link_cards_to_templates
+        
+        with Session(legacy_engine) as db:
+            db.add(Customer(id="c1", name="Legacy", email="legacy@example.com"))
+            for card_id, customer_id in [("tpl", None), ("copy", "c1")]:
+                db.add(CreditCard(id=card_id, customer_id=customer_id, card_name="Gold", issuer="Bank",
+                                  last_four="0000", base_reward_rate=1.0))
+                db.add(CategoryBonus(card_id=card_id, category="dining", reward_rate=4.0))
+            db.commit()
+        
+        def fail(connection, dialect):
+            raise RuntimeError("interrupted")
+        
+        interrupted = replace(MIGRATIONS[1], operations=[_link_cards_to_templates, fail])
+        
+        with pytest.raises(RuntimeError):
+            apply_migrations(legacy_engine, [MIGRATIONS[0], interrupted])
+        
+        assert applied_versions(legacy_engine) == {1}
+        with Session(legacy_engine) as db:
+            assert db.get(CreditCard, "copy").template_id is None
+            assert db.query(CategoryBonus).count() == 2
+        
+        apply_migrations(legacy_engine)
+        with Session(legacy_engine) as db:
+            assert db.get(CreditCard, "copy").template_id == "tpl"
+            assert db.query(CategoryBonus.card_id).all() == [("tpl",)]
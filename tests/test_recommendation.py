@@ -1,10 +1,16 @@
 """Tests for the recommendation engine."""
 
+import asyncio
+
 import pytest
 from datetime import date, timedelta
+from sqlalchemy import event
 
 from app.services.recommendation import RecommendationEngine
-from app.models import Offer, CategoryBonus
+from app.models import CategoryBonus, CreditCard, Offer
+from app.repositories import CardRepository
+from app.schemas import BatchRecommendationItem
+from app.services.wallet import CompiledCard, template_cache, wallet_cache
 
 
 class TestRecommendationEngine:
@@ -201,3 +207,498 @@ class TestRecommendationEngine:
 
 
 
+    
+    def test_compiled_reward_table_picks_best_active_bonus(self, db, sample_customer, sample_cards):
+        """Test that the compiled reward table respects dates and picks the highest rate."""
+        today = date.today()
+        db.add_all([
+            CategoryBonus(card_id="test_card_2", category="Travel", reward_rate=3.0),
+            CategoryBonus(
+                card_id="test_card_2", category="travel", reward_rate=6.0,
+                start_date=today - timedelta(days=10), end_date=today + timedelta(days=10)
+            ),
+            CategoryBonus(
+                card_id="test_card_2", category="travel", reward_rate=9.0,
+                start_date=today + timedelta(days=1)
+            ),
+            CategoryBonus(
+                card_id="test_card_2", category="travel", reward_rate=8.0,
+                end_date=today - timedelta(days=1)
+            ),
+        ])
+        db.commit()
+        db.refresh(sample_cards[1])
+        
+        card = CompiledCard(sample_cards[1])
+        assert card.find_category_bonus("TRAVEL", today).reward_rate == 6.0
+        assert card.find_category_bonus("travel", today + timedelta(days=11)).reward_rate == 9.0
+        assert card.find_category_bonus("travel", today - timedelta(days=30)).reward_rate == 8.0
+        assert card.find_category_bonus("dining", today) is None
+    
+    def test_best_offer_selected_via_alias(self, db, sample_customer, sample_cards, sample_merchants, sample_offer):
+        """Test that the highest active offer wins and merchant aliases resolve to it."""
+        db.add_all([
+            Offer(
+                card_id="test_card_1",
+                description="15% back at Whole Foods Market",
+                merchant_name="Whole Foods Market",
+                bonus_rate=14.0,
+                expiry_date=date.today() + timedelta(days=5)
+            ),
+            Offer(
+                card_id="test_card_1",
+                description="Expired 30% offer",
+                merchant_name="whole foods",
+                bonus_rate=29.0,
+                expiry_date=date.today() - timedelta(days=1)
+            ),
+        ])
+        db.commit()
+        
+        engine = RecommendationEngine(db)
+        
+        recommendations = engine.recommend(
+            customer_id=sample_customer.id,
+            merchant_name="whole foods",
+            purchase_amount=100.0,
+            top_n=1
+        )
+        
+        top_card = recommendations[0]
+        assert top_card.card_id == "test_card_1"
+        assert top_card.reward_rate == 15.0
+        assert "Whole Foods Market" in top_card.reason
+    
+    def test_offer_on_non_catalog_merchant_name(self, db, sample_customer, sample_cards, sample_merchants):
+        """Test that offers whose merchant name is not exactly a catalog key still apply."""
+        db.add_all([
+            Offer(card_id="test_card_3", description="Shell downtown promo",
+                  merchant_name="Shell Gas Station Downtown", bonus_rate=9.0),
+            Offer(card_id="test_card_2", description="Deli promo",
+                  merchant_name="Joe's Corner Deli", bonus_rate=3.0),
+        ])
+        db.commit()
+        
+        engine = RecommendationEngine(db)
+        
+        # The offer name resolves to the same merchant as the queries
+        for merchant_name in ("Shell", "shell gas station downtown", "SHELL OIL 57442 HOUSTON TX"):
+            top_card = engine.recommend(sample_customer.id, merchant_name, 100.0)[0]
+            assert top_card.card_id == "test_card_3"
+            assert top_card.reward_rate == 10.0
+        
+        # Names the catalog cannot resolve fall back to a substring match
+        top_card = engine.recommend(sample_customer.id, "Joe's Corner", 100.0)[0]
+        assert top_card.card_id == "test_card_2"
+        assert top_card.reward_rate == 5.0
+        
+        # The vectorized batch path agrees
+        results = engine.recommend_batch(sample_customer.id, [
+            BatchRecommendationItem(merchant_name="shell gas station downtown", purchase_amount=100.0),
+            BatchRecommendationItem(merchant_name="Joe's Corner", purchase_amount=100.0),
+        ])
+        assert [r.recommendations[0].reward_rate for r in results] == [10.0, 5.0]
+    
+    def test_recommend_batch(self, db, sample_customer, sample_cards, sample_merchants):
+        """Test that a batch is scored per item against one wallet load."""
+        engine = RecommendationEngine(db)
+        
+        results = engine.recommend_batch(
+            customer_id=sample_customer.id,
+            items=[
+                BatchRecommendationItem(merchant_name="Whole Foods", purchase_amount=100.0),
+                BatchRecommendationItem(merchant_name="Chipotle", purchase_amount=50.0),
+                BatchRecommendationItem(merchant_name="whole foods"),
+            ],
+            top_n=2
+        )
+        
+        assert len(results) == 3
+        assert results[0].recommendations[0].card_id == "test_card_1"
+        assert results[0].recommendations[0].estimated_reward == 5.0
+        assert "grocery" in results[0].resolution.categories
+        assert results[1].recommendations[0].card_id == "test_card_3"
+        assert results[1].recommendations[0].estimated_reward == 2.0
+        assert results[2].recommendations[0].estimated_reward is None
+        assert all(len(r.recommendations) == 2 for r in results)
+    
+    def test_recommend_batch_nonexistent_customer(self, db, sample_merchants):
+        """Test that batch returns None when the customer has no wallet."""
+        engine = RecommendationEngine(db)
+        
+        results = engine.recommend_batch(
+            customer_id="nonexistent",
+            items=[BatchRecommendationItem(merchant_name="Whole Foods")]
+        )
+        
+        assert results is None
+    
+    def test_wallet_loads_in_fixed_queries(self, db, sample_customer, sample_cards, sample_offer):
+        """Test that the wallet fetch does not issue per-card lazy loads."""
+        statements = []
+        
+        def count_statement(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+        
+        customer_id = sample_customer.id
+        db.expire_all()
+        bind = db.get_bind()
+        event.listen(bind, "before_cursor_execute", count_statement)
+        try:
+            cards = CardRepository(db).get_wallet(customer_id)
+            wallet = [(card.id, len(card.category_bonuses), len(card.offers)) for card in cards]
+        finally:
+            event.remove(bind, "before_cursor_execute", count_statement)
+        
+        assert len(cards) == 3
+        assert ("test_card_1", 1, 1) in wallet
+        assert len(statements) == 3
+    
+    def test_template_cards_share_compiled_tables(self, db, sample_customer, sample_template, sample_merchants):
+        """Test that linked cards share one compiled template and load it once."""
+        db.add_all([
+            CreditCard(id=f"linked_{n}", customer_id=sample_customer.id, template_id="template_dining",
+                       card_name="Dining Rewards", issuer="Test Bank", last_four=f"000{n}", base_reward_rate=1.0)
+            for n in range(3)
+        ])
+        db.add(CategoryBonus(card_id="linked_2", category="grocery", reward_rate=4.0))
+        db.commit()
+        
+        engine = RecommendationEngine(db)
+        wallet = {card.id: card for card in engine._load_wallet(sample_customer.id)}
+        
+        # No overrides: the template's tables are shared, not copied
+        assert wallet["linked_0"].reward_table is wallet["linked_1"].reward_table
+        assert wallet["linked_0"].offer_index is wallet["linked_1"].offer_index
+        # Overrides are merged into a copy that leaves the template untouched
+        assert set(wallet["linked_2"].reward_table) == {"dining", "grocery"}
+        assert "grocery" not in wallet["linked_0"].reward_table
+        assert template_cache.stats()["size"] == 1
+        
+        recommendations = engine.recommend(sample_customer.id, "Whole Foods", 100.0)
+        assert recommendations[0].card_id == "linked_2"
+        assert recommendations[0].reward_rate == 4.0
+    
+    def test_top_n_selection_matches_full_ranking(self, db, sample_customer, sample_cards, sample_merchants):
+        """Test that partial top-N selection ranks and explains like a full sort."""
+        from app.models import CreditCard
+        
+        for i, rate in enumerate([1.5, 3.0, 0.5, 3.0]):
+            db.add(CreditCard(
+                id=f"extra_card_{i}",
+                customer_id=sample_customer.id,
+                card_name=f"Extra Card {i}",
+                issuer="Bank",
+                last_four=f"000{i}",
+                base_reward_rate=rate
+            ))
+        db.commit()
+        
+        engine = RecommendationEngine(db)
+        
+        recommendations = engine.recommend(
+            customer_id=sample_customer.id,
+            merchant_name="Shell",
+            purchase_amount=100.0,
+            top_n=3
+        )
+        
+        # Ties keep wallet order, as a stable sort would
+        assert [r.card_id for r in recommendations] == ["extra_card_1", "extra_card_3", "test_card_2"]
+        assert recommendations[0].reason == "3.0% on all purchases"
+        assert recommendations[0].comparison == "Tied with Extra Card 3 at 3.0%."
+        assert recommendations[2].comparison == "Earns 1.0% less than Extra Card 1 ($1.00 less back)."
+    
+    def test_wallet_kernel_matches_per_card_scoring(self, db, sample_merchants):
+        """Test that vectorized scoring agrees with calculate_card_score on random wallets."""
+        import random
+        from app.models import CreditCard
+        from app.services.scoring_kernel import WalletKernel
+        
+        rng = random.Random(7)
+        today = date.today()
+        categories = ["grocery", "dining", "gas", "travel"]
+        engine = RecommendationEngine(db)
+        
+        cards = []
+        for i in range(12):
+            card = CreditCard(
+                id=f"k{i}", card_name=f"K{i}", issuer="Bank", last_four="0000",
+                base_reward_rate=rng.choice([1.0, 1.5, 2.0]),
+                points_value=rng.choice([None, 1.25, 1.5]),
+                reward_type="cashback"
+            )
+            for category in rng.sample(categories, 2):
+                card.category_bonuses.append(CategoryBonus(
+                    category=category,
+                    reward_rate=rng.choice([0.5, 3.0, 4.0, 5.0]),
+                    end_date=rng.choice([None, today - timedelta(days=1)])
+                ))
+            if rng.random() < 0.3:
+                card.offers.append(Offer(
+                    description="promo", merchant_name="Shell", bonus_rate=rng.choice([2.0, 6.0])
+                ))
+            cards.append(card)
+        
+        wallet = [CompiledCard(card, engine.merchant_matcher.index) for card in cards]
+        kernel = WalletKernel(wallet, today)
+        
+        for merchant_categories in (["grocery"], ["dining", "travel"], ["general"], ["gas"]):
+            for merchant_key in ("shell", "chipotle"):
+                rates = kernel.effective_rates(merchant_categories, merchant_key)
+                expected = [
+                    engine.calculate_card_score(card, merchant_key, merchant_categories, 100.0, today).reward_rate
+                    for card in wallet
+                ]
+                assert rates.tolist() == expected
+                assert kernel.best_card(merchant_categories, merchant_key) is wallet[expected.index(max(expected))]
+    
+    def test_network_restriction_applies_to_aliases(self, db, sample_customer, sample_cards):
+        """Test that accepted networks come from the merchant index, aliases included."""
+        from app.models import MerchantCategory
+        
+        db.add(MerchantCategory(
+            merchant_name="costco",
+            categories=["wholesale"],
+            aliases=["costco wholesale"],
+            accepted_networks=["Visa"]
+        ))
+        sample_cards[1].network = "mastercard"
+        sample_cards[2].network = "visa"
+        db.commit()
+        
+        engine = RecommendationEngine(db)
+        
+        for merchant_name in ("Costco", "costco wholesale"):
+            recommendations, resolution = engine.recommend_with_resolution(
+                customer_id=sample_customer.id,
+                merchant_name=merchant_name,
+                purchase_amount=100.0,
+                top_n=3
+            )
+            
+            assert resolution.accepted_networks == frozenset({"visa"})
+            # Mastercard Double Cash is filtered out; card 1 has no network and is kept
+            assert [r.card_id for r in recommendations] == ["test_card_1", "test_card_3"]
+    
+    def test_network_restriction_skips_loose_matches(self, db, sample_customer, sample_cards):
+        """Test that word and typo matches do not restrict networks to the matched merchant's."""
+        from app.models import MerchantCategory
+        
+        db.add(MerchantCategory(
+            merchant_name="costco",
+            categories=["wholesale"],
+            aliases=["costco wholesale"],
+            accepted_networks=["Visa"]
+        ))
+        for card in sample_cards:
+            card.network = "amex"
+        db.commit()
+        
+        engine = RecommendationEngine(db)
+        
+        for merchant_name, tier in (("BJ's Wholesale Club", "word"), ("cotsco", "fuzzy")):
+            recommendations, resolution = engine.recommend_with_resolution(
+                customer_id=sample_customer.id,
+                merchant_name=merchant_name,
+                purchase_amount=100.0,
+                top_n=3
+            )
+            
+            assert (resolution.match_tier, resolution.canonical_name) == (tier, "costco")
+            assert resolution.accepted_networks is None
+            assert len(recommendations) == 3
+    
+    def test_mcc_skips_name_matching(self, db, sample_customer, sample_cards, sample_merchants, monkeypatch):
+        """Test that a known MCC categorizes the purchase without the name matcher."""
+        engine = RecommendationEngine(db)
+        monkeypatch.setattr(engine.merchant_matcher, "resolve", lambda name: pytest.fail("name matched"))
+        
+        recommendations, resolution = engine.recommend_with_resolution(
+            customer_id=sample_customer.id,
+            merchant_name="SQ *UNKNOWN CORNER STORE",
+            purchase_amount=100.0,
+            mcc="5411"
+        )
+        
+        assert resolution.match_tier == "mcc"
+        assert resolution.categories == ["grocery"]
+        assert recommendations[0].card_id == "test_card_1"
+        
+        # Brand-specific airline codes fall in a range
+        assert engine.merchant_matcher.resolve_mcc("Delta", "3058").categories[0] == "travel"
+    
+    def test_unknown_mcc_falls_back_to_name(self, db, sample_customer, sample_cards, sample_merchants):
+        """Test that an MCC missing from the table still matches by name."""
+        engine = RecommendationEngine(db)
+        
+        _, resolution = engine.recommend_with_resolution(
+            customer_id=sample_customer.id,
+            merchant_name="Chipotle",
+            mcc="0001"
+        )
+        
+        assert resolution.match_tier == "exact"
+        assert "dining" in resolution.categories
+    
+    def test_async_recommendations_run_concurrently(
+        self, async_session_factory, sample_customer, sample_cards, sample_merchants
+    ):
+        """Test concurrent async recommendations, each on its own async session."""
+        async def recommend(merchant_name):
+            async with async_session_factory() as session:
+                engine = await RecommendationEngine.from_async_session(session)
+                recommendations, resolution = await engine.recommend_with_resolution_async(
+                    customer_id=sample_customer.id,
+                    merchant_name=merchant_name,
+                    purchase_amount=100.0
+                )
+                return recommendations[0].card_id, resolution.match_tier
+        
+        async def run_all():
+            return await asyncio.gather(*(
+                recommend(name) for name in ["Whole Foods", "Shell", "Chipotle"] * 5
+            ))
+        
+        wallet_cache.clear()
+        results = asyncio.run(run_all())
+        
+        assert results[:3] == [("test_card_1", "exact"), ("test_card_2", "exact"), ("test_card_3", "exact")]
+        assert results == results[:3] * 5
+        assert wallet_cache.get(sample_customer.id) is not None
+    
+    def test_async_recommendation_matches_off_the_event_loop(
+        self, async_session_factory, sample_customer, sample_cards, sample_merchants, monkeypatch
+    ):
+        """Test that match tiers run in the threadpool, while exact and memoized names stay inline."""
+        import threading
+        from app.services.merchant_matcher import MerchantMatcher
+        
+        tier_threads = []
+        resolve_normalized = MerchantMatcher._resolve_normalized
+        
+        def record_thread(matcher, merchant_name, normalized):
+            tier_threads.append(threading.get_ident())
+            return resolve_normalized(matcher, merchant_name, normalized)
+        
+        monkeypatch.setattr(MerchantMatcher, "_resolve_normalized", record_thread)
+        
+        async def recommend(merchant_name):
+            async with async_session_factory() as session:
+                engine = await RecommendationEngine.from_async_session(session)
+                _, resolution = await engine.recommend_with_resolution_async(sample_customer.id, merchant_name)
+                return resolution.match_tier
+        
+        async def run_all():
+            loop_thread = threading.get_ident()
+            tiers = [await recommend(name) for name in ("Whole Foods", "SQ *CHIPOTLE #12", "SQ *CHIPOTLE #12")]
+            return loop_thread, tiers
+        
+        loop_thread, tiers = asyncio.run(run_all())
+        assert tiers == ["exact", "exact", "exact"]
+        # Only the first descriptor ran the tiers, and not on the loop's thread
+        assert len(tier_threads) == 1
+        assert tier_threads[0] != loop_thread
+    
+    def test_async_cold_start_builds_and_compiles_off_the_event_loop(
+        self, async_session_factory, sample_customer, sample_cards, sample_merchants, sample_offer, monkeypatch
+    ):
+        """Test that the index build and wallet compile of a cold async request both run in the threadpool."""
+        import threading
+        from app.services.merchant_index import MerchantIndex, bump_catalog_version
+        from app.services.wallet import invalidate_wallets
+        
+        threads = {"index": [], "compile": []}
+        index_init, compile_offers = MerchantIndex.__init__, CompiledCard._compile_offers
+        
+        def build_index(index, *args):
+            threads["index"].append(threading.get_ident())
+            index_init(index, *args)
+        
+        def compile_card_offers(card, *args):
+            threads["compile"].append(threading.get_ident())
+            return compile_offers(card, *args)
+        
+        monkeypatch.setattr(MerchantIndex, "__init__", build_index)
+        monkeypatch.setattr(CompiledCard, "_compile_offers", compile_card_offers)
+        bump_catalog_version()
+        invalidate_wallets()
+        
+        async def recommend():
+            async with async_session_factory() as session:
+                engine = await RecommendationEngine.from_async_session(session)
+                recommendations, _ = await engine.recommend_with_resolution_async(sample_customer.id, "Whole Foods")
+                return threading.get_ident(), recommendations
+        
+        loop_thread, recommendations = asyncio.run(recommend())
+        assert recommendations[0].card_id == "test_card_1"  # The Whole Foods offer was compiled
+        assert len(threads["index"]) == 1 and threads["compile"]
+        assert loop_thread not in threads["index"] + threads["compile"]
+    
+    def test_async_recommendation_unknown_customer(self, async_session_factory, sample_merchants):
+        """Test that the async path returns nothing for an unknown customer."""
+        async def recommend():
+            async with async_session_factory() as session:
+                engine = await RecommendationEngine.from_async_session(session)
+                return await engine.recommend_with_resolution_async("nonexistent", "Shell")
+        
+        assert asyncio.run(recommend()) == ([], None)
+    
+    def test_replica_wallets_cached_no_longer_than_lag(
+        self, db, sample_customer, sample_cards, sample_merchants, monkeypatch
+    ):
+        """Test that wallets loaded through a replica session expire after the replica TTL."""
+        import time
+        from app.config.settings import settings
+        from app.database import READ_FROM_REPLICA
+        
+        monkeypatch.setattr(settings, "REPLICA_CACHE_TTL_SECONDS", 0.05)
+        db.info[READ_FROM_REPLICA] = True
+        RecommendationEngine(db).recommend(sample_customer.id, "Shell")
+        assert wallet_cache.get(sample_customer.id) is not None
+        
+        time.sleep(0.1)
+        assert wallet_cache.get(sample_customer.id) is None
+        
+        # Primary sessions keep the regular wallet TTL
+        del db.info[READ_FROM_REPLICA]
+        RecommendationEngine(db).recommend(sample_customer.id, "Shell")
+        time.sleep(0.1)
+        assert wallet_cache.get(sample_customer.id) is not None
+    
+    def test_wallet_invalidated_during_load_is_not_cached(
+        self, db, sample_customer, sample_cards, sample_merchants, monkeypatch
+    ):
+        """Test that a load racing with invalidate_wallet does not cache its stale wallet."""
+        from app.services.wallet import invalidate_wallet
+        
+        engine = RecommendationEngine(db)
+        load = engine.card_repository.get_wallet
+        
+        def load_then_write(customer_id):
+            cards = load(customer_id)
+            # A write commits and invalidates after this request read the cards
+            invalidate_wallet(customer_id)
+            return cards
+        
+        monkeypatch.setattr(engine.card_repository, "get_wallet", load_then_write)
+        assert engine.recommend(sample_customer.id, "Shell")
+        assert wallet_cache.get(sample_customer.id) is None
+        
+        monkeypatch.undo()
+        engine.recommend(sample_customer.id, "Shell")
+        assert wallet_cache.get(sample_customer.id) is not None
+    
+    def test_invalidation_tracking_is_bounded_by_the_wallet_cache(self, monkeypatch):
+        """Test that forgotten invalidations still reject loads that started before them."""
+        from app.services import wallet
+        
+        monkeypatch.setattr(wallet_cache, "maxsize", 2)
+        stale = wallet.wallet_generation("cust_0")
+        for number in range(5):
+            wallet.invalidate_wallet(f"cust_{number}")
+        
+        assert len(wallet._wallet_invalidations) == 2
+        assert not wallet.store_wallet("cust_0", stale, (0, []))
+        assert wallet.store_wallet("cust_0", wallet.wallet_generation("cust_0"), (0, []))
+        wallet.invalidate_wallets()